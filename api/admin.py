@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
-from .models import CustomUser, Metodo, ModeloLaudo, Frase, Variavel
+from .models import CustomUser, Metodo, ModeloLaudo, Frase, Variavel, Tarefa
 import json
 
 # Register your models here.
@@ -138,3 +138,11 @@ class VariavelAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'status', 'provedor', 'usuario', 'progresso', 'total', 'criado_em', 'concluido_em']
+    list_filter = ['status', 'tipo', 'provedor', 'criado_em']
+    search_fields = ['tipo', 'usuario__email']
+    ordering = ['-criado_em']
+    readonly_fields = ['criado_em', 'iniciado_em', 'concluido_em', 'atualizado_em']
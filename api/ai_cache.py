@@ -0,0 +1,302 @@
+"""
+Cache das respostas dos provedores de IA
+
+As chaves são o SHA-256 do prompt normalizado junto com o provedor, o modelo e
+os parâmetros de geração, então são as mesmas em todos os processos (ao
+contrário de hash(), que muda a cada processo) e respostas de modelos ou
+limites de tokens diferentes nunca se misturam.
+
+Backends disponíveis (settings.AI_CACHE['BACKEND']):
+- 'memoria': LRU em memória do processo, limitado por MAX_ENTRADAS
+- 'arquivo': um arquivo por resposta em DIRETORIO, compartilhado entre os
+  processos da máquina, limitado por MAX_ENTRADAS
+- 'django': usa um cache do Django (settings.CACHES[ALIAS]), por exemplo
+  django.core.cache.backends.redis.RedisCache
+
+Nas views assíncronas use aobter/aguardar: o backend 'arquivo' faz a E/S em
+uma thread e o 'django' usa a API assíncrona do cache (aget/aset), então o
+event loop não fica bloqueado.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+
+def normalizar_prompt(prompt):
+    """Normaliza Unicode e espaços para que prompts equivalentes gerem a mesma chave"""
+    prompt = unicodedata.normalize('NFC', prompt or '')
+    return '\n'.join(' '.join(linha.split()) for linha in prompt.strip().splitlines())
+
+
+def gerar_chave(prompt, provedor, modelo, parametros=None):
+    """Chave determinística (SHA-256) da resposta"""
+    conteudo = json.dumps({
+        'prompt': normalizar_prompt(prompt),
+        'provedor': provedor,
+        'modelo': modelo,
+        'parametros': parametros or {},
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+class MemoriaLRU:
+    """Cache LRU em memória com expiração por entrada"""
+
+    def __init__(self, max_entradas=1000):
+        self.max_entradas = max_entradas
+        self._dados = OrderedDict()
+        self._trava = threading.Lock()
+
+    def get(self, chave):
+        with self._trava:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em < time.time():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, ttl):
+        with self._trava:
+            self._dados[chave] = (valor, time.time() + ttl)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_entradas:
+                self._dados.popitem(last=False)
+
+    # Só memória, sem E/S: pode rodar direto no event loop
+    async def aget(self, chave):
+        return self.get(chave)
+
+    async def aset(self, chave, valor, ttl):
+        self.set(chave, valor, ttl)
+
+    def __len__(self):
+        return len(self._dados)
+
+
+class ArquivoBackend:
+    """
+    Cache em arquivos, compartilhado entre processos. A data de modificação
+    do arquivo marca o último uso, usada para descartar as entradas mais antigas.
+    """
+
+    def __init__(self, diretorio, max_entradas=1000):
+        self.diretorio = diretorio
+        self.max_entradas = max_entradas
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f'{chave}.json')
+
+    def get(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                item = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+        if item['expira_em'] < time.time():
+            self._remover(caminho)
+            return None
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return item['valor']
+
+    def set(self, chave, valor, ttl):
+        # Escrita atômica: grava em arquivo temporário e renomeia
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+            json.dump({'valor': valor, 'expira_em': time.time() + ttl}, arquivo, ensure_ascii=False)
+        os.replace(temporario, self._caminho(chave))
+        self._descartar_excedentes()
+
+    async def aget(self, chave):
+        return await sync_to_async(self.get, thread_sensitive=False)(chave)
+
+    async def aset(self, chave, valor, ttl):
+        await sync_to_async(self.set, thread_sensitive=False)(chave, valor, ttl)
+
+    def _descartar_excedentes(self):
+        try:
+            entradas = [e for e in os.scandir(self.diretorio) if e.name.endswith('.json')]
+        except OSError:
+            return
+        excedentes = len(entradas) - self.max_entradas
+        if excedentes > 0:
+            entradas.sort(key=lambda e: e.stat().st_mtime)
+            for entrada in entradas[:excedentes]:
+                self._remover(entrada.path)
+
+    def _remover(self, caminho):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+    def __len__(self):
+        try:
+            return sum(1 for e in os.scandir(self.diretorio) if e.name.endswith('.json'))
+        except OSError:
+            return 0
+
+
+class DjangoCacheBackend:
+    """Usa um cache configurado em settings.CACHES (Redis, Memcached, banco...)"""
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def get(self, chave):
+        return caches[self.alias].get(f'ai_resposta_{chave}')
+
+    def set(self, chave, valor, ttl):
+        caches[self.alias].set(f'ai_resposta_{chave}', valor, ttl)
+
+    async def aget(self, chave):
+        return await caches[self.alias].aget(f'ai_resposta_{chave}')
+
+    async def aset(self, chave, valor, ttl):
+        await caches[self.alias].aset(f'ai_resposta_{chave}', valor, ttl)
+
+
+class CacheRespostasIA:
+    """Cache de respostas com TTL por provedor e contadores de acertos/erros"""
+
+    def __init__(self, backend, ttl_padrao=3600, ttl_por_provedor=None):
+        self.backend = backend
+        self.ttl_padrao = ttl_padrao
+        self.ttl_por_provedor = ttl_por_provedor or {}
+        self._acertos = Counter()
+        self._falhas = Counter()
+        self._chamadas = Counter()
+        self._tempo_chamadas = Counter()
+        self._trava = threading.Lock()
+
+    def obter(self, prompt, provedor, modelo, parametros=None):
+        valor = self.backend.get(gerar_chave(prompt, provedor, modelo, parametros))
+        return self._contar(provedor, valor)
+
+    async def aobter(self, prompt, provedor, modelo, parametros=None):
+        """Versão assíncrona de obter"""
+        valor = await self.backend.aget(gerar_chave(prompt, provedor, modelo, parametros))
+        return self._contar(provedor, valor)
+
+    def guardar(self, prompt, provedor, modelo, valor, parametros=None):
+        ttl = self.ttl_por_provedor.get(provedor, self.ttl_padrao)
+        self.backend.set(gerar_chave(prompt, provedor, modelo, parametros), valor, ttl)
+
+    async def aguardar(self, prompt, provedor, modelo, valor, parametros=None):
+        """Versão assíncrona de guardar"""
+        ttl = self.ttl_por_provedor.get(provedor, self.ttl_padrao)
+        await self.backend.aset(gerar_chave(prompt, provedor, modelo, parametros), valor, ttl)
+
+    def _contar(self, provedor, valor):
+        with self._trava:
+            if valor is None:
+                self._falhas[provedor] += 1
+            else:
+                self._acertos[provedor] += 1
+        return valor
+
+    def registrar_chamada(self, provedor, duracao):
+        """
+        Registra a duração (segundos) de uma chamada feita ao provedor após uma
+        falha no cache, para estimar quanto tempo os acertos economizaram.
+        """
+        with self._trava:
+            self._chamadas[provedor] += 1
+            self._tempo_chamadas[provedor] += duracao
+
+    def estatisticas(self):
+        """Acertos, falhas e taxa de acerto por provedor (contadores deste processo)"""
+        with self._trava:
+            provedores = set(self._acertos) | set(self._falhas)
+            por_provedor = {}
+            for provedor in sorted(provedores):
+                acertos, falhas = self._acertos[provedor], self._falhas[provedor]
+                por_provedor[provedor] = {
+                    'acertos': acertos,
+                    'falhas': falhas,
+                    'taxa_acerto': round(acertos / (acertos + falhas), 4) if acertos + falhas else 0.0,
+                }
+                # Cada acerto é uma chamada ao provedor evitada; rótulos como
+                # 'groq:inicio' usam as chamadas registradas para 'groq'
+                base = provedor.split(':')[0]
+                if self._chamadas[base]:
+                    latencia_media = self._tempo_chamadas[base] / self._chamadas[base]
+                    por_provedor[provedor]['latencia_media_chamada'] = round(latencia_media, 3)
+                    por_provedor[provedor]['segundos_economizados'] = round(acertos * latencia_media, 1)
+        estatisticas = {
+            'backend': type(self.backend).__name__,
+            'provedores': por_provedor,
+        }
+        if hasattr(self.backend, '__len__'):
+            estatisticas['entradas'] = len(self.backend)
+        return estatisticas
+
+
+def criar_backend(configuracao):
+    tipo = configuracao.get('BACKEND', 'memoria')
+    max_entradas = configuracao.get('MAX_ENTRADAS', 1000)
+    if tipo == 'memoria':
+        return MemoriaLRU(max_entradas)
+    if tipo == 'arquivo':
+        return ArquivoBackend(configuracao['DIRETORIO'], max_entradas)
+    if tipo == 'django':
+        return DjangoCacheBackend(configuracao.get('ALIAS', 'default'))
+    raise ValueError(f"Backend de cache de IA '{tipo}' não suportado")
+
+
+_cache_respostas = None
+_cache_correcoes = None
+_trava_criacao = threading.Lock()
+
+
+def obter_cache_respostas():
+    """Retorna o cache de respostas do processo, criado a partir de settings.AI_CACHE"""
+    global _cache_respostas
+    if _cache_respostas is None:
+        with _trava_criacao:
+            if _cache_respostas is None:
+                configuracao = getattr(settings, 'AI_CACHE', {})
+                _cache_respostas = CacheRespostasIA(
+                    criar_backend(configuracao),
+                    ttl_padrao=configuracao.get('TTL_PADRAO', 3600),
+                    ttl_por_provedor=configuracao.get('TTL_POR_PROVEDOR', {}),
+                )
+    return _cache_respostas
+
+
+def obter_cache_correcoes():
+    """
+    Retorna o cache das correções de texto do processo. Usa settings.AI_CACHE
+    com os valores de AI_CACHE['CORRECOES'] por cima (limite e TTL próprios;
+    no backend 'arquivo' fica em um subdiretório).
+    """
+    global _cache_correcoes
+    if _cache_correcoes is None:
+        with _trava_criacao:
+            if _cache_correcoes is None:
+                geral = getattr(settings, 'AI_CACHE', {})
+                configuracao = {**geral, **geral.get('CORRECOES', {})}
+                if 'DIRETORIO' in geral and 'DIRETORIO' not in geral.get('CORRECOES', {}):
+                    configuracao['DIRETORIO'] = os.path.join(geral['DIRETORIO'], 'correcoes')
+                _cache_correcoes = CacheRespostasIA(
+                    criar_backend(configuracao),
+                    ttl_padrao=configuracao.get('TTL_PADRAO', 3600)
+                )
+    return _cache_correcoes
@@ -0,0 +1,149 @@
+"""
+Versões assíncronas dos endpoints de IA, para o servidor ASGI
+(uvicorn laudos_backend.asgi:application)
+
+As views do DRF são síncronas: cada chamada ao provedor ocupa uma thread do
+servidor durante todo o tempo de geração. Estas são views assíncronas do
+Django; enquanto esperam o provedor não ocupam thread nenhuma, então um único
+processo mantém centenas de chamadas em andamento.
+
+Mesmo formato de requisição e resposta, autenticação JWT e limites de uso
+(throttles) de IAViewSet.
+"""
+import json
+import math
+from functools import wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import CustomUser
+from .services import GroqService, agenerate_radiology_report
+from .views import IAViewSet
+
+_autenticacao_jwt = JWTAuthentication()
+
+
+async def _autenticar(request):
+    """Valida o token JWT do cabeçalho Authorization e carrega o usuário (ORM assíncrono)"""
+    cabecalho = _autenticacao_jwt.get_header(request)
+    if cabecalho is None:
+        return None
+    token_bruto = _autenticacao_jwt.get_raw_token(cabecalho)
+    if token_bruto is None:
+        return None
+    try:
+        token = _autenticacao_jwt.get_validated_token(token_bruto)
+    except (InvalidToken, TokenError):
+        return None
+
+    usuario_id = token.get(jwt_settings.USER_ID_CLAIM)
+    return await CustomUser.objects.filter(pk=usuario_id, is_active=True).afirst()
+
+
+async def _verificar_limites(request, action):
+    """
+    Aplica os mesmos throttles de IAViewSet. Retorna None se a requisição
+    pode seguir ou os segundos de espera sugeridos.
+    """
+    view = SimpleNamespace(action=action, provedores_throttle=IAViewSet.provedores_throttle)
+
+    def verificar():
+        for classe in IAViewSet.throttle_classes:
+            throttle = classe()
+            if not throttle.allow_request(request, view):
+                return throttle.wait() or 1
+        return None
+
+    # Os baldes ficam no cache do Django, cuja API é síncrona
+    return await sync_to_async(verificar, thread_sensitive=False)()
+
+
+def endpoint_ia(action):
+    """
+    Decorator das views: aceita apenas POST com JSON, exige usuário
+    autenticado por JWT e aplica os limites de uso da action informada.
+    A view recebe (request, dados).
+    """
+    def decorador(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request):
+            if request.method != 'POST':
+                return JsonResponse({'detail': f'Método "{request.method}" não permitido.'}, status=405)
+
+            usuario = await _autenticar(request)
+            if usuario is None:
+                return JsonResponse(
+                    {'detail': 'As credenciais de autenticação não foram fornecidas ou são inválidas.'},
+                    status=401
+                )
+            request.user = usuario
+
+            espera = await _verificar_limites(request, action)
+            if espera is not None:
+                response = JsonResponse(
+                    {'detail': f'Limite de requisições atingido. Tente novamente em {math.ceil(espera)} segundos.'},
+                    status=429
+                )
+                response['Retry-After'] = str(math.ceil(espera))
+                return response
+
+            try:
+                dados = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'error': 'JSON inválido'}, status=400)
+            if not isinstance(dados, dict):
+                return JsonResponse({'error': 'JSON inválido'}, status=400)
+
+            return await view(request, dados)
+        return wrapper
+    return decorador
+
+
+@endpoint_ia('gerar_laudo_radiologia')
+async def gerar_laudo_radiologia(request, dados):
+    """
+    Gera laudo radiológico usando IA baseada nas informações fornecidas
+    """
+    texto = str(dados.get('texto', '')).strip()
+
+    if not texto:
+        return JsonResponse({'error': 'Texto com informações do exame é obrigatório'}, status=400)
+
+    try:
+        laudo_gerado = await agenerate_radiology_report(texto, service_name="openrouter")
+
+        if laudo_gerado and not laudo_gerado.startswith("Erro"):
+            return JsonResponse({'laudo': laudo_gerado})
+        return JsonResponse({'error': laudo_gerado or 'Erro ao gerar laudo radiológico'}, status=500)
+
+    except Exception as e:
+        return JsonResponse({'error': 'Erro interno do servidor ao gerar laudo'}, status=500)
+
+
+@endpoint_ia('corrigir_texto')
+async def corrigir_texto(request, dados):
+    """
+    Corrige texto transcrito usando Groq
+    """
+    texto = str(dados.get('texto', '')).strip()
+    deve_capitalizar = dados.get('deve_capitalizar', False)
+
+    if not texto:
+        return JsonResponse({'error': 'Texto é obrigatório'}, status=400)
+
+    try:
+        texto_corrigido = await GroqService().acorrect_text(texto, deve_capitalizar)
+
+        if texto_corrigido:
+            return JsonResponse({'texto_corrigido': texto_corrigido})
+        return JsonResponse({'error': 'Erro ao corrigir texto'}, status=500)
+
+    except Exception as e:
+        return JsonResponse({'error': 'Erro interno do servidor ao corrigir texto'}, status=500)
@@ -0,0 +1,341 @@
+"""
+Exportação e importação da biblioteca de um usuário (modelos de laudo,
+variáveis e frases com seus vínculos) em NDJSON: um objeto JSON por linha.
+
+Formato, na ordem em que as linhas são gravadas:
+    {"tipo": "cabecalho", "formato": "laudos-biblioteca", "versao": 1, ...}
+    {"tipo": "modelo", "id": 7, "titulo": "...", "texto": "...", "metodo": "RM"}
+    {"tipo": "variavel", "id": 3, "tituloVariavel": "...", "variavel": {...}}
+    {"tipo": "frase", "id": 42, "categoriaFrase": "...", "tituloFrase": "...",
+     "frase": {...}, "modelos": [7]}
+
+Os ids são os do banco de origem e servem apenas para ligar as frases aos
+modelos do mesmo arquivo; a importação cria novos registros e remapeia os
+vínculos. Exportação e importação trabalham em lotes de TAMANHO_LOTE, então a
+memória usada não depende do tamanho da biblioteca. Sob ASGI a exportação usa
+aexportar_biblioteca, já que o Django consumiria o gerador síncrono inteiro em
+memória antes de enviar a resposta.
+
+clonar_biblioteca copia a biblioteca de um usuário para outro direto no banco
+(usada para dar aos novos usuários a biblioteca do usuário semente).
+"""
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import TAMANHO_LOTE, criar_em_lote, criar_em_lote_com_ids, vincular_frases_modelos
+from .caching import invalidar_usuario
+from .models import Frase, Metodo, ModeloLaudo, ReferenciaVariavel, Variavel
+from .referencias import indexar_frases
+
+FORMATO = 'laudos-biblioteca'
+VERSAO = 1
+
+
+class ErroImportacao(Exception):
+    """Arquivo de importação inválido; nada é gravado"""
+
+
+def _linha(registro):
+    return json.dumps(registro, ensure_ascii=False) + '\n'
+
+
+def _em_lotes(queryset, campos):
+    """Percorre o queryset em lotes pela chave primária (values com os campos informados)"""
+    ultimo_id = 0
+    while True:
+        lote = list(queryset.filter(id__gt=ultimo_id).order_by('id').values(*campos)[:TAMANHO_LOTE])
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1]['id']
+
+
+def exportar_biblioteca(usuario):
+    """Gera as linhas NDJSON da biblioteca do usuário"""
+    yield _linha({
+        'tipo': 'cabecalho',
+        'formato': FORMATO,
+        'versao': VERSAO,
+        'exportado_em': timezone.now().isoformat(),
+    })
+
+    modelos = ModeloLaudo.objects.filter(usuario=usuario)
+    for lote in _em_lotes(modelos, ['id', 'titulo', 'texto', 'metodo__metodo']):
+        for modelo in lote:
+            yield _linha({
+                'tipo': 'modelo',
+                'id': modelo['id'],
+                'titulo': modelo['titulo'],
+                'texto': modelo['texto'],
+                'metodo': modelo['metodo__metodo'],
+            })
+
+    variaveis = Variavel.objects.filter(usuario=usuario)
+    for lote in _em_lotes(variaveis, ['id', 'tituloVariavel', 'variavel']):
+        for variavel in lote:
+            yield _linha({'tipo': 'variavel', **variavel})
+
+    Vinculo = Frase.modelos_laudo.through
+    frases = Frase.objects.filter(usuario=usuario)
+    for lote in _em_lotes(frases, ['id', 'categoriaFrase', 'tituloFrase', 'frase']):
+        # Vínculos do lote inteiro em uma consulta
+        modelos_por_frase = {}
+        for frase_id, modelo_id in Vinculo.objects.filter(
+            frase_id__in=[frase['id'] for frase in lote]
+        ).order_by('modelolaudo_id').values_list('frase_id', 'modelolaudo_id'):
+            modelos_por_frase.setdefault(frase_id, []).append(modelo_id)
+
+        for frase in lote:
+            yield _linha({'tipo': 'frase', **frase, 'modelos': modelos_por_frase.get(frase['id'], [])})
+
+
+async def aexportar_biblioteca(usuario):
+    """
+    Versão assíncrona de exportar_biblioteca, para StreamingHttpResponse sob
+    ASGI. Cada bloco de até TAMANHO_LOTE linhas é lido do banco em uma thread
+    (sync_to_async), sem bloquear o event loop.
+    """
+    linhas = exportar_biblioteca(usuario)
+    proximo_bloco = sync_to_async(lambda: ''.join(islice(linhas, TAMANHO_LOTE)))
+    while True:
+        bloco = await proximo_bloco()
+        if not bloco:
+            return
+        yield bloco
+
+
+def _texto(registro, campo, modelo, numero, obrigatorio=True):
+    """Lê um campo de texto do registro validando o tamanho máximo da coluna"""
+    valor = registro.get(campo)
+    if valor is None or (obrigatorio and valor == ''):
+        if obrigatorio:
+            raise ErroImportacao(f"Linha {numero}: campo '{campo}' é obrigatório")
+        return ''
+    if not isinstance(valor, str):
+        raise ErroImportacao(f"Linha {numero}: campo '{campo}' deve ser texto")
+    tamanho_maximo = modelo._meta.get_field(campo).max_length
+    if tamanho_maximo and len(valor) > tamanho_maximo:
+        raise ErroImportacao(
+            f"Linha {numero}: campo '{campo}' excede {tamanho_maximo} caracteres"
+        )
+    return valor
+
+
+class _Importacao:
+    """Estado de uma importação: lotes pendentes, ids remapeados e contagens"""
+
+    def __init__(self, usuario):
+        self.usuario = usuario
+        self.metodos = {}
+        self.ids_modelos = {}
+        self.modelos = []
+        self.variaveis = []
+        self.frases = []
+        self.estatisticas = {'modelos': 0, 'variaveis': 0, 'frases': 0, 'vinculos': 0, 'vinculos_ignorados': 0}
+
+    def metodo(self, nome):
+        if nome not in self.metodos:
+            metodo = Metodo.objects.filter(metodo=nome).order_by('id').first()
+            self.metodos[nome] = metodo or Metodo.objects.create(metodo=nome)
+        return self.metodos[nome]
+
+    def adicionar(self, registro, numero):
+        tipo = registro.get('tipo')
+        if tipo == 'modelo':
+            self.modelos.append((registro.get('id'), ModeloLaudo(
+                titulo=_texto(registro, 'titulo', ModeloLaudo, numero),
+                texto=_texto(registro, 'texto', ModeloLaudo, numero, obrigatorio=False),
+                metodo=self.metodo(_texto(registro, 'metodo', Metodo, numero)),
+                usuario=self.usuario,
+            )))
+            if len(self.modelos) >= TAMANHO_LOTE:
+                self.gravar_modelos()
+        elif tipo == 'variavel':
+            if registro.get('variavel') is None:
+                raise ErroImportacao(f"Linha {numero}: campo 'variavel' é obrigatório")
+            self.variaveis.append(Variavel(
+                tituloVariavel=_texto(registro, 'tituloVariavel', Variavel, numero),
+                variavel=registro.get('variavel'),
+                usuario=self.usuario,
+            ))
+            if len(self.variaveis) >= TAMANHO_LOTE:
+                self.gravar_variaveis()
+        elif tipo == 'frase':
+            modelos = registro.get('modelos') or []
+            if not isinstance(modelos, list):
+                raise ErroImportacao(f"Linha {numero}: 'modelos' deve ser uma lista")
+            if registro.get('frase') is None:
+                raise ErroImportacao(f"Linha {numero}: campo 'frase' é obrigatório")
+            # Os modelos referenciados precisam estar gravados para remapear os ids
+            self.gravar_modelos()
+            self.frases.append((modelos, Frase(
+                categoriaFrase=_texto(registro, 'categoriaFrase', Frase, numero),
+                tituloFrase=_texto(registro, 'tituloFrase', Frase, numero),
+                frase=registro['frase'],
+                usuario=self.usuario,
+            )))
+            if len(self.frases) >= TAMANHO_LOTE:
+                self.gravar_frases()
+        elif tipo != 'cabecalho':
+            raise ErroImportacao(f"Linha {numero}: tipo '{tipo}' desconhecido")
+
+    def gravar_modelos(self):
+        if not self.modelos:
+            return
+        novos = criar_em_lote(ModeloLaudo, [modelo for _, modelo in self.modelos])
+        for (id_original, _), novo in zip(self.modelos, novos):
+            if id_original is not None:
+                self.ids_modelos[id_original] = novo.id
+        self.estatisticas['modelos'] += len(novos)
+        self.modelos = []
+
+    def gravar_variaveis(self):
+        if not self.variaveis:
+            return
+        Variavel.objects.bulk_create(self.variaveis, batch_size=TAMANHO_LOTE)
+        self.estatisticas['variaveis'] += len(self.variaveis)
+        self.variaveis = []
+
+    def gravar_frases(self):
+        if not self.frases:
+            return
+        novas = criar_em_lote(Frase, [frase for _, frase in self.frases])
+        pares = []
+        for (modelos, _), nova in zip(self.frases, novas):
+            for id_original in modelos:
+                if id_original in self.ids_modelos:
+                    pares.append((nova.id, self.ids_modelos[id_original]))
+                else:
+                    self.estatisticas['vinculos_ignorados'] += 1
+        self.estatisticas['vinculos'] += vincular_frases_modelos(pares)
+        indexar_frases(novas)
+        self.estatisticas['frases'] += len(novas)
+        self.frases = []
+
+    def concluir(self):
+        self.gravar_modelos()
+        self.gravar_variaveis()
+        self.gravar_frases()
+
+
+def importar_biblioteca(usuario, linhas, substituir=False):
+    """
+    Importa as linhas NDJSON (str ou bytes) para o usuário, tudo em uma
+    transação: qualquer linha inválida desfaz a importação inteira e lança
+    ErroImportacao. Com substituir=True a biblioteca atual do usuário é
+    apagada antes. Retorna as contagens do que foi criado.
+    """
+    importacao = _Importacao(usuario)
+
+    with transaction.atomic():
+        if substituir:
+            Frase.objects.filter(usuario=usuario).delete()
+            ModeloLaudo.objects.filter(usuario=usuario).delete()
+            Variavel.objects.filter(usuario=usuario).delete()
+
+        for numero, linha in enumerate(linhas, start=1):
+            if isinstance(linha, bytes):
+                try:
+                    linha = linha.decode('utf-8-sig' if numero == 1 else 'utf-8')
+                except UnicodeDecodeError:
+                    raise ErroImportacao(f'Linha {numero}: o arquivo deve estar em UTF-8')
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                raise ErroImportacao(f'Linha {numero}: JSON inválido')
+            if not isinstance(registro, dict):
+                raise ErroImportacao(f'Linha {numero}: esperado um objeto JSON')
+            if registro.get('tipo') == 'cabecalho':
+                versao = registro.get('versao', VERSAO)
+                if not isinstance(versao, int) or versao > VERSAO:
+                    raise ErroImportacao(f'Versão {versao} do arquivo não suportada')
+            importacao.adicionar(registro, numero)
+
+        importacao.concluir()
+
+    # Operações em lote não disparam signals
+    invalidar_usuario(usuario.id)
+    return importacao.estatisticas
+
+
+def biblioteca_vazia(usuario):
+    """True se o usuário não tem modelos de laudo, frases nem variáveis"""
+    return not (
+        ModeloLaudo.objects.filter(usuario=usuario).exists()
+        or Frase.objects.filter(usuario=usuario).exists()
+        or Variavel.objects.filter(usuario=usuario).exists()
+    )
+
+
+def clonar_biblioteca(origem, destino):
+    """
+    Copia modelos de laudo, variáveis e frases (com os vínculos frase ↔ modelo
+    e o índice de variáveis) de origem para destino, em uma transação.
+
+    Cada tabela é lida com uma consulta e gravada com inserts em lote; os
+    vínculos usam o mapa id antigo → id novo. O número de consultas não
+    depende da quantidade de registros, apenas do número de lotes de
+    TAMANHO_LOTE. Só copia para quem ainda não tem biblioteca (os IDs dos
+    registros novos são relidos pelo usuário no MySQL); retorna None nesse
+    caso, ou as contagens do que foi criado.
+    """
+    if not biblioteca_vazia(destino):
+        return None
+
+    Vinculo = Frase.modelos_laudo.through
+    modelos = list(ModeloLaudo.objects.filter(usuario=origem).order_by('id').values('id', 'titulo', 'texto', 'metodo_id'))
+    variaveis = list(Variavel.objects.filter(usuario=origem).order_by('id').values('tituloVariavel', 'variavel'))
+    frases = list(Frase.objects.filter(usuario=origem).order_by('id').values('id', 'categoriaFrase', 'tituloFrase', 'frase'))
+    vinculos = list(Vinculo.objects.filter(frase__usuario=origem).values_list('frase_id', 'modelolaudo_id'))
+    referencias = list(ReferenciaVariavel.objects.filter(usuario=origem).values_list('frase_id', 'tituloVariavel'))
+
+    with transaction.atomic():
+        novos_modelos = criar_em_lote_com_ids(ModeloLaudo, [
+            ModeloLaudo(titulo=modelo['titulo'], texto=modelo['texto'], metodo_id=modelo['metodo_id'], usuario=destino)
+            for modelo in modelos
+        ], ModeloLaudo.objects.filter(usuario=destino))
+        ids_modelos = {modelo['id']: novo.pk for modelo, novo in zip(modelos, novos_modelos)}
+
+        Variavel.objects.bulk_create([
+            Variavel(usuario=destino, **variavel) for variavel in variaveis
+        ], batch_size=TAMANHO_LOTE)
+
+        novas_frases = criar_em_lote_com_ids(Frase, [
+            Frase(
+                categoriaFrase=frase['categoriaFrase'],
+                tituloFrase=frase['tituloFrase'],
+                frase=frase['frase'],
+                usuario=destino
+            )
+            for frase in frases
+        ], Frase.objects.filter(usuario=destino))
+        ids_frases = {frase['id']: nova.pk for frase, nova in zip(frases, novas_frases)}
+
+        total_vinculos = vincular_frases_modelos(
+            (ids_frases[frase_id], ids_modelos[modelo_id])
+            for frase_id, modelo_id in vinculos
+            # Vínculos da origem com modelos de outro usuário não são copiados
+            if modelo_id in ids_modelos
+        )
+
+        # O índice é copiado em vez de recalculado a partir do fraseBase
+        ReferenciaVariavel.objects.bulk_create([
+            ReferenciaVariavel(frase_id=ids_frases[frase_id], usuario=destino, tituloVariavel=titulo)
+            for frase_id, titulo in referencias
+        ], batch_size=TAMANHO_LOTE)
+
+    # Operações em lote não disparam signals
+    invalidar_usuario(destino.id)
+    return {
+        'modelos': len(novos_modelos),
+        'variaveis': len(variaveis),
+        'frases': len(novas_frases),
+        'vinculos': total_vinculos,
+    }
@@ -0,0 +1,59 @@
+"""
+Operações em lote usadas por cópias, duplicações e importações de frases
+"""
+from django.db import connection
+
+from .models import Frase
+
+TAMANHO_LOTE = 500
+
+
+def criar_em_lote(modelo, objetos, batch_size=TAMANHO_LOTE):
+    """
+    Insere os objetos em lote garantindo que todos voltem com a chave primária
+    preenchida (necessária para criar vínculos ManyToMany em seguida).
+
+    O MySQL não retorna os IDs de um INSERT com várias linhas; nesse caso os
+    objetos são salvos um a um. Chame dentro de transaction.atomic().
+    """
+    objetos = list(objetos)
+    if connection.features.can_return_rows_from_bulk_insert:
+        return modelo.objects.bulk_create(objetos, batch_size=batch_size)
+
+    for objeto in objetos:
+        objeto.save(force_insert=True)
+    return objetos
+
+
+def criar_em_lote_com_ids(modelo, objetos, recem_criados, batch_size=TAMANHO_LOTE):
+    """
+    Como criar_em_lote, mas também em lote no MySQL: quando o banco não
+    retorna os IDs, eles são lidos de volta com recem_criados, um queryset que
+    seleciona exatamente os registros inseridos (ex.: os de um usuário que
+    ainda não tinha nenhum). Os IDs crescem na ordem de inserção.
+    Chame dentro de transaction.atomic().
+    """
+    objetos = modelo.objects.bulk_create(list(objetos), batch_size=batch_size)
+    if objetos and objetos[0].pk is None:
+        ids = list(recem_criados.order_by('pk').values_list('pk', flat=True))
+        if len(ids) != len(objetos):
+            raise RuntimeError(
+                f'{modelo.__name__}: {len(objetos)} registro(s) inserido(s), {len(ids)} encontrado(s)'
+            )
+        for objeto, pk in zip(objetos, ids):
+            objeto.pk = pk
+    return objetos
+
+
+def vincular_frases_modelos(pares, batch_size=TAMANHO_LOTE):
+    """
+    Cria vínculos frase ↔ modelo de laudo direto na tabela intermediária.
+    pares: iterável de (frase_id, modelo_laudo_id).
+    """
+    Vinculo = Frase.modelos_laudo.through
+    vinculos = [
+        Vinculo(frase_id=frase_id, modelolaudo_id=modelo_laudo_id)
+        for frase_id, modelo_laudo_id in pares
+    ]
+    Vinculo.objects.bulk_create(vinculos, batch_size=batch_size, ignore_conflicts=True)
+    return len(vinculos)
@@ -0,0 +1,78 @@
+"""
+Cache por usuário das listas de taxonomia de frases (categorias, títulos, frases por modelo)
+
+Cada usuário tem um contador de geração que faz parte de todas as chaves do
+cache. Quando uma frase ou modelo do usuário é alterado, os signals incrementam
+o contador e as entradas antigas deixam de ser encontradas (expiram sozinhas),
+sem afetar o cache dos outros usuários.
+
+Quem enxerga a biblioteca compartilhada (api/compartilhada.py) também depende
+da geração do dono dela, que entra nas chaves junto com a do usuário.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .compartilhada import biblioteca_compartilhada_id
+
+
+def _tempo_cache():
+    return getattr(settings, 'CACHE_TAXONOMIA_SEGUNDOS', 300)
+
+
+def _chave_geracao(usuario_id):
+    return f'taxonomia_geracao_{usuario_id}'
+
+
+def obter_geracao(usuario_id):
+    """Retorna a geração atual do cache do usuário"""
+    chave = _chave_geracao(usuario_id)
+    geracao = cache.get(chave)
+    if geracao is None:
+        # Começa pelo relógio para não reaproveitar uma geração antiga caso o
+        # contador tenha sido descartado pelo backend de cache
+        cache.add(chave, time.time_ns(), None)
+        geracao = cache.get(chave, 0)
+    return geracao
+
+
+def obter_geracao_visivel(usuario_id):
+    """Geração do usuário combinada à da biblioteca compartilhada que ele enxerga"""
+    geracao = obter_geracao(usuario_id)
+    semente_id = biblioteca_compartilhada_id()
+    if semente_id and semente_id != usuario_id:
+        return f'{geracao}.{obter_geracao(semente_id)}'
+    return geracao
+
+
+def invalidar_usuario(usuario_id):
+    """Invalida todas as entradas de taxonomia do usuário"""
+    chave = _chave_geracao(usuario_id)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # Contador ainda não existe (ou foi descartado)
+        cache.set(chave, time.time_ns(), None)
+
+
+def obter_ou_calcular(usuario_id, nome, calcular, **parametros):
+    """
+    Retorna o valor em cache para (usuário, nome, parâmetros) ou executa
+    calcular() e guarda o resultado. Resultados None não são guardados.
+    """
+    parametros_hash = hashlib.md5(
+        json.dumps(parametros, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    chave = f'taxonomia_{nome}_{usuario_id}_{obter_geracao_visivel(usuario_id)}_{parametros_hash}'
+
+    valor = cache.get(chave)
+    if valor is not None:
+        return valor
+
+    valor = calcular()
+    if valor is not None:
+        cache.set(chave, valor, _tempo_cache())
+    return valor
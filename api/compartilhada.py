@@ -0,0 +1,152 @@
+"""
+Biblioteca compartilhada (copy-on-write)
+
+Com settings.BIBLIOTECA_INICIAL_MODO = 'compartilhada', os modelos de laudo,
+frases e variáveis do usuário semente (settings.USUARIO_SEMENTE_EMAIL) não são
+copiados para cada novo usuário: todos os enxergam pelos querysets das
+ViewSets, em modo somente leitura, ao lado dos próprios registros.
+
+Quando o usuário edita um registro compartilhado, ele é materializado: é
+criada uma cópia no espaço do usuário, ligada ao original por 'origem', que
+passa a substituí-lo na visão desse usuário. Excluir um registro compartilhado
+apenas o oculta (ItemOculto). O cadastro de usuários não grava nada e as
+tabelas crescem só com o que cada usuário de fato alterou.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .bulk import TAMANHO_LOTE, criar_em_lote_com_ids, vincular_frases_modelos
+from .models import CustomUser, Frase, ItemOculto, ModeloLaudo, ReferenciaVariavel, Variavel
+
+TIPOS = {ModeloLaudo: 'modelo', Frase: 'frase', Variavel: 'variavel'}
+
+# Campos copiados ao materializar cada tipo de registro
+CAMPOS_COPIADOS = {
+    ModeloLaudo: ['titulo', 'texto', 'metodo_id'],
+    Frase: ['categoriaFrase', 'tituloFrase', 'frase'],
+    Variavel: ['tituloVariavel', 'variavel'],
+}
+
+
+def biblioteca_compartilhada_id():
+    """
+    ID do usuário dono da biblioteca compartilhada, ou None se o modo
+    'compartilhada' não está ativo ou o usuário semente não existe.
+    """
+    email = getattr(settings, 'USUARIO_SEMENTE_EMAIL', '')
+    if not email or getattr(settings, 'BIBLIOTECA_INICIAL_MODO', 'compartilhada') != 'compartilhada':
+        return None
+
+    chave = f'biblioteca_compartilhada_id_{email}'
+    semente_id = cache.get(chave)
+    if semente_id is None:
+        semente_id = CustomUser.objects.filter(email=email).values_list('id', flat=True).first() or 0
+        cache.set(chave, semente_id, getattr(settings, 'CACHE_TAXONOMIA_SEGUNDOS', 300))
+    return semente_id or None
+
+
+def donos_visiveis(usuario):
+    """IDs dos usuários cujos registros aparecem em visiveis(): o próprio e o semente"""
+    semente_id = biblioteca_compartilhada_id()
+    if not semente_id or semente_id == usuario.pk:
+        return [usuario.pk]
+    return [usuario.pk, semente_id]
+
+
+def visiveis(modelo, usuario):
+    """
+    Registros de modelo (ModeloLaudo, Frase ou Variavel) que o usuário
+    enxerga: os próprios e os compartilhados que ele não materializou nem
+    ocultou. Uma consulta, com as exclusões em subconsultas.
+    """
+    proprios = Q(usuario=usuario)
+    donos = donos_visiveis(usuario)
+    if len(donos) == 1:
+        return modelo.objects.filter(proprios)
+    semente_id = donos[1]
+
+    materializados = modelo.objects.filter(usuario=usuario, origem__isnull=False).values('origem_id')
+    ocultos = ItemOculto.objects.filter(usuario=usuario, tipo=TIPOS[modelo]).values('objeto_id')
+    compartilhados = Q(usuario_id=semente_id) & ~Q(pk__in=materializados) & ~Q(pk__in=ocultos)
+    return modelo.objects.filter(proprios | compartilhados)
+
+
+def modelos_equivalentes(modelo_laudo_id, usuario):
+    """
+    IDs cujos vínculos com frases valem para o modelo de laudo: ele próprio e,
+    se for a cópia materializada de um modelo compartilhado, o original (as
+    frases continuam vinculadas a ele).
+    """
+    if not biblioteca_compartilhada_id():
+        return [modelo_laudo_id]
+    origem_id = ModeloLaudo.objects.filter(
+        pk=modelo_laudo_id, usuario=usuario
+    ).values_list('origem_id', flat=True).first()
+    return [modelo_laudo_id, origem_id] if origem_id else [modelo_laudo_id]
+
+
+def frases_do_modelo(frases, modelo_laudo_id, usuario):
+    """Filtra o queryset de frases pelas vinculadas ao modelo (sem duplicatas)"""
+    vinculos = Frase.modelos_laudo.through.objects.filter(
+        modelolaudo_id__in=modelos_equivalentes(modelo_laudo_id, usuario)
+    )
+    return frases.filter(pk__in=vinculos.values('frase_id'))
+
+
+def materializar(objeto, usuario):
+    """
+    Retorna o registro que o usuário pode alterar: o próprio objeto ou, se
+    for compartilhado, uma cópia dele no espaço do usuário.
+    """
+    if objeto.usuario_id == usuario.pk:
+        return objeto
+    return materializar_em_lote(type(objeto), [objeto], usuario)[0]
+
+
+def materializar_em_lote(modelo, objetos, usuario):
+    """
+    Copia os registros compartilhados para o espaço do usuário, com inserts
+    em lote. Nas frases, os vínculos com modelos de laudo e o índice de
+    variáveis também são copiados. Retorna as cópias na ordem de objetos.
+    """
+    objetos = list(objetos)
+    if not objetos:
+        return []
+
+    campos = CAMPOS_COPIADOS[modelo]
+    with transaction.atomic():
+        copias = criar_em_lote_com_ids(modelo, [
+            modelo(usuario=usuario, origem_id=objeto.pk, **{campo: getattr(objeto, campo) for campo in campos})
+            for objeto in objetos
+        ], modelo.objects.filter(usuario=usuario, origem_id__in=[objeto.pk for objeto in objetos]))
+
+        if modelo is Frase:
+            ids = {objeto.pk: copia.pk for objeto, copia in zip(objetos, copias)}
+            vincular_frases_modelos(
+                (ids[frase_id], modelo_id)
+                for frase_id, modelo_id in Frase.modelos_laudo.through.objects.filter(
+                    frase_id__in=ids
+                ).values_list('frase_id', 'modelolaudo_id')
+            )
+            ReferenciaVariavel.objects.bulk_create([
+                ReferenciaVariavel(frase_id=ids[frase_id], usuario=usuario, tituloVariavel=titulo)
+                for frase_id, titulo in ReferenciaVariavel.objects.filter(
+                    frase_id__in=ids
+                ).values_list('frase_id', 'tituloVariavel')
+            ], batch_size=TAMANHO_LOTE)
+    return copias
+
+
+def excluir(objeto, usuario):
+    """
+    Exclui o registro da visão do usuário. Registros próprios são apagados;
+    os compartilhados (e os originais de cópias materializadas) são ocultados.
+    """
+    origem_id = objeto.pk if objeto.usuario_id != usuario.pk else objeto.origem_id
+    with transaction.atomic():
+        if origem_id:
+            ItemOculto.objects.get_or_create(usuario=usuario, tipo=TIPOS[type(objeto)], objeto_id=origem_id)
+        if objeto.usuario_id == usuario.pk:
+            objeto.delete()
@@ -0,0 +1,198 @@
+"""
+Clientes HTTP compartilhados pelos serviços de IA
+
+Cada provedor tem um pool de conexões próprio, criado uma única vez por
+processo e reutilizado por todas as instâncias de AIService. Assim as conexões
+TCP/TLS ficam abertas (keep-alive) entre requisições, em vez de um novo
+handshake a cada laudo gerado.
+
+O número de chamadas simultâneas a cada provedor também é limitado por
+processo ('max_simultaneas' em settings.AI_HTTP_LIMITES): as chamadas
+excedentes esperam uma vaga em vez de falhar.
+
+Os clientes assíncronos pertencem a um event loop e são fechados quando ele
+termina (asyncio.run, async_to_sync e os servidores ASGI encerram o loop com
+shutdown_asyncgens), então loops de vida curta não deixam pools abertos.
+"""
+import asyncio
+import atexit
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+from django.conf import settings
+
+_clientes = {}
+_clientes_async = weakref.WeakKeyDictionary()
+_guardioes_async = weakref.WeakKeyDictionary()
+_semaforos = {}
+_semaforos_async = weakref.WeakKeyDictionary()
+_trava = threading.Lock()
+
+
+class EsperaPorVagaEsgotada(Exception):
+    """O provedor ficou sem vaga para novas chamadas por tempo demais"""
+
+
+def _http2_disponivel():
+    """HTTP/2 depende do pacote opcional h2 (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _timeout():
+    return httpx.Timeout(
+        connect=settings.AI_HTTP_TIMEOUT_CONEXAO,
+        read=settings.AI_HTTP_TIMEOUT_LEITURA,
+        write=settings.AI_HTTP_TIMEOUT_CONEXAO,
+        pool=settings.AI_HTTP_TIMEOUT_LEITURA,
+    )
+
+
+def timeout_ate(prazo_final):
+    """Timeouts de uma requisição limitados ao tempo restante até prazo_final (time.monotonic())"""
+    restante = max(prazo_final - time.monotonic(), 0.001)
+    return httpx.Timeout(
+        connect=min(settings.AI_HTTP_TIMEOUT_CONEXAO, restante),
+        read=min(settings.AI_HTTP_TIMEOUT_LEITURA, restante),
+        write=min(settings.AI_HTTP_TIMEOUT_CONEXAO, restante),
+        pool=min(settings.AI_HTTP_TIMEOUT_LEITURA, restante),
+    )
+
+
+def _configuracao(provedor):
+    return {
+        **settings.AI_HTTP_LIMITES.get('padrao', {}),
+        **settings.AI_HTTP_LIMITES.get(provedor, {}),
+    }
+
+
+def _limites(provedor):
+    configuracao = _configuracao(provedor)
+    return httpx.Limits(
+        max_connections=configuracao.get('max_conexoes', 20),
+        max_keepalive_connections=configuracao.get('max_conexoes_ociosas', 10),
+        keepalive_expiry=configuracao.get('tempo_ocioso', 60),
+    )
+
+
+def obter_cliente(provedor):
+    """Retorna o cliente síncrono (com pool de conexões) do provedor"""
+    cliente = _clientes.get(provedor)
+    if cliente is None:
+        with _trava:
+            cliente = _clientes.get(provedor)
+            if cliente is None:
+                cliente = httpx.Client(
+                    timeout=_timeout(),
+                    limits=_limites(provedor),
+                    http2=_http2_disponivel(),
+                )
+                _clientes[provedor] = cliente
+    return cliente
+
+
+def obter_cliente_async(provedor):
+    """
+    Retorna o cliente assíncrono do provedor. Os pools assíncronos pertencem a
+    um event loop, então há um cliente por (event loop, provedor).
+    """
+    loop = asyncio.get_running_loop()
+    clientes = _clientes_async.get(loop)
+    if clientes is None:
+        clientes = _clientes_async[loop] = {}
+        _fechar_ao_encerrar(loop, clientes)
+    cliente = clientes.get(provedor)
+    if cliente is None:
+        cliente = httpx.AsyncClient(
+            timeout=_timeout(),
+            limits=_limites(provedor),
+            http2=_http2_disponivel(),
+        )
+        clientes[provedor] = cliente
+    return cliente
+
+
+def _fechar_ao_encerrar(loop, clientes):
+    """
+    Fecha os clientes do loop quando ele terminar. O loop finaliza os
+    geradores assíncronos ainda abertos (shutdown_asyncgens) antes de fechar,
+    com ele ainda em execução; o guardião é um gerador parado no primeiro
+    yield que fecha os clientes no finally.
+    """
+    async def guardiao():
+        try:
+            yield
+        finally:
+            _clientes_async.pop(loop, None)
+            _guardioes_async.pop(loop, None)
+            for cliente in list(clientes.values()):
+                await cliente.aclose()
+
+    gerador = guardiao()
+    # A primeira iteração registra o gerador no loop; como ele não espera
+    # nada antes do yield, termina sem precisar do loop
+    try:
+        gerador.asend(None).send(None)
+    except StopIteration:
+        pass
+    # O loop guarda só uma referência fraca aos geradores
+    _guardioes_async[loop] = gerador
+
+
+def _max_simultaneas(provedor):
+    return _configuracao(provedor).get('max_simultaneas', 10)
+
+
+@contextmanager
+def limitar_concorrencia(provedor):
+    """
+    Ocupa uma das vagas de chamadas simultâneas ao provedor, esperando até
+    settings.AI_HTTP_ESPERA_VAGA segundos por ela.
+    """
+    semaforo = _semaforos.get(provedor)
+    if semaforo is None:
+        with _trava:
+            semaforo = _semaforos.setdefault(
+                provedor, threading.BoundedSemaphore(_max_simultaneas(provedor))
+            )
+
+    if not semaforo.acquire(timeout=settings.AI_HTTP_ESPERA_VAGA):
+        raise EsperaPorVagaEsgotada(f"Sem vaga para chamar o provedor '{provedor}'")
+    try:
+        yield
+    finally:
+        semaforo.release()
+
+
+@asynccontextmanager
+async def alimitar_concorrencia(provedor):
+    """Versão assíncrona de limitar_concorrencia (um semáforo por event loop)"""
+    loop = asyncio.get_running_loop()
+    semaforos = _semaforos_async.setdefault(loop, {})
+    semaforo = semaforos.get(provedor)
+    if semaforo is None:
+        semaforo = semaforos[provedor] = asyncio.BoundedSemaphore(_max_simultaneas(provedor))
+
+    try:
+        await asyncio.wait_for(semaforo.acquire(), timeout=settings.AI_HTTP_ESPERA_VAGA)
+    except asyncio.TimeoutError:
+        raise EsperaPorVagaEsgotada(f"Sem vaga para chamar o provedor '{provedor}'")
+    try:
+        yield
+    finally:
+        semaforo.release()
+
+
+@atexit.register
+def fechar_clientes():
+    """Fecha as conexões abertas dos clientes síncronos"""
+    with _trava:
+        for cliente in _clientes.values():
+            cliente.close()
+        _clientes.clear()
@@ -0,0 +1,172 @@
+"""
+Benchmarks de desempenho das operações do app.
+
+Cada cenário cria os próprios dados dentro de uma transação que é desfeita ao
+final, então o comando pode ser executado em qualquer banco sem deixar rastros.
+
+Uso:
+    python manage.py benchmark gerenciar_frases
+    python manage.py benchmark gerenciar_frases --tamanhos 10 100 1000
+    python manage.py benchmark clonar_biblioteca --tamanhos 100 1000 10000
+    python manage.py benchmark listar_frases --tamanhos 100 1000
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.biblioteca import clonar_biblioteca
+from api.models import CustomUser, Metodo, ModeloLaudo, Frase, Variavel
+from api.referencias import indexar_frases
+from api.serializers import FraseSerializer
+from api.views import FraseViewSet
+
+
+class Rollback(Exception):
+    """Usada para desfazer a transação do cenário"""
+
+
+class Command(BaseCommand):
+    help = 'Mede tempo e número de consultas das operações em lote'
+
+    cenarios = ['gerenciar_frases', 'clonar_biblioteca', 'listar_frases']
+
+    def add_arguments(self, parser):
+        parser.add_argument('cenario', choices=self.cenarios)
+        parser.add_argument(
+            '--tamanhos', nargs='+', type=int, default=[10, 100, 1000],
+            help='Quantidades de frases usadas em cada rodada'
+        )
+
+    def handle(self, *args, **options):
+        executar = getattr(self, f'cenario_{options["cenario"]}')
+        for tamanho in options['tamanhos']:
+            try:
+                with transaction.atomic():
+                    executar(self._criar_usuario(), tamanho)
+                    raise Rollback()
+            except Rollback:
+                pass
+
+    def _criar_usuario(self):
+        return CustomUser.objects.create_user(
+            email=f'benchmark-{time.time_ns()}@benchmark.local',
+            username=f'benchmark-{time.time_ns()}',
+            password=None,
+            nome_completo='Benchmark',
+        )
+
+    def _medir(self, rotulo, tamanho, funcao):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            resultado = funcao()
+            duracao = time.perf_counter() - inicio
+        self.stdout.write(
+            f'{rotulo:<36} N={tamanho:<6} consultas={len(consultas):<5} tempo={duracao * 1000:.1f} ms'
+        )
+        return resultado
+
+    def _criar_frases(self, usuario, modelo, quantidade):
+        frases = Frase.objects.bulk_create([
+            Frase(
+                categoriaFrase=f'Categoria {i % 10}',
+                tituloFrase=f'Título {i % 50}',
+                frase={'fraseBase': f'Frase de teste {i} com {{Variavel}}'},
+                usuario=usuario,
+            )
+            for i in range(quantidade)
+        ])
+        if not all(frase.pk for frase in frases):
+            frases = list(Frase.objects.filter(usuario=usuario).order_by('id'))
+        Frase.modelos_laudo.through.objects.bulk_create([
+            Frase.modelos_laudo.through(frase_id=frase.pk, modelolaudo_id=modelo.pk)
+            for frase in frases
+        ])
+        return [frase.pk for frase in frases]
+
+    def cenario_gerenciar_frases(self, usuario, tamanho):
+        """copiar / mover / duplicar N frases via FraseViewSet.gerenciar_entre_modelos"""
+        metodo = Metodo.objects.create(metodo='Benchmark')
+        origem = ModeloLaudo.objects.create(titulo='Origem', texto='', metodo=metodo, usuario=usuario)
+        destino = ModeloLaudo.objects.create(titulo='Destino', texto='', metodo=metodo, usuario=usuario)
+        ids = self._criar_frases(usuario, origem, tamanho)
+
+        view = FraseViewSet.as_view({'post': 'gerenciar_entre_modelos'})
+        factory = APIRequestFactory()
+
+        for modo in ['copiar', 'duplicar', 'mover']:
+            request = factory.post('/api/frases/gerenciar-entre-modelos/', {
+                'modelo_origem_id': origem.pk,
+                'modelo_destino_id': destino.pk,
+                'frases_ids': ids,
+                'modo_operacao': modo,
+            }, format='json')
+            force_authenticate(request, user=usuario)
+            response = self._medir(f'gerenciar_entre_modelos ({modo})', tamanho, lambda: view(request))
+            if response.status_code != 200:
+                self.stderr.write(f'    erro: {response.data}')
+
+    def cenario_clonar_biblioteca(self, usuario, tamanho):
+        """cópia da biblioteca do usuário semente (N frases) para um novo usuário"""
+        metodo = Metodo.objects.create(metodo='Benchmark')
+        modelos = ModeloLaudo.objects.bulk_create([
+            ModeloLaudo(titulo=f'Modelo {i}', texto='', metodo=metodo, usuario=usuario)
+            for i in range(max(tamanho // 100, 1))
+        ])
+        if not all(modelo.pk for modelo in modelos):
+            modelos = list(ModeloLaudo.objects.filter(usuario=usuario).order_by('id'))
+        for i, modelo in enumerate(modelos):
+            self._criar_frases(usuario, modelo, min(100, tamanho - i * 100))
+        Variavel.objects.bulk_create([
+            Variavel(tituloVariavel=f'Variavel {i}', variavel={'valores': []}, usuario=usuario)
+            for i in range(max(tamanho // 10, 1))
+        ])
+        indexar_frases(Frase.objects.filter(usuario=usuario))
+
+        novo = self._criar_usuario()
+        contagens = self._medir('clonar_biblioteca', tamanho, lambda: clonar_biblioteca(usuario, novo))
+        self.stdout.write(f'    {contagens}')
+
+    def cenario_listar_frases(self, usuario, tamanho):
+        """
+        Listagem de N frases: serialização padrão do DRF (uma consulta de
+        vínculos por frase) x FraseListSerializer, e GET /api/frases/ com
+        páginas de 10 e de N itens, que devem usar o mesmo número de consultas
+        """
+        metodo = Metodo.objects.create(metodo='Benchmark')
+        modelos = [
+            ModeloLaudo.objects.create(titulo=f'Modelo {i}', texto='', metodo=metodo, usuario=usuario)
+            for i in range(3)
+        ]
+        ids = self._criar_frases(usuario, modelos[0], tamanho)
+        Frase.modelos_laudo.through.objects.bulk_create([
+            Frase.modelos_laudo.through(frase_id=frase_id, modelolaudo_id=modelo.pk)
+            for frase_id in ids
+            for modelo in modelos[1:]
+        ])
+        frases = list(Frase.objects.filter(usuario=usuario).order_by('id'))
+
+        for rotulo, criar in [
+            ('serializacao DRF', lambda: serializers.ListSerializer(frases, child=FraseSerializer())),
+            ('serializacao FraseListSerializer', lambda: FraseSerializer(frases, many=True)),
+        ]:
+            inicio = time.perf_counter()
+            self._medir(rotulo, tamanho, lambda: criar().data)
+            self.stdout.write(f'    {tamanho / (time.perf_counter() - inicio):,.0f} frases/s')
+
+        view = FraseViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        consultas = {}
+        for tamanho_pagina in (10, min(tamanho, settings.PAGINACAO_TAMANHO_MAXIMO)):
+            request = factory.get('/api/frases/', {'page_size': tamanho_pagina})
+            force_authenticate(request, user=usuario)
+            # O link da próxima página usa o host da requisição de teste
+            with override_settings(ALLOWED_HOSTS=['testserver']), CaptureQueriesContext(connection) as capturadas:
+                self._medir(f'GET /api/frases/ (página de {tamanho_pagina})', tamanho, lambda: view(request).render())
+            consultas[tamanho_pagina] = len(capturadas)
+        if len(set(consultas.values())) > 1:
+            self.stderr.write(f'    REGRESSÃO: consultas crescem com o tamanho da página: {consultas}')
@@ -0,0 +1,36 @@
+"""
+Exporta a biblioteca de um usuário (modelos de laudo, variáveis e frases) em NDJSON.
+
+Uso:
+    python manage.py exportar_biblioteca --email usuario@exemplo.com > biblioteca.ndjson
+    python manage.py exportar_biblioteca --email usuario@exemplo.com --saida biblioteca.ndjson
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.biblioteca import exportar_biblioteca
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Exporta a biblioteca de um usuário em NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', required=True, help='Usuário dono da biblioteca')
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão)')
+
+    def handle(self, *args, **options):
+        usuario = CustomUser.objects.filter(email=options['email']).first()
+        if not usuario:
+            raise CommandError(f'Usuário {options["email"]} não encontrado')
+
+        if not options.get('saida'):
+            for linha in exportar_biblioteca(usuario):
+                self.stdout.write(linha, ending='')
+            return
+
+        linhas = 0
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            for linha in exportar_biblioteca(usuario):
+                arquivo.write(linha)
+                linhas += 1
+        self.stderr.write(f'{linhas} linha(s) gravada(s) em {options["saida"]}.')
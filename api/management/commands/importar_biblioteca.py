@@ -0,0 +1,45 @@
+"""
+Importa para um usuário uma biblioteca exportada em NDJSON (exportar_biblioteca).
+
+Uso:
+    python manage.py importar_biblioteca biblioteca.ndjson --email usuario@exemplo.com
+    python manage.py importar_biblioteca biblioteca.ndjson --email usuario@exemplo.com --substituir
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.biblioteca import ErroImportacao, importar_biblioteca
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Importa a biblioteca (modelos, variáveis e frases) de um arquivo NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo NDJSON gerado por exportar_biblioteca')
+        parser.add_argument('--email', required=True, help='Usuário que recebe a biblioteca')
+        parser.add_argument(
+            '--substituir', action='store_true',
+            help='Apaga a biblioteca atual do usuário antes de importar'
+        )
+
+    def handle(self, *args, **options):
+        usuario = CustomUser.objects.filter(email=options['email']).first()
+        if not usuario:
+            raise CommandError(f'Usuário {options["email"]} não encontrado')
+
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                estatisticas = importar_biblioteca(usuario, arquivo, substituir=options['substituir'])
+        except OSError as e:
+            raise CommandError(f'Não foi possível ler o arquivo: {e}')
+        except ErroImportacao as e:
+            raise CommandError(f'Arquivo inválido, nada foi importado. {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{estatisticas['modelos']} modelo(s), {estatisticas['variaveis']} variável(is) e "
+            f"{estatisticas['frases']} frase(s) importado(s), {estatisticas['vinculos']} vínculo(s) criado(s)."
+        ))
+        if estatisticas['vinculos_ignorados']:
+            self.stdout.write(self.style.WARNING(
+                f"{estatisticas['vinculos_ignorados']} vínculo(s) com modelos ausentes do arquivo ignorado(s)."
+            ))
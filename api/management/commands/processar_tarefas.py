@@ -0,0 +1,115 @@
+"""
+Worker da fila de tarefas em segundo plano (api.tarefas).
+
+Uso:
+    python manage.py processar_tarefas
+    python manage.py processar_tarefas --threads 16
+    python manage.py processar_tarefas --uma-vez
+
+Pode haver vários workers ao mesmo tempo (inclusive em máquinas diferentes):
+cada tarefa é reservada com um UPDATE condicional no banco. O limite por
+provedor (settings.TAREFAS_CONCORRENCIA) vale para cada worker.
+"""
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.models import Tarefa
+from api.tarefas import executar, limite_concorrencia, recuperar_interrompidas, reservar
+
+
+def _executar_na_thread(tarefa):
+    try:
+        executar(tarefa)
+    finally:
+        # Cada thread do pool tem suas próprias conexões com o banco
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas em segundo plano (laudos, correções, atualização de frases)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.TAREFAS_THREADS,
+            help='Número máximo de tarefas executadas ao mesmo tempo'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos entre consultas à fila quando não há tarefas'
+        )
+        parser.add_argument(
+            '--uma-vez',
+            action='store_true',
+            help='Processa as tarefas pendentes e encerra'
+        )
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        intervalo = options['intervalo']
+
+        recuperadas = recuperar_interrompidas()
+        if recuperadas:
+            self.stdout.write(f'{recuperadas} tarefa(s) interrompida(s) devolvida(s) para a fila.')
+
+        self.stdout.write(f'Processando tarefas com {threads} thread(s)...')
+
+        em_execucao = {}
+        por_provedor = Counter()
+        processadas = 0
+
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tarefa') as pool:
+            try:
+                while True:
+                    close_old_connections()
+                    iniciadas = 0
+                    vagas = threads - len(em_execucao)
+
+                    if vagas > 0:
+                        saturados = [
+                            provedor for provedor, quantidade in por_provedor.items()
+                            if quantidade >= limite_concorrencia(provedor)
+                        ]
+                        pendentes = (
+                            Tarefa.objects
+                            .filter(status='pendente')
+                            .exclude(provedor__in=saturados)
+                            .select_related('usuario')
+                            .order_by('criado_em', 'id')[:vagas]
+                        )
+                        for tarefa in pendentes:
+                            if por_provedor[tarefa.provedor] >= limite_concorrencia(tarefa.provedor):
+                                continue
+                            if not reservar(tarefa):
+                                continue
+                            por_provedor[tarefa.provedor] += 1
+                            em_execucao[pool.submit(_executar_na_thread, tarefa)] = tarefa.provedor
+                            iniciadas += 1
+
+                    if not em_execucao:
+                        if options['uma_vez']:
+                            break
+                        time.sleep(intervalo)
+                        continue
+
+                    # Sem tarefa nova, espera alguma terminar (ou o intervalo) antes de consultar a fila
+                    concluidas, _ = wait(
+                        list(em_execucao),
+                        timeout=0 if iniciadas else intervalo,
+                        return_when=FIRST_COMPLETED
+                    )
+                    for futuro in concluidas:
+                        por_provedor[em_execucao.pop(futuro)] -= 1
+                        processadas += 1
+            except KeyboardInterrupt:
+                self.stdout.write('Encerrando: aguardando as tarefas em execução...')
+
+        self.stdout.write(self.style.SUCCESS(f'{processadas} tarefa(s) processada(s).'))
@@ -0,0 +1,79 @@
+"""
+Provedor de IA simulado para testes de carga, sem custo de API.
+
+Responde a POST .../chat/completions (formato OpenAI, usado por OpenAI,
+OpenRouter e Groq) e .../messages (formato Anthropic) depois de uma latência
+configurável, como um modelo gerando o texto.
+
+Uso:
+    python manage.py provedor_simulado --porta 8765 --latencia 3
+
+e inicie o servidor da aplicação apontando o provedor para ele:
+    AI_BASE_URL_OPENROUTER=http://127.0.0.1:8765 AI_BASE_URL_GROQ=http://127.0.0.1:8765 ...
+"""
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Servidor HTTP que simula um provedor de IA (para o teste de carga)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--porta', type=int, default=8765)
+        parser.add_argument('--latencia', type=float, default=3.0, help='Segundos por resposta')
+        parser.add_argument('--variacao', type=float, default=0.2, help='Variação aleatória da latência (fração)')
+
+    def handle(self, *args, **options):
+        latencia = options['latencia']
+        variacao = options['variacao']
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                try:
+                    dados = json.loads(self.rfile.read(tamanho) or b'{}')
+                except ValueError:
+                    dados = {}
+
+                time.sleep(max(latencia * (1 + random.uniform(-variacao, variacao)), 0))
+
+                texto = f'Texto simulado ({len(json.dumps(dados))} bytes recebidos).'
+                uso = {'prompt_tokens': 500, 'completion_tokens': 50}
+                if self.path.rstrip('/').endswith('/messages'):
+                    resposta = {
+                        'content': [{'type': 'text', 'text': texto}],
+                        'usage': {'input_tokens': 500, 'output_tokens': 50},
+                    }
+                else:
+                    resposta = {
+                        'choices': [{'message': {'role': 'assistant', 'content': texto}}],
+                        'usage': uso,
+                    }
+
+                corpo = json.dumps(resposta).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+        servidor = ThreadingHTTPServer(('127.0.0.1', options['porta']), Handler)
+        servidor.daemon_threads = True
+        self.stdout.write(
+            f'Provedor simulado em http://127.0.0.1:{options["porta"]} (latência {latencia}s). Ctrl+C para parar.'
+        )
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
@@ -0,0 +1,47 @@
+"""
+Recria o índice de variáveis referenciadas pelas frases (ReferenciaVariavel).
+
+Uso:
+    python manage.py reindexar_variaveis
+    python manage.py reindexar_variaveis --email usuario@exemplo.com
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.bulk import TAMANHO_LOTE
+from api.models import CustomUser, Frase
+from api.referencias import indexar_frases
+
+
+class Command(BaseCommand):
+    help = 'Recria o índice de variáveis referenciadas pelas frases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Reindexa apenas as frases deste usuário')
+
+    def handle(self, *args, **options):
+        frases = Frase.objects.only('id', 'usuario_id', 'frase').order_by('id')
+
+        if options.get('email'):
+            usuario = CustomUser.objects.filter(email=options['email']).first()
+            if not usuario:
+                raise CommandError(f'Usuário {options["email"]} não encontrado')
+            frases = frases.filter(usuario=usuario)
+
+        total_frases = 0
+        total_referencias = 0
+        ultimo_id = 0
+
+        # Percorre as frases em lotes pela chave primária para manter a memória limitada
+        while True:
+            lote = list(frases.filter(id__gt=ultimo_id)[:TAMANHO_LOTE])
+            if not lote:
+                break
+            with transaction.atomic():
+                total_referencias += indexar_frases(lote)
+            total_frases += len(lote)
+            ultimo_id = lote[-1].id
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_frases} frase(s) reindexada(s), {total_referencias} referência(s) criada(s).'
+        ))
@@ -0,0 +1,157 @@
+"""
+Teste de carga dos endpoints de IA, para comparar a implantação WSGI (views
+síncronas do DRF) com a ASGI (views assíncronas de api/async_views.py).
+
+Dispara requisições simultâneas contra o servidor já em execução e mostra
+vazão, latências e, com --pid, o pico de memória (RSS) do servidor.
+
+Exemplo, com o provedor simulado (sem custo de API):
+    python manage.py provedor_simulado --latencia 3
+
+    # WSGI: 2 workers x 8 threads = 16 chamadas simultâneas no máximo
+    AI_BASE_URL_OPENROUTER=http://127.0.0.1:8765 \\
+        gunicorn laudos_backend.wsgi -w 2 --threads 8 -b 127.0.0.1:8000
+    python manage.py teste_carga http://127.0.0.1:8000/api/ia/gerar_laudo_radiologia/ \\
+        --email medico@exemplo.com --requisicoes 300 --concorrencia 150 --pid <pid do gunicorn>
+
+    # ASGI: 1 processo
+    AI_BASE_URL_OPENROUTER=http://127.0.0.1:8765 \\
+        uvicorn laudos_backend.asgi:application --port 8001
+    python manage.py teste_carga http://127.0.0.1:8001/api/ia/async/gerar_laudo_radiologia/ \\
+        --email medico@exemplo.com --requisicoes 300 --concorrencia 150 --pid <pid do uvicorn>
+
+Cada requisição usa um texto diferente para não ser atendida pelo cache de
+respostas. Os limites de uso (REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']) do
+servidor testado precisam ser altos o suficiente para o teste.
+"""
+import asyncio
+import math
+import os
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import CustomUser
+
+
+def _percentil(valores, percentual):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[max(math.ceil(percentual / 100 * len(ordenados)) - 1, 0)]
+
+
+def _rss_kb(pid):
+    """Memória residente (kB) do processo e de seus filhos (Linux, via /proc)"""
+    try:
+        with open(f'/proc/{pid}/status') as arquivo:
+            rss = next((int(linha.split()[1]) for linha in arquivo if linha.startswith('VmRSS:')), 0)
+        with open(f'/proc/{pid}/task/{pid}/children') as arquivo:
+            filhos = [int(filho) for filho in arquivo.read().split()]
+    except (OSError, ValueError):
+        return 0
+    return rss + sum(_rss_kb(filho) for filho in filhos)
+
+
+class Command(BaseCommand):
+    help = 'Teste de carga dos endpoints de IA (compara WSGI e ASGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL completa do endpoint (gerar_laudo_radiologia ou corrigir_texto)')
+        parser.add_argument('--requisicoes', type=int, default=200)
+        parser.add_argument('--concorrencia', type=int, default=100, help='Requisições em andamento ao mesmo tempo')
+        parser.add_argument('--email', help='Gera o token JWT para este usuário')
+        parser.add_argument('--token', help='Token JWT de acesso (alternativa a --email)')
+        parser.add_argument('--pid', type=int, action='append', default=[], help='PID do servidor para medir a memória')
+        parser.add_argument('--timeout', type=float, default=300)
+
+    def handle(self, *args, **options):
+        token = options.get('token')
+        if not token:
+            if not options.get('email'):
+                raise CommandError('Informe --email ou --token')
+            usuario = CustomUser.objects.filter(email=options['email']).first()
+            if not usuario:
+                raise CommandError(f'Usuário {options["email"]} não encontrado')
+            token = str(AccessToken.for_user(usuario))
+
+        resultado = asyncio.run(self._executar(token, options))
+        self._relatorio(resultado, options)
+
+    async def _executar(self, token, options):
+        concorrencia = options['concorrencia']
+        semaforo = asyncio.Semaphore(concorrencia)
+        identificador = uuid.uuid4().hex[:8]
+        latencias = []
+        status = Counter()
+        memoria = {'pico_kb': 0}
+        em_andamento = {'atual': 0, 'pico': 0}
+
+        async def medir_memoria():
+            while True:
+                memoria['pico_kb'] = max(memoria['pico_kb'], sum(_rss_kb(pid) for pid in options['pid']))
+                await asyncio.sleep(0.2)
+
+        async def requisicao(cliente, indice):
+            async with semaforo:
+                em_andamento['atual'] += 1
+                em_andamento['pico'] = max(em_andamento['pico'], em_andamento['atual'])
+                inicio = time.perf_counter()
+                try:
+                    resposta = await cliente.post(
+                        options['url'],
+                        json={'texto': f'Teste de carga {identificador} #{indice}: fígado normal'},
+                        headers={'Authorization': f'Bearer {token}'}
+                    )
+                    status[resposta.status_code] += 1
+                    if resposta.status_code == 200:
+                        latencias.append(time.perf_counter() - inicio)
+                except httpx.HTTPError as e:
+                    status[type(e).__name__] += 1
+                finally:
+                    em_andamento['atual'] -= 1
+
+        limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+        medidor = asyncio.create_task(medir_memoria()) if options['pid'] else None
+        inicio = time.perf_counter()
+        async with httpx.AsyncClient(timeout=options['timeout'], limits=limites) as cliente:
+            await asyncio.gather(*(requisicao(cliente, indice) for indice in range(options['requisicoes'])))
+        duracao = time.perf_counter() - inicio
+        if medidor:
+            medidor.cancel()
+
+        return {
+            'duracao': duracao,
+            'latencias': latencias,
+            'status': status,
+            'pico_em_andamento': em_andamento['pico'],
+            'pico_memoria_kb': memoria['pico_kb'],
+        }
+
+    def _relatorio(self, resultado, options):
+        latencias = resultado['latencias']
+        duracao = resultado['duracao']
+        sucesso = len(latencias)
+
+        self.stdout.write(f'URL: {options["url"]}')
+        self.stdout.write(f'Requisições: {options["requisicoes"]} (concorrência {options["concorrencia"]})')
+        self.stdout.write(f'Status: {dict(resultado["status"])}')
+        self.stdout.write(f'Duração total: {duracao:.2f}s')
+        self.stdout.write(f'Vazão: {sucesso / duracao:.2f} req/s bem-sucedidas')
+        if latencias:
+            media = sum(latencias) / len(latencias)
+            self.stdout.write(
+                f'Latência: p50 {_percentil(latencias, 50):.2f}s | p95 {_percentil(latencias, 95):.2f}s | '
+                f'p99 {_percentil(latencias, 99):.2f}s | máx {max(latencias):.2f}s'
+            )
+            # Lei de Little: quantas chamadas o servidor manteve em andamento, em média
+            self.stdout.write(f'Concorrência efetiva do servidor: {sucesso / duracao * media:.1f}')
+        if options['pid']:
+            if resultado['pico_memoria_kb']:
+                self.stdout.write(f'Pico de memória (RSS): {resultado["pico_memoria_kb"] / 1024:.1f} MB')
+            elif os.name != 'posix':
+                self.stdout.write('Medição de memória disponível apenas no Linux (/proc)')
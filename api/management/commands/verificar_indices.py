@@ -0,0 +1,165 @@
+"""
+Comando que roda EXPLAIN nas consultas feitas pelo FraseViewSet e falha se
+alguma delas fizer varredura completa de tabela (full scan).
+
+As consultas são montadas como nas views: get_queryset() do próprio
+FraseViewSet e visiveis()/frases_do_modelo() nas actions. Por padrão usa o
+primeiro usuário que não é o dono da biblioteca compartilhada, para que o
+modo 'compartilhada' (frases próprias OU do usuário semente) seja verificado.
+
+Uso:
+    python manage.py verificar_indices
+    python manage.py verificar_indices --email usuario@exemplo.com
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpRequest
+from rest_framework.request import Request
+
+from api.compartilhada import biblioteca_compartilhada_id, frases_do_modelo, visiveis
+from api.models import CustomUser, Frase, ModeloLaudo
+from api.views import FraseViewSet
+
+
+class Command(BaseCommand):
+    help = 'Executa EXPLAIN nas consultas do FraseViewSet e falha se alguma fizer full scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email',
+            help='Usuário cujos dados serão usados nos filtros '
+                 '(padrão: primeiro usuário que não é o dono da biblioteca compartilhada)'
+        )
+
+    def handle(self, *args, **options):
+        usuario, modelo_laudo_id, categoria, titulo_frase = self._parametros(options.get('email'))
+
+        semente_id = biblioteca_compartilhada_id()
+        if semente_id and semente_id != usuario.pk:
+            self.stdout.write(f'Usuário {usuario.pk} com a biblioteca compartilhada do usuário {semente_id}')
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Usuário {usuario.pk} sem biblioteca compartilhada: o modo compartilhado não será verificado'
+            ))
+
+        viewset = self._viewset(usuario, categoria=categoria, titulo_frase=titulo_frase)
+        frases = visiveis(Frase, usuario)
+
+        # Mesmas consultas emitidas por FraseViewSet (get_queryset e actions)
+        consultas = {
+            'get_queryset': viewset.get_queryset(),
+            'categorias_sem_metodos': frases.filter(
+                modelos_laudo__isnull=True
+            ).values_list('categoriaFrase', flat=True).distinct(),
+            'categorias': frases_do_modelo(
+                frases, modelo_laudo_id, usuario
+            ).values_list('categoriaFrase', flat=True).distinct(),
+            'titulos_frases': frases_do_modelo(
+                frases.filter(categoriaFrase=categoria), modelo_laudo_id, usuario
+            ).values_list('tituloFrase', flat=True).distinct(),
+        }
+        # Páginas na forma em que PaginacaoCursor as busca (uma consulta por dono)
+        paginadas = {
+            'list': self._viewset(usuario).get_queryset(),
+            'frases': frases.filter(
+                categoriaFrase=categoria,
+                tituloFrase=titulo_frase
+            ),
+            'por_modelo': frases_do_modelo(frases, modelo_laudo_id, usuario),
+        }
+        for nome, queryset in paginadas.items():
+            paginas = viewset.paginator.consultas_pagina(queryset, viewset.request)
+            for numero, pagina in enumerate(paginas, 1):
+                consultas[nome if len(paginas) == 1 else f'{nome} ({numero}/{len(paginas)})'] = pagina
+
+        falhas = []
+        for nome, queryset in consultas.items():
+            plano, tabelas_varridas = self._explicar(queryset)
+            self.stdout.write(f'--- {nome}')
+            for linha in plano:
+                self.stdout.write(f'    {linha}')
+
+            if tabelas_varridas:
+                falhas.append(nome)
+                self.stdout.write(self.style.ERROR(
+                    f'    Full scan em: {", ".join(tabelas_varridas)}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS('    OK'))
+
+        if falhas:
+            raise CommandError(f'Consultas com full scan: {", ".join(falhas)}')
+
+        self.stdout.write(self.style.SUCCESS('Todas as consultas usam índices.'))
+
+    def _parametros(self, email):
+        """Escolhe o usuário e valores reais do banco para os filtros, quando existirem"""
+        usuarios = CustomUser.objects.order_by('id')
+        if email:
+            usuario = usuarios.filter(email=email).first()
+            if not usuario:
+                raise CommandError(f'Usuário {email} não encontrado')
+        else:
+            usuario = usuarios.exclude(pk=biblioteca_compartilhada_id()).first() or usuarios.first()
+        if not usuario:
+            raise CommandError('Nenhum usuário cadastrado')
+
+        modelo_laudo_id = visiveis(ModeloLaudo, usuario).values_list('id', flat=True).first() or 0
+        frase = visiveis(Frase, usuario).values('categoriaFrase', 'tituloFrase').first() or {}
+
+        return (
+            usuario,
+            modelo_laudo_id,
+            frase.get('categoriaFrase', ''),
+            frase.get('tituloFrase', ''),
+        )
+
+    def _viewset(self, usuario, **parametros):
+        """FraseViewSet de uma listagem GET do usuário com os parâmetros informados"""
+        requisicao = HttpRequest()
+        requisicao.method = 'GET'
+        requisicao.GET.update(parametros)
+        request = Request(requisicao)
+        request.user = usuario
+        return FraseViewSet(request=request, action='list', args=(), kwargs={}, format_kwarg=None)
+
+    def _explicar(self, queryset):
+        """
+        Retorna as linhas do plano de execução e as tabelas lidas por inteiro.
+        Suporta SQLite, MySQL/MariaDB e PostgreSQL.
+        """
+        sql, params = queryset.query.sql_with_params()
+        vendor = connection.vendor
+
+        with connection.cursor() as cursor:
+            if vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                detalhes = [linha[-1] for linha in cursor.fetchall()]
+                # "SCAN tabela" sem índice é leitura completa; "SEARCH" usa índice
+                varridas = [
+                    detalhe.split()[1] for detalhe in detalhes
+                    if detalhe.startswith('SCAN') and 'INDEX' not in detalhe
+                ]
+                return detalhes, varridas
+
+            if vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}', params)
+                colunas = [coluna[0] for coluna in cursor.description]
+                linhas = [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+                detalhes = [
+                    f"{linha.get('table')}: type={linha.get('type')} key={linha.get('key')}"
+                    for linha in linhas
+                ]
+                varridas = [linha.get('table') for linha in linhas if linha.get('type') == 'ALL']
+                return detalhes, varridas
+
+            if vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}', params)
+                detalhes = [linha[0] for linha in cursor.fetchall()]
+                varridas = [
+                    detalhe.split(' on ')[1].split()[0] for detalhe in detalhes
+                    if 'Seq Scan on' in detalhe
+                ]
+                return detalhes, varridas
+
+        raise CommandError(f'Banco de dados "{vendor}" não suportado pelo comando')
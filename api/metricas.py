@@ -0,0 +1,227 @@
+"""
+Estatísticas das chamadas aos provedores de IA (latência, erros e tokens)
+
+Os números são do processo atual e ficam em janelas com as chamadas mais
+recentes. São usados pelo roteamento (prazo do hedge e disjuntores) e expostos
+no endpoint /api/ia/metricas/.
+
+Cada requisição HTTP a um provedor também é registrada individualmente no
+logger 'api.ia' (uma linha JSON por evento), separando o tempo esperando vaga
+(nosso servidor), o tempo até o primeiro byte e a duração total.
+"""
+import json
+import logging
+import math
+import threading
+from collections import Counter, defaultdict, deque
+
+logger = logging.getLogger('api.ia')
+
+
+def _percentil(amostras, percentual):
+    """Percentil de uma lista já ordenada (None se vazia)"""
+    if not amostras:
+        return None
+    return amostras[max(math.ceil(percentual / 100 * len(amostras)) - 1, 0)]
+
+
+def _arredondar(valor, casas=3):
+    return round(valor, casas) if valor is not None else None
+
+
+class RegistroMetricas:
+    """Latências e resultados recentes por provedor, seguro entre threads"""
+
+    def __init__(self, tamanho_janela=200):
+        self.tamanho_janela = tamanho_janela
+        self._latencias = defaultdict(lambda: deque(maxlen=self.tamanho_janela))
+        self._requisicoes = Counter()
+        self._falhas = Counter()
+        self._tokens = defaultdict(Counter)
+        self._chamadas = defaultdict(self._nova_janela_chamadas)
+        self._trava = threading.Lock()
+
+    def _nova_janela_chamadas(self):
+        return {
+            'duracoes': deque(maxlen=self.tamanho_janela),
+            'ttfb': deque(maxlen=self.tamanho_janela),
+            'espera_vaga': deque(maxlen=self.tamanho_janela),
+            'contadores': Counter(),
+            'status': Counter(),
+        }
+
+    def registrar(self, provedor, duracao, sucesso):
+        """Registra uma chamada ao provedor; duracao em segundos"""
+        with self._trava:
+            self._requisicoes[provedor] += 1
+            if sucesso:
+                self._latencias[provedor].append(duracao)
+            else:
+                self._falhas[provedor] += 1
+
+    def registrar_uso(self, provedor, uso):
+        """Soma os tokens de uma resposta (tokens_entrada, tokens_saida, tokens_cache)"""
+        with self._trava:
+            self._tokens[provedor].update({chave: valor or 0 for chave, valor in uso.items()})
+
+    def registrar_chamada(self, provedor, modelo, duracao, status=None, ttfb=None, espera_vaga=None,
+                          uso=None, tentativas=1, stream=False, erro=None):
+        """
+        Registra uma requisição HTTP ao provedor (por provedor e modelo) e a
+        grava no log. status é o código HTTP (None se não houve resposta),
+        ttfb o tempo até o primeiro byte (no streaming, até o primeiro trecho
+        de texto), espera_vaga o tempo esperando vaga antes do envio e
+        tentativas o número de envios feitos.
+        """
+        sucesso = status == 200 and erro is None
+        with self._trava:
+            janela = self._chamadas[(provedor, modelo or '')]
+            janela['contadores']['chamadas'] += 1
+            janela['contadores']['tentativas'] += tentativas
+            if not sucesso:
+                janela['contadores']['falhas'] += 1
+            janela['status'][str(status) if status is not None else 'sem_resposta'] += 1
+            if sucesso:
+                janela['duracoes'].append(duracao)
+                if ttfb is not None:
+                    janela['ttfb'].append(ttfb)
+            if espera_vaga is not None:
+                janela['espera_vaga'].append(espera_vaga)
+            if uso:
+                janela['contadores'].update({chave: valor or 0 for chave, valor in uso.items()})
+        if uso:
+            self.registrar_uso(provedor, uso)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'evento': 'ia.chamada',
+                'provedor': provedor,
+                'modelo': modelo,
+                'status': status,
+                'duracao': _arredondar(duracao),
+                'ttfb': _arredondar(ttfb),
+                'espera_vaga': _arredondar(espera_vaga),
+                'tentativas': tentativas,
+                'stream': stream,
+                **(uso or {}),
+                **({'erro': erro} if erro else {}),
+            }, ensure_ascii=False))
+
+    def registrar_acerto_cache(self, provedor, modelo, cache):
+        """Registra uma resposta servida pelo cache (cache: 'respostas' ou 'correcoes')"""
+        with self._trava:
+            self._chamadas[(provedor, modelo or '')]['contadores']['acertos_cache'] += 1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'evento': 'ia.cache',
+                'provedor': provedor,
+                'modelo': modelo,
+                'cache': cache,
+            }, ensure_ascii=False))
+
+    def registrar_retentativa(self, provedor, modelo, motivo, espera, tentativa):
+        """Registra no log uma tentativa que falhou e será repetida após espera segundos"""
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(json.dumps({
+                'evento': 'ia.retentativa',
+                'provedor': provedor,
+                'modelo': modelo,
+                'motivo': motivo,
+                'tentativa': tentativa,
+                'espera': _arredondar(espera),
+            }, ensure_ascii=False))
+
+    def registrar_deduplicada(self, provedor, modelo):
+        """Registra uma requisição atendida pela chamada idêntica já em andamento"""
+        with self._trava:
+            self._chamadas[(provedor, modelo or '')]['contadores']['deduplicadas'] += 1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'evento': 'ia.deduplicada',
+                'provedor': provedor,
+                'modelo': modelo,
+            }, ensure_ascii=False))
+
+    def percentil(self, provedor, percentual, minimo_amostras=1):
+        """
+        Percentil das latências das chamadas bem-sucedidas recentes, ou None
+        se ainda não há amostras suficientes.
+        """
+        with self._trava:
+            amostras = sorted(self._latencias.get(provedor, ()))
+        if len(amostras) < max(minimo_amostras, 1):
+            return None
+        return _percentil(amostras, percentual)
+
+    def estatisticas(self):
+        """Requisições, falhas, latências (p50/p95/p99) e tokens por provedor"""
+        with self._trava:
+            provedores = sorted(set(self._requisicoes) | set(self._tokens))
+            tokens = {provedor: dict(contagem) for provedor, contagem in self._tokens.items()}
+        por_provedor = {}
+        for provedor in provedores:
+            requisicoes, falhas = self._requisicoes[provedor], self._falhas[provedor]
+            por_provedor[provedor] = {
+                'requisicoes': requisicoes,
+                'falhas': falhas,
+                'taxa_erro': round(falhas / requisicoes, 4) if requisicoes else 0.0,
+                'latencia_p50': _arredondar(self.percentil(provedor, 50)),
+                'latencia_p95': _arredondar(self.percentil(provedor, 95)),
+                'latencia_p99': _arredondar(self.percentil(provedor, 99)),
+            }
+            if provedor in tokens:
+                uso = tokens[provedor]
+                entrada = uso.get('tokens_entrada', 0)
+                por_provedor[provedor].update(uso)
+                # Fração dos tokens de entrada servida pelo cache de prompt do provedor
+                por_provedor[provedor]['taxa_tokens_cache'] = (
+                    round(uso.get('tokens_cache', 0) / entrada, 4) if entrada else 0.0
+                )
+        return por_provedor
+
+    def estatisticas_chamadas(self):
+        """
+        Requisições HTTP por provedor e modelo: contadores, códigos de status,
+        tokens e p50/p95/p99 da duração, do tempo até o primeiro byte e da
+        espera por vaga.
+        """
+        with self._trava:
+            copias = {
+                chave: {
+                    'duracoes': sorted(janela['duracoes']),
+                    'ttfb': sorted(janela['ttfb']),
+                    'espera_vaga': sorted(janela['espera_vaga']),
+                    'contadores': dict(janela['contadores']),
+                    'status': dict(janela['status']),
+                }
+                for chave, janela in self._chamadas.items()
+            }
+
+        por_provedor = {}
+        for (provedor, modelo), janela in sorted(copias.items()):
+            contadores = janela['contadores']
+            chamadas = contadores.get('chamadas', 0)
+            estatisticas = {
+                'chamadas': chamadas,
+                'falhas': contadores.get('falhas', 0),
+                'taxa_erro': round(contadores.get('falhas', 0) / chamadas, 4) if chamadas else 0.0,
+                # Envios além do primeiro (novas tentativas após erro)
+                'retentativas': contadores.get('tentativas', 0) - chamadas,
+                'acertos_cache': contadores.get('acertos_cache', 0),
+                # Requisições que aproveitaram uma chamada idêntica em andamento
+                'deduplicadas': contadores.get('deduplicadas', 0),
+                'status': janela['status'],
+            }
+            for chave in ('tokens_entrada', 'tokens_saida', 'tokens_cache'):
+                estatisticas[chave] = contadores.get(chave, 0)
+            for medida in ('duracoes', 'ttfb', 'espera_vaga'):
+                nome = 'latencia' if medida == 'duracoes' else medida
+                for percentual in (50, 95, 99):
+                    estatisticas[f'{nome}_p{percentual}'] = _arredondar(
+                        _percentil(janela[medida], percentual)
+                    )
+            por_provedor.setdefault(provedor, {})[modelo or 'desconhecido'] = estatisticas
+        return por_provedor
+
+
+registro = RegistroMetricas()
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-17 23:45
+
+from django.db import migrations, models
+
+# A tabela intermediária do ManyToMany é criada automaticamente pelo Django e só
+# possui o índice único (frase_id, modelolaudo_id). As consultas do editor partem
+# do modelo de laudo, então é preciso também o índice na ordem inversa.
+INDICE_MODELO_FRASE = models.Index(
+    fields=['modelolaudo', 'frase'],
+    name='frase_modelos_mod_frase_idx',
+)
+
+
+def criar_indice_modelo_frase(apps, schema_editor):
+    Frase = apps.get_model('api', 'Frase')
+    schema_editor.add_index(Frase.modelos_laudo.through, INDICE_MODELO_FRASE)
+
+
+def remover_indice_modelo_frase(apps, schema_editor):
+    Frase = apps.get_model('api', 'Frase')
+    schema_editor.remove_index(Frase.modelos_laudo.through, INDICE_MODELO_FRASE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_remove_frase_modelo_laudo_frase_modelos_laudo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='frase',
+            index=models.Index(fields=['usuario', 'categoriaFrase', 'tituloFrase'], name='frase_usr_cat_tit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variavel',
+            index=models.Index(fields=['usuario', 'tituloVariavel'], name='variavel_usr_titulo_idx'),
+        ),
+        migrations.RunPython(criar_indice_modelo_frase, remover_indice_modelo_frase),
+    ]
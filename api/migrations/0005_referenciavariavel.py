@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 23:50
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Cópia das regras de api/utils.py na data desta migração: migrações não
+# importam código do app, que pode mudar depois
+PADRAO_VARIAVEL = re.compile(r'\{([^{}]+)\}')
+
+
+def variaveis_da_frase(conteudo):
+    """Títulos das variáveis do fraseBase da frase, sem repetição"""
+    frase_base = conteudo.get('fraseBase', '') if isinstance(conteudo, dict) else ''
+    if not frase_base or not isinstance(frase_base, str):
+        return []
+    return list(dict.fromkeys(PADRAO_VARIAVEL.findall(frase_base)))
+
+
+def indexar_frases_existentes(apps, schema_editor):
+    Frase = apps.get_model('api', 'Frase')
+    ReferenciaVariavel = apps.get_model('api', 'ReferenciaVariavel')
+
+    referencias = []
+    for frase in Frase.objects.only('id', 'usuario_id', 'frase').iterator(chunk_size=1000):
+        for titulo in variaveis_da_frase(frase.frase):
+            if len(titulo) <= 255:
+                referencias.append(ReferenciaVariavel(
+                    frase_id=frase.id, usuario_id=frase.usuario_id, tituloVariavel=titulo
+                ))
+        if len(referencias) >= 1000:
+            ReferenciaVariavel.objects.bulk_create(referencias, ignore_conflicts=True)
+            referencias = []
+    ReferenciaVariavel.objects.bulk_create(referencias, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_indices_frase_variavel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenciaVariavel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tituloVariavel', models.CharField(max_length=255)),
+                ('frase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='referencias_variaveis', to='api.frase')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'tituloVariavel'], name='referencia_usr_titulo_idx')],
+                'constraints': [models.UniqueConstraint(fields=('frase', 'tituloVariavel'), name='referencia_frase_variavel_unica')],
+            },
+        ),
+        migrations.RunPython(indexar_frases_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-18 00:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemOculto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('modelo', 'Modelo de laudo'), ('frase', 'Frase'), ('variavel', 'Variável')], max_length=20)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='frase',
+            name='origem',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copias', to='api.frase'),
+        ),
+        migrations.AddField(
+            model_name='modelolaudo',
+            name='origem',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copias', to='api.modelolaudo'),
+        ),
+        migrations.AddField(
+            model_name='variavel',
+            name='origem',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copias', to='api.variavel'),
+        ),
+        migrations.AddConstraint(
+            model_name='frase',
+            constraint=models.UniqueConstraint(fields=('usuario', 'origem'), name='frase_usr_origem_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='modelolaudo',
+            constraint=models.UniqueConstraint(fields=('usuario', 'origem'), name='modelo_usr_origem_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='variavel',
+            constraint=models.UniqueConstraint(fields=('usuario', 'origem'), name='variavel_usr_origem_unica'),
+        ),
+        migrations.AddField(
+            model_name='itemoculto',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='itemoculto',
+            constraint=models.UniqueConstraint(fields=('usuario', 'tipo', 'objeto_id'), name='item_oculto_unico'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_biblioteca_compartilhada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='frase',
+            index=models.Index(fields=['usuario', 'atualizado_em', 'id'], name='frase_usr_atualizado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='modelolaudo',
+            index=models.Index(fields=['usuario', 'atualizado_em', 'id'], name='modelo_usr_atualizado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='variavel',
+            index=models.Index(fields=['usuario', 'atualizado_em', 'id'], name='variavel_usr_atualizado_idx'),
+        ),
+    ]
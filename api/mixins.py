@@ -0,0 +1,155 @@
+"""
+Mixins reutilizáveis pelas ViewSets
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+class ETagMixin:
+    """
+    GET condicional (ETag / If-None-Match) para list e retrieve.
+
+    A ETag da listagem é derivada de MAX(atualizado_em) e da contagem de linhas do
+    queryset do usuário, calculados com uma única consulta agregada. Se o cliente
+    enviar a mesma ETag em If-None-Match, a resposta é 304 sem serializar nada.
+    """
+
+    def versao_etag(self):
+        """
+        Componente extra da ETag para mudanças que não alteram atualizado_em
+        (ex.: vínculos ManyToMany). As subclasses podem sobrescrever.
+        """
+        return ''
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        resumo = queryset.order_by().aggregate(
+            ultima_atualizacao=Max('atualizado_em'),
+            total=Count('pk')
+        )
+        ultima_atualizacao = resumo['ultima_atualizacao']
+
+        etag = self._gerar_etag(request, ultima_atualizacao, resumo['total'])
+        if self._etag_corresponde(request, etag):
+            return self._resposta_nao_modificada(etag, ultima_atualizacao)
+
+        response = super().list(request, *args, **kwargs)
+        return self._aplicar_cabecalhos(response, etag, ultima_atualizacao)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        ultima_atualizacao = instance.atualizado_em
+
+        etag = self._gerar_etag(request, ultima_atualizacao, instance.pk)
+        if self._etag_corresponde(request, etag):
+            return self._resposta_nao_modificada(etag, ultima_atualizacao)
+
+        serializer = self.get_serializer(instance)
+        response = Response(serializer.data)
+        return self._aplicar_cabecalhos(response, etag, ultima_atualizacao)
+
+    def _gerar_etag(self, request, ultima_atualizacao, contador):
+        # O caminho completo entra na ETag porque filtros e paginação mudam o conteúdo
+        partes = [
+            self.get_queryset().model._meta.label,
+            str(request.user.pk),
+            request.get_full_path(),
+            ultima_atualizacao.isoformat() if ultima_atualizacao else '',
+            str(contador),
+            str(self.versao_etag()),
+        ]
+        digest = hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest()
+        return f'"{digest[:32]}"'
+
+    def _etag_corresponde(self, request, etag):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        # If-None-Match usa comparação fraca: ignora o prefixo W/
+        return '*' in etags or etag in [e.removeprefix('W/') for e in etags]
+
+    def _resposta_nao_modificada(self, etag, ultima_atualizacao):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        return self._aplicar_cabecalhos(response, etag, ultima_atualizacao)
+
+    def _aplicar_cabecalhos(self, response, etag, ultima_atualizacao):
+        response['ETag'] = etag
+        if ultima_atualizacao:
+            response['Last-Modified'] = http_date(ultima_atualizacao.timestamp())
+        # Permite que o navegador guarde a resposta, mas sempre revalide com If-None-Match
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class CamposSelecionaveisMixin:
+    """
+    Campos esparsos nas leituras: ?fields=id,titulo devolve só esses campos e
+    ?omit=texto devolve todos menos esses (nomes separados por vírgula; um nome
+    desconhecido é respondido com 400 e a lista dos válidos). As colunas que não serão serializadas também
+    não são lidas do banco (.only()), o que poupa os campos grandes (texto do
+    modelo, JSON da frase) nas telas de listagem.
+
+    O serializer precisa de CamposSelecionaveisSerializerMixin.
+    """
+    acoes_campos_selecionaveis = ('list', 'retrieve')
+    # Sempre lidas: usadas pela paginação por cursor e pela ETag
+    colunas_obrigatorias = ('id', 'atualizado_em')
+
+    def campos_selecionados(self):
+        """Lista dos campos pedidos, ou None se a requisição não restringe os campos"""
+        if self.request.method not in ('GET', 'HEAD') or self.action not in self.acoes_campos_selecionaveis:
+            return None
+        incluir = self.request.query_params.get('fields')
+        omitir = self.request.query_params.get('omit')
+        if not incluir and not omitir:
+            return None
+
+        campos = list(self.get_serializer_class().Meta.fields)
+        if incluir:
+            pedidos = self._nomes_campos('fields', incluir)
+            campos = [campo for campo in campos if campo in pedidos]
+        if omitir:
+            omitidos = self._nomes_campos('omit', omitir)
+            campos = [campo for campo in campos if campo not in omitidos]
+        return campos
+
+    def _nomes_campos(self, parametro, valor):
+        """Nomes do parâmetro; ValidationError (400) se algum não é campo do serializer"""
+        validos = self.get_serializer_class().Meta.fields
+        nomes = {nome.strip() for nome in valor.split(',')} - {''}
+        desconhecidos = sorted(nomes - set(validos))
+        if desconhecidos:
+            raise ValidationError({parametro: [
+                f"Campos desconhecidos: {', '.join(desconhecidos)}. Campos válidos: {', '.join(validos)}"
+            ]})
+        return nomes
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Valida ?fields=/?omit= antes da action, cujo try/except responderia 500
+        self.campos_selecionados()
+
+    def selecionar_colunas(self, queryset):
+        """Restringe as colunas lidas às dos campos pedidos"""
+        campos = self.campos_selecionados()
+        if campos is None:
+            return queryset
+        concretos = {campo.name for campo in queryset.model._meta.concrete_fields}
+        return queryset.only(*{campo for campo in campos if campo in concretos}, *self.colunas_obrigatorias)
+
+    def filter_queryset(self, queryset):
+        return self.selecionar_colunas(super().filter_queryset(queryset))
+
+    def get_serializer_context(self):
+        contexto = super().get_serializer_context()
+        campos = self.campos_selecionados()
+        if campos is not None:
+            contexto['campos'] = campos
+        return contexto
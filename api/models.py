@@ -23,9 +23,20 @@ class ModeloLaudo(models.Model):
     texto = models.TextField()
     metodo = models.ForeignKey(Metodo, on_delete=models.CASCADE)
     usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # Modelo da biblioteca compartilhada do qual este é a cópia editada pelo usuário
+    origem = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='copias')
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'origem'], name='modelo_usr_origem_unica'),
+        ]
+        indexes = [
+            # Paginação por cursor (atualizado_em, id) das listagens
+            models.Index(fields=['usuario', 'atualizado_em', 'id'], name='modelo_usr_atualizado_idx'),
+        ]
+
     def __str__(self):
         return self.titulo
 
@@ -35,9 +46,21 @@ class Frase(models.Model):
     frase = models.JSONField()
     modelos_laudo = models.ManyToManyField(ModeloLaudo, blank=True)
     usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    origem = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='copias')
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'origem'], name='frase_usr_origem_unica'),
+        ]
+        indexes = [
+            # Atende os filtros por categoria/título dos endpoints do editor de laudos
+            models.Index(fields=['usuario', 'categoriaFrase', 'tituloFrase'], name='frase_usr_cat_tit_idx'),
+            # Paginação por cursor (atualizado_em, id) das listagens
+            models.Index(fields=['usuario', 'atualizado_em', 'id'], name='frase_usr_atualizado_idx'),
+        ]
+
     def __str__(self):
         return f"{self.tituloFrase} - {self.categoriaFrase}"
 
@@ -45,8 +68,88 @@ class Variavel(models.Model):
     tituloVariavel = models.CharField(max_length=255)
     variavel = models.JSONField()
     usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    origem = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='copias')
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'origem'], name='variavel_usr_origem_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['usuario', 'tituloVariavel'], name='variavel_usr_titulo_idx'),
+            models.Index(fields=['usuario', 'atualizado_em', 'id'], name='variavel_usr_atualizado_idx'),
+        ]
+
     def __str__(self):
         return self.tituloVariavel
+
+class ReferenciaVariavel(models.Model):
+    """Índice das variáveis ({Título}) referenciadas no fraseBase de cada frase"""
+    frase = models.ForeignKey(Frase, on_delete=models.CASCADE, related_name='referencias_variaveis')
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    tituloVariavel = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['frase', 'tituloVariavel'], name='referencia_frase_variavel_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['usuario', 'tituloVariavel'], name='referencia_usr_titulo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.frase_id} → {{{self.tituloVariavel}}}"
+
+class ItemOculto(models.Model):
+    """Registro da biblioteca compartilhada que o usuário excluiu da sua visão"""
+    TIPO_CHOICES = [
+        ('modelo', 'Modelo de laudo'),
+        ('frase', 'Frase'),
+        ('variavel', 'Variável'),
+    ]
+
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    objeto_id = models.PositiveBigIntegerField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'tipo', 'objeto_id'], name='item_oculto_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.objeto_id} oculto para {self.usuario_id}"
+
+class Tarefa(models.Model):
+    """Tarefa executada em segundo plano pelo comando processar_tarefas"""
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    # Provedor de IA usado pela tarefa; limita quantas rodam ao mesmo tempo
+    provedor = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    parametros = models.JSONField(default=dict)
+    resultado = models.JSONField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    progresso = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'criado_em'], name='tarefa_status_criado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.status})"
@@ -0,0 +1,133 @@
+"""
+Paginação por cursor (keyset) das listagens
+
+As páginas são ordenadas por (atualizado_em, id) e o cursor guarda a posição
+do último item entregue, então cada página é uma consulta
+WHERE (atualizado_em, id) > cursor ORDER BY atualizado_em, id LIMIT n: o custo
+não cresce com a página pedida, ao contrário de OFFSET. A ordem é estável: um
+item alterado durante a navegação vai para o fim e reaparece em uma página
+seguinte, mas nenhum item é pulado.
+
+Com a biblioteca compartilhada o queryset das views é um OR entre os
+registros do usuário e os do usuário semente, que o banco não percorre pelo
+índice (usuario, atualizado_em, id) na ordem da página (o SQLite, por
+exemplo, junta as duas buscas e ordena tudo em uma B-tree temporária). Por
+isso cada dono é paginado em separado, com uma busca por faixa no índice
+limitada à página, e as duas listas já ordenadas são intercaladas.
+
+O tamanho da página vem de settings.PAGINACAO_TAMANHO e pode ser alterado
+com ?page_size=, até settings.PAGINACAO_TAMANHO_MAXIMO.
+"""
+import base64
+import binascii
+import heapq
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .compartilhada import donos_visiveis
+
+
+class PaginacaoCursor(BasePagination):
+    """Paginação keyset em (atualizado_em, id), só para frente"""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    campo_ordenacao = 'atualizado_em'
+    proximo = None
+
+    def obter_tamanho_pagina(self, request):
+        tamanho = getattr(settings, 'PAGINACAO_TAMANHO', 100)
+        try:
+            tamanho = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            pass
+        return min(max(tamanho, 1), getattr(settings, 'PAGINACAO_TAMANHO_MAXIMO', 500))
+
+    def codificar_cursor(self, objeto):
+        posicao = [getattr(objeto, self.campo_ordenacao).isoformat(), objeto.pk]
+        return base64.urlsafe_b64encode(json.dumps(posicao).encode('utf-8')).decode('ascii')
+
+    def decodificar_cursor(self, cursor):
+        """Retorna (valor do campo de ordenação, id) ou None sem cursor"""
+        if not cursor:
+            return None
+        try:
+            valor, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            valor = parse_datetime(valor)
+            if valor is None or not isinstance(pk, int):
+                raise ValueError(cursor)
+        except (binascii.Error, UnicodeError, TypeError, ValueError):
+            raise NotFound('Cursor inválido')
+        return valor, pk
+
+    def donos(self, queryset, request):
+        """Donos (usuario_id) paginados em separado, ou None se o modelo não tem usuário"""
+        try:
+            queryset.model._meta.get_field('usuario')
+        except FieldDoesNotExist:
+            return None
+        return donos_visiveis(request.user)
+
+    def consultas_pagina(self, queryset, request):
+        """
+        Consultas de uma página (até tamanho_pagina + 1 linhas cada, já
+        ordenadas): uma por dono quando há mais de um, senão uma só.
+        """
+        self.request = request
+        self.tamanho_pagina = self.obter_tamanho_pagina(request)
+        campo = self.campo_ordenacao
+
+        queryset = queryset.order_by(campo, 'pk')
+        posicao = self.decodificar_cursor(request.query_params.get(self.cursor_query_param))
+        if posicao:
+            valor, pk = posicao
+            queryset = queryset.filter(Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'pk__gt': pk}))
+
+        # Um item a mais indica se existe próxima página, sem COUNT
+        limite = self.tamanho_pagina + 1
+        donos = self.donos(queryset, request)
+        if not donos or len(donos) == 1:
+            return [queryset[:limite]]
+        return [queryset.filter(usuario_id=dono)[:limite] for dono in donos]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        consultas = self.consultas_pagina(queryset, request)
+        if len(consultas) == 1:
+            pagina = list(consultas[0])
+        else:
+            campo = self.campo_ordenacao
+            pagina = list(islice(
+                heapq.merge(*consultas, key=lambda objeto: (getattr(objeto, campo), objeto.pk)),
+                self.tamanho_pagina + 1
+            ))
+
+        self.proximo = pagina[self.tamanho_pagina - 1] if len(pagina) > self.tamanho_pagina else None
+        return pagina[:self.tamanho_pagina]
+
+    def get_next_link(self):
+        if self.proximo is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.codificar_cursor(self.proximo)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,16 @@
+"""
+Parsers adicionais do REST Framework
+"""
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Corpo em NDJSON (um objeto JSON por linha). O corpo não é lido aqui:
+    request.data é o próprio stream da requisição, percorrido linha a linha
+    por quem o consome, sem carregar o arquivo inteiro na memória.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
@@ -0,0 +1,146 @@
+"""
+Registro dos prompts enviados aos provedores de IA
+
+Cada prompt é separado em instruções fixas (enviadas como mensagem de sistema,
+sempre com o mesmo texto, o que permite ao provedor reaproveitar o prefixo em
+cache) e na parte variável com o texto ditado (mensagem do usuário).
+
+Os prompts são versionados: ao alterar o texto de um prompt, registre uma nova
+versão em vez de editar a existente. A versão entra na chave do cache de
+respostas, então respostas geradas com instruções antigas não são reutilizadas.
+Por padrão é usada a versão mais recente; settings.AI_PROMPTS_VERSOES fixa
+outra versão por nome.
+
+Os prompts gerados pelo roteamento (fallback e hedge) definem o orçamento de
+saída (max_tokens) do seu caso de uso. Ele precisa caber nos modelos de
+settings.AI_ROTEAMENTO['MODELOS'] e em HEDGE_MAXIMO_TOKENS; caso contrário os
+provedores menores saem do fallback e o hedge não é usado.
+"""
+import string
+import textwrap
+
+from django.conf import settings
+
+
+class ModeloPrompt:
+    """Prompt versionado: instruções de sistema + modelo da mensagem do usuário"""
+
+    def __init__(self, nome, versao, sistema, usuario, max_tokens=None):
+        self.nome = nome
+        self.versao = versao
+        # Orçamento de saída do caso de uso (None: o padrão do provedor)
+        self.max_tokens = max_tokens
+        self.sistema = textwrap.dedent(sistema).strip()
+        self.usuario = textwrap.dedent(usuario).strip()
+        # Instruções sem campos são montadas uma única vez, aqui
+        self._sistema_tem_campos = any(
+            campo is not None for _, campo, _, _ in string.Formatter().parse(self.sistema)
+        )
+
+    @property
+    def identificador(self):
+        return f'{self.nome}@v{self.versao}'
+
+    def montar(self, **variaveis):
+        """Retorna (sistema, usuario) com as variáveis preenchidas"""
+        sistema = self.sistema.format(**variaveis) if self._sistema_tem_campos else self.sistema
+        return sistema, self.usuario.format(**variaveis)
+
+
+_prompts = {}
+
+
+def registrar_prompt(nome, versao, sistema, usuario, max_tokens=None):
+    prompt = ModeloPrompt(nome, versao, sistema, usuario, max_tokens)
+    _prompts.setdefault(nome, {})[versao] = prompt
+    return prompt
+
+
+def obter_prompt(nome):
+    """Retorna a versão ativa do prompt"""
+    versoes = _prompts.get(nome)
+    if not versoes:
+        raise ValueError(f"Prompt '{nome}' não registrado")
+    versao = getattr(settings, 'AI_PROMPTS_VERSOES', {}).get(nome, max(versoes))
+    if versao not in versoes:
+        raise ValueError(f"Versão {versao} do prompt '{nome}' não registrada")
+    return versoes[versao]
+
+
+registrar_prompt(
+    'laudo_radiologia',
+    versao=1,
+    sistema="""
+        Sou Radiologista e quero que vc me ajude a agilizar a minha confecção de laudos. Quando eu pedir para vc fazer um laudo, ele deve vim nesse formato:
+        Fonte de todo o texto: Arial 12
+        Se eu falar o nome do paciente, vc coloca antes de tudo Nome: e o nome que eu falar. Se eu não falar nada, não precisa colocar
+        Titulo em Negrito e Maiúsculo, centralizado
+        Depois vc escreve Indicação Clínica em negrito e maíusculo. Se nenhuma indicação for fornecida, vc coloca "Avaliação Clínica"
+        para colocar a técnica do exame, vc escreve TÉCNICA em negrito e maiúsculo, dois pontos e depois escreve a técnica do exame. em exames de ultrassonografia, descrever a técnica em modo B e apenas citar o uso ou não do estudo com doppler se for mencionado.
+        Depois coloca laudo: , em maiúsculo e negrito
+        No laudo deve ser colocada a descrição de todas as estruturas que a região estudada contém, e não apenas as alterações.
+        Depois o laudo, sem hífens ou bullets nos parágrafos. se for preciso, usar numeros para enumerar achados.
+        Depois vc escreve impressão diagnóstica: em negrito e maiúsculo e depois faz um resumo dos achados do laudo.
+        Cada achado deve ficar em uma linha separada e não é preciso repetir as medidas do achado na conclusão.
+        Na conclusão não é para colocar nenhuma medida
+
+        Considerações específicas para cada laudo:
+        1. Em laudos de ultrassonografia de mamas, as descrições dos nódulos devem seguir o léxico do birads. Deve-se colocar, abaixo da conclusão: BI-RADS: X (X é o birads do exame de acordo com os achados). Abaixo disso colocar as Recomendações de acordo com o BIRADS e com o documento do ACR BIRADS
+        2. não é para falar nada de próstata em ultrassonografia do aparelho urinário exceto se for dito o contrário
+        3. não falar de ligamentos cruzados e meniscos em ultrassonografia de joelho
+    """,
+    usuario="""
+        Informações fornecidas pelo médico:
+        {texto}
+
+        Gere o laudo radiológico completo seguindo rigorosamente o formato especificado.
+    """,
+    # Um laudo completo fica bem abaixo disso
+    max_tokens=4096,
+)
+
+registrar_prompt(
+    'texto_medico',
+    versao=1,
+    sistema="""
+        Retorne o texto em Markdown com as respectivas formatações.
+
+        Usando o contexto fornecido, gere o laudo radiológico completo seguindo rigorosamente as instruções abaixo:
+        Fonte do texto: Arial 12
+        Titulo do laudo em Negrito e Maiúsculo, centralizado
+        Depois vc escreve Indicação Clínica em negrito e maíusculo. Se nenhuma indicação for fornecida, vc coloca "Avaliação Clínica"
+        para colocar a técnica do exame, vc escreve TÉCNICA em negrito e maiúsculo, dois pontos e depois escreve a técnica do exame. em exames de ultrassonografia, descrever a técnica em modo B e apenas citar o uso ou não do estudo com doppler se for mencionado.
+        Depois coloca laudo: , em maiúsculo e negrito
+        No laudo deve ser colocada a descrição de todas as estruturas que a região estudada contém, e não apenas as alterações.
+        Depois o laudo, sem hífens ou bullets nos parágrafos. se for preciso, usar numeros para enumerar achados.
+        Depois vc escreve impressão diagnóstica: em negrito e maiúsculo e depois faz um resumo dos achados do laudo.
+        Cada achado deve ficar em uma linha separada e não é preciso repetir as medidas do achado na conclusão.
+        Na conclusão não é para colocar nenhuma medida.
+
+        Considerações específicas para cada laudo:
+        1. Em laudos de ultrassonografia de mamas, as descrições dos nódulos devem seguir o léxico do birads. Deve-se colocar, abaixo da conclusão: BI-RADS: X (X é o birads do exame de acordo com os achados). Abaixo disso colocar as Recomendações de acordo com o BIRADS e com o documento do ACR BIRADS
+        2. não é para falar nada de próstata em ultrassonografia do aparelho urinário exceto se for dito o contrário
+        3. não falar de ligamentos cruzados e meniscos em ultrassonografia de joelho
+    """,
+    usuario="""
+        Contexto: {texto}
+    """,
+    max_tokens=4096,
+)
+
+registrar_prompt(
+    'correcao_texto',
+    versao=1,
+    sistema="""
+        Você é um assistente especialista em corrigir transcrições de laudos médicos radiológicos em português.
+        Sua tarefa é apenas pontuar corretamente, e corrigir a gramática e os termos técnicos radiológicos do texto fornecido.
+        Regras:
+        1. NÃO adicione nenhum texto extra, explicação ou "Aqui está". Retorne APENAS o texto corrigido.
+        2. Mantenha o sentido técnico médico e radiológico.
+        3. Insira vírgulas, pontos e outros sinais de pontuação onde gramaticalmente necessário.
+        4. As medidas devem ser em centímetros, a menos que seja especificado outro tipo de medida, e devem estar no seguinte formato: A x B cm (A e B são as medidas). Ordenar as medidas da maior para a menor.
+        5. Se o usuário pedir uma descrição detalhada de uma estrutura ou alteração patológica, deve ser colocada a descrição detalhada da estrutura e/ou da alteração.
+        6. {capitalizacao}
+    """,
+    usuario="{texto}",
+)
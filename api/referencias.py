@@ -0,0 +1,93 @@
+"""
+Manutenção do índice de variáveis referenciadas pelas frases (ReferenciaVariavel)
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Frase, ReferenciaVariavel
+from .utils import extrair_variaveis, obter_frase_base
+from .bulk import TAMANHO_LOTE
+from .caching import invalidar_usuario
+from .compartilhada import materializar_em_lote, visiveis
+
+
+def indexar_frases(frases):
+    """
+    Recria as referências de variáveis das frases informadas.
+    Usa duas consultas por chamada (delete + bulk_create), independente da quantidade.
+    """
+    frases = list(frases)
+    if not frases:
+        return 0
+
+    tamanho_maximo = ReferenciaVariavel._meta.get_field('tituloVariavel').max_length
+
+    ReferenciaVariavel.objects.filter(frase_id__in=[frase.pk for frase in frases]).delete()
+    referencias = [
+        ReferenciaVariavel(frase_id=frase.pk, usuario_id=frase.usuario_id, tituloVariavel=titulo)
+        for frase in frases
+        for titulo in extrair_variaveis(obter_frase_base(frase.frase))
+        if len(titulo) <= tamanho_maximo
+    ]
+    ReferenciaVariavel.objects.bulk_create(referencias, batch_size=TAMANHO_LOTE, ignore_conflicts=True)
+    return len(referencias)
+
+
+def renomear_variavel_nas_frases(titulo_antigo, titulo_novo, usuario, reportar_progresso=None):
+    """
+    Atualiza todas as frases do usuário que contêm a variável com o título antigo.
+    Frases da biblioteca compartilhada que usam a variável são antes copiadas
+    para o usuário. Retorna o número de frases atualizadas.
+    """
+    # Padrão a ser procurado: {tituloAntigo}
+    padrao_antigo = f'{{{titulo_antigo}}}'
+    padrao_novo = f'{{{titulo_novo}}}'
+    
+    materializar_em_lote(Frase, visiveis(Frase, usuario).exclude(usuario=usuario).filter(
+        referencias_variaveis__tituloVariavel=titulo_antigo
+    ).order_by('id'), usuario)
+    
+    # Busca pelo índice de referências apenas as frases que usam a variável
+    candidatas = list(Frase.objects.filter(
+        usuario=usuario,
+        referencias_variaveis__tituloVariavel=titulo_antigo
+    ).only('id', 'usuario_id', 'frase').order_by('id'))
+    total = len(candidatas)
+    
+    frases_atualizadas = 0
+    verificadas = 0
+    agora = timezone.now()
+    lote = []
+    
+    with transaction.atomic():
+        for frase in candidatas:
+            verificadas += 1
+            frase_base = obter_frase_base(frase.frase)
+            
+            if padrao_antigo in frase_base:
+                # Substitui todas as ocorrências do padrão antigo pelo novo
+                frase.frase['fraseBase'] = frase_base.replace(padrao_antigo, padrao_novo)
+                frase.atualizado_em = agora
+                lote.append(frase)
+            
+            if len(lote) >= TAMANHO_LOTE:
+                Frase.objects.bulk_update(lote, ['frase', 'atualizado_em'])
+                indexar_frases(lote)
+                frases_atualizadas += len(lote)
+                lote = []
+                if reportar_progresso:
+                    reportar_progresso(verificadas, total)
+        
+        if lote:
+            Frase.objects.bulk_update(lote, ['frase', 'atualizado_em'])
+            indexar_frases(lote)
+            frases_atualizadas += len(lote)
+    
+    if reportar_progresso:
+        reportar_progresso(verificadas, total)
+    
+    # bulk_update não dispara signals
+    if frases_atualizadas:
+        invalidar_usuario(usuario.id)
+    
+    return frases_atualizadas
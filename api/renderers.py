@@ -0,0 +1,34 @@
+"""
+Renderers adicionais do REST Framework
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Permite que as actions de streaming aceitem 'Accept: text/event-stream'.
+    O conteúdo do stream é gerado pela própria view; este renderer só é usado
+    para respostas de erro, enviadas como um evento SSE 'erro'.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: erro\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Permite que as actions de exportação aceitem 'Accept: application/x-ndjson'.
+    O conteúdo é gerado pela própria view; este renderer só é usado para
+    respostas de erro, enviadas como uma linha JSON.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data, ensure_ascii=False) + '\n').encode(self.charset)
@@ -0,0 +1,175 @@
+"""
+Resiliência das chamadas aos provedores de IA
+
+- Novas tentativas: respostas transitórias (429, 5xx) e falhas de conexão são
+  repetidas com espera exponencial com jitter, respeitando o cabeçalho
+  Retry-After do provedor, até um número máximo de tentativas e dentro de um
+  prazo total (settings.AI_RETENTATIVAS).
+- Deduplicação (single-flight): requisições idênticas feitas ao mesmo tempo no
+  processo, como o duplo clique do médico, compartilham uma única chamada ao
+  provedor em vez de dobrar a carga.
+- Respostas cortadas pelo limite de tokens (RespostaTruncada) são tratadas
+  como falha, não como resposta.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+STATUS_RETENTAVEIS = (408, 409, 425, 429, 500, 502, 503, 504)
+
+
+class RespostaTruncada(Exception):
+    """A geração parou ao atingir max_tokens e o texto veio incompleto"""
+
+
+def interpretar_retry_after(valor):
+    """Segundos indicados pelo cabeçalho Retry-After (número ou data HTTP), ou None"""
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if data is None:
+        return None
+    return max((data - timezone.now()).total_seconds(), 0.0)
+
+
+class PoliticaRetentativas:
+    """Quando e quanto esperar antes de repetir uma chamada"""
+
+    def __init__(self, maximo_tentativas=3, espera_base=0.5, espera_maxima=8, prazo=240,
+                 status=STATUS_RETENTAVEIS):
+        self.maximo_tentativas = maximo_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.prazo = prazo
+        self.status = frozenset(status)
+
+    def retentavel(self, status):
+        return status in self.status
+
+    def proxima_espera(self, tentativas, prazo_final, retry_after=None):
+        """
+        Segundos de espera antes da próxima tentativa, ou None se não deve
+        repetir (tentativas esgotadas ou a espera passaria do prazo final,
+        em segundos de time.monotonic()).
+        """
+        if tentativas >= self.maximo_tentativas:
+            return None
+
+        indicada = interpretar_retry_after(retry_after)
+        if indicada is not None:
+            # O provedor disse quando voltar; o jitter evita que todos voltem juntos
+            espera = indicada + random.uniform(0, self.espera_base)
+        else:
+            # Espera exponencial com jitter completo
+            espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** (tentativas - 1)))
+
+        if time.monotonic() + espera >= prazo_final:
+            return None
+        return espera
+
+
+def obter_politica_retentativas():
+    """Política de novas tentativas de settings.AI_RETENTATIVAS"""
+    configuracao = getattr(settings, 'AI_RETENTATIVAS', {})
+    return PoliticaRetentativas(
+        maximo_tentativas=configuracao.get('MAXIMO_TENTATIVAS', 3),
+        espera_base=configuracao.get('ESPERA_BASE', 0.5),
+        espera_maxima=configuracao.get('ESPERA_MAXIMA', 8),
+        prazo=configuracao.get('PRAZO', 240),
+        status=configuracao.get('STATUS', STATUS_RETENTAVEIS),
+    )
+
+
+def chave_requisicao(provedor, metodo, url, corpo):
+    """Identifica requisições idênticas (mesmo provedor, endereço e corpo)"""
+    conteudo = json.dumps({
+        'provedor': provedor,
+        'metodo': metodo,
+        'url': url,
+        'corpo': corpo,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+class _Chamada:
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class ChamadasEmAndamento:
+    """
+    Single-flight: enquanto uma chamada está em andamento, as chamadas com a
+    mesma chave esperam por ela e recebem o mesmo resultado. Vale dentro do
+    processo (com vários workers, cada um faz a sua chamada).
+    """
+
+    def __init__(self):
+        self._em_andamento = {}
+        self._em_andamento_async = weakref.WeakKeyDictionary()
+        self._trava = threading.Lock()
+
+    def executar(self, chave, funcao):
+        """Executa funcao() ou espera a execução em andamento. Retorna (resultado, compartilhado)"""
+        with self._trava:
+            chamada = self._em_andamento.get(chave)
+            compartilhado = chamada is not None
+            if not compartilhado:
+                chamada = self._em_andamento[chave] = _Chamada()
+
+        if compartilhado:
+            chamada.concluida.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado, True
+
+        try:
+            chamada.resultado = funcao()
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._trava:
+                del self._em_andamento[chave]
+            chamada.concluida.set()
+        return chamada.resultado, False
+
+    async def aexecutar(self, chave, funcao):
+        """
+        Versão assíncrona de executar; funcao() retorna uma corrotina. A chamada
+        roda em uma tarefa própria, então continua para as demais requisições
+        mesmo se a que a iniciou for cancelada (cliente desconectou).
+        """
+        loop = asyncio.get_running_loop()
+        em_andamento = self._em_andamento_async.setdefault(loop, {})
+        tarefa = em_andamento.get(chave)
+        compartilhado = tarefa is not None
+
+        if not compartilhado:
+            tarefa = em_andamento[chave] = loop.create_task(funcao())
+
+            def remover(concluida):
+                if em_andamento.get(chave) is concluida:
+                    del em_andamento[chave]
+            tarefa.add_done_callback(remover)
+
+        return await asyncio.shield(tarefa), compartilhado
+
+
+chamadas_em_andamento = ChamadasEmAndamento()
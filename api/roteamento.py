@@ -0,0 +1,328 @@
+"""
+Roteamento das chamadas de geração entre os provedores de IA
+
+- Fallback ordenado: se um provedor falha, tenta o próximo da lista.
+- Hedge: se o provedor não respondeu dentro do prazo (percentil das latências
+  recentes, normalmente p95), dispara o próximo em paralelo e usa a primeira
+  resposta que chegar.
+- Disjuntores: um provedor com falhas seguidas (ou taxa de erro alta) deixa de
+  ser chamado por um tempo; depois disso uma única chamada de teste decide se
+  ele volta.
+- Orçamento de saída: todos os provedores recebem o max_tokens pedido e o
+  modelo de AI_ROTEAMENTO['MODELOS']; os que não comportam o orçamento não
+  são tentados, gerações longas não usam hedge e uma resposta cortada pelo
+  limite de tokens conta como falha.
+
+Configuração em settings.AI_ROTEAMENTO.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .metricas import registro
+from .resiliencia import RespostaTruncada
+
+
+class SemProvedorDisponivel(Exception):
+    """Nenhum provedor conseguiu gerar a resposta"""
+
+
+class Disjuntor:
+    """Disjuntor (circuit breaker) de um provedor"""
+
+    def __init__(self, limite_falhas=5, taxa_erro_maxima=0.5, minimo_chamadas=10,
+                 tempo_aberto=30, tamanho_janela=20):
+        self.limite_falhas = limite_falhas
+        self.taxa_erro_maxima = taxa_erro_maxima
+        self.minimo_chamadas = minimo_chamadas
+        self.tempo_aberto = tempo_aberto
+        self._resultados = deque(maxlen=tamanho_janela)
+        self._falhas_seguidas = 0
+        self._aberto_ate = None
+        self._em_teste = False
+        self._trava = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._trava:
+            if self._aberto_ate is None:
+                return 'fechado'
+            if time.monotonic() < self._aberto_ate:
+                return 'aberto'
+            return 'semiaberto'
+
+    def permite(self):
+        """Indica se o provedor pode ser chamado agora (reserva a chamada de teste)"""
+        with self._trava:
+            if self._aberto_ate is None:
+                return True
+            if time.monotonic() < self._aberto_ate or self._em_teste:
+                return False
+            self._em_teste = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._trava:
+            self._falhas_seguidas = 0
+            self._resultados.append(True)
+            if self._aberto_ate is not None:
+                # A chamada de teste funcionou: fecha e esquece o histórico ruim
+                self._aberto_ate = None
+                self._em_teste = False
+                self._resultados.clear()
+
+    def liberar_teste(self):
+        """Encerra uma chamada sem resultado conclusivo, sem mudar o estado"""
+        with self._trava:
+            self._em_teste = False
+
+    def registrar_falha(self):
+        with self._trava:
+            self._falhas_seguidas += 1
+            self._resultados.append(False)
+            falhas = self._resultados.count(False)
+            taxa_alta = (
+                len(self._resultados) >= self.minimo_chamadas
+                and falhas / len(self._resultados) >= self.taxa_erro_maxima
+            )
+            if self._em_teste or self._falhas_seguidas >= self.limite_falhas or taxa_alta:
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+                self._em_teste = False
+
+
+class RoteadorIA:
+    """Executa a geração com fallback, hedge e disjuntores por provedor"""
+
+    def __init__(self, configuracao):
+        self.hedge = configuracao.get('HEDGE', True)
+        self.hedge_percentil = configuracao.get('HEDGE_PERCENTIL', 95)
+        self.hedge_minimo_amostras = configuracao.get('HEDGE_MINIMO_AMOSTRAS', 20)
+        self.hedge_atraso_minimo = configuracao.get('HEDGE_ATRASO_MINIMO', 2)
+        self.hedge_atraso_padrao = configuracao.get('HEDGE_ATRASO_PADRAO', 30)
+        self.hedge_maximo = configuracao.get('HEDGE_MAXIMO', 2)
+        self.hedge_maximo_tokens = configuracao.get('HEDGE_MAXIMO_TOKENS', 4096)
+        self.modelos = configuracao.get('MODELOS', {})
+        self.configuracao_disjuntor = configuracao.get('DISJUNTOR', {})
+        self._executor = ThreadPoolExecutor(
+            max_workers=configuracao.get('THREADS', 16),
+            thread_name_prefix='roteamento-ia'
+        )
+        self._disjuntores = {}
+        self._trava = threading.Lock()
+
+    def disjuntor(self, provedor):
+        with self._trava:
+            if provedor not in self._disjuntores:
+                self._disjuntores[provedor] = Disjuntor(**self.configuracao_disjuntor)
+            return self._disjuntores[provedor]
+
+    def estados(self):
+        """Estado do disjuntor de cada provedor já usado"""
+        with self._trava:
+            disjuntores = dict(self._disjuntores)
+        return {provedor: disjuntor.estado for provedor, disjuntor in sorted(disjuntores.items())}
+
+    def modelo(self, provedor):
+        """Modelo configurado para o provedor nas gerações roteadas (None: o padrão do serviço)"""
+        return self.modelos.get(provedor, {}).get('modelo')
+
+    def comporta(self, provedor, max_tokens):
+        """Indica se o modelo do provedor aceita gerar max_tokens tokens de saída"""
+        limite = self.modelos.get(provedor, {}).get('max_tokens')
+        return max_tokens is None or limite is None or max_tokens <= limite
+
+    def usa_hedge(self, max_tokens):
+        """Gerações longas não usam hedge: a chamada perdedora seguiria gastando tokens"""
+        return self.hedge and (max_tokens is None or max_tokens <= self.hedge_maximo_tokens)
+
+    def _motivo_ignorado(self, provedor, max_tokens):
+        """Motivo para não chamar o provedor agora (None se pode ser chamado)"""
+        if not self.comporta(provedor, max_tokens):
+            return f'{provedor} (não comporta {max_tokens} tokens)'
+        if not self.disjuntor(provedor).permite():
+            return f'{provedor} (disjuntor aberto)'
+        return None
+
+    def _registrar_resultado(self, provedor, inicio, texto, truncada):
+        registro.registrar(provedor, time.monotonic() - inicio, bool(texto))
+        if texto:
+            self.disjuntor(provedor).registrar_sucesso()
+        elif truncada:
+            # O provedor respondeu; só o orçamento não bastou. Libera a
+            # chamada de teste sem contar como falha do provedor
+            self.disjuntor(provedor).liberar_teste()
+        else:
+            self.disjuntor(provedor).registrar_falha()
+
+    def atraso_hedge(self, provedor):
+        """Tempo de espera pelo provedor antes de disparar o próximo em paralelo"""
+        percentil = registro.percentil(provedor, self.hedge_percentil, self.hedge_minimo_amostras)
+        if percentil is None:
+            return self.hedge_atraso_padrao
+        return max(percentil, self.hedge_atraso_minimo)
+
+    def _chamar(self, criar_servico, provedor, prompt, sistema, max_tokens):
+        inicio = time.monotonic()
+        servico, texto, truncada = None, None, False
+        try:
+            servico = criar_servico(provedor)
+            texto = servico.generate_text(
+                prompt, model=self.modelo(provedor), max_tokens=max_tokens, sistema=sistema
+            )
+        except RespostaTruncada:
+            truncada = True
+        except Exception:
+            texto = None
+
+        self._registrar_resultado(provedor, inicio, texto, truncada)
+        return servico, texto, truncada
+
+    def gerar(self, prompt, provedores, criar_servico, sistema=None, max_tokens=None):
+        """
+        Gera o texto com o primeiro provedor que responder, na ordem informada.
+        criar_servico(provedor) retorna a instância de AIService do provedor,
+        sistema são as instruções fixas (mensagem de sistema), se houver, e
+        max_tokens o orçamento de saída exigido de todos os provedores.
+        Retorna (servico, texto) ou lança SemProvedorDisponivel.
+        """
+        restantes = iter(provedores)
+        em_andamento = {}
+        falharam = []
+
+        def iniciar_proximo():
+            for provedor in restantes:
+                motivo = self._motivo_ignorado(provedor, max_tokens)
+                if motivo is None:
+                    futuro = self._executor.submit(
+                        self._chamar, criar_servico, provedor, prompt, sistema, max_tokens
+                    )
+                    em_andamento[futuro] = (provedor, time.monotonic())
+                    return True
+                falharam.append(motivo)
+            return False
+
+        esgotados = not iniciar_proximo()
+
+        while em_andamento:
+            prazo = None
+            if self.usa_hedge(max_tokens) and not esgotados and len(em_andamento) < self.hedge_maximo:
+                # O prazo do hedge conta a partir da chamada mais recente
+                provedor, inicio = max(em_andamento.values(), key=lambda item: item[1])
+                prazo = max(inicio + self.atraso_hedge(provedor) - time.monotonic(), 0)
+
+            concluidos, _ = wait(list(em_andamento), timeout=prazo, return_when=FIRST_COMPLETED)
+
+            if not concluidos:
+                # Provedor lento: dispara o próximo em paralelo
+                esgotados = not iniciar_proximo()
+                continue
+
+            for futuro in concluidos:
+                provedor, _ = em_andamento.pop(futuro)
+                servico, texto, truncada = futuro.result()
+                if texto:
+                    return servico, texto
+                falharam.append(f'{provedor} (resposta cortada)' if truncada else provedor)
+
+            if not em_andamento and not esgotados:
+                # Fallback: todos os chamados falharam, tenta o próximo
+                esgotados = not iniciar_proximo()
+
+        raise SemProvedorDisponivel(
+            'Nenhum provedor de IA conseguiu gerar a resposta'
+            + (f": {', '.join(falharam)}" if falharam else '')
+        )
+
+
+    async def _achamar(self, criar_servico, provedor, prompt, sistema, max_tokens):
+        inicio = time.monotonic()
+        servico, texto, truncada = None, None, False
+        try:
+            servico = criar_servico(provedor)
+            texto = await servico.agenerate_text(
+                prompt, model=self.modelo(provedor), max_tokens=max_tokens, sistema=sistema
+            )
+        except RespostaTruncada:
+            truncada = True
+        except Exception:
+            texto = None
+
+        self._registrar_resultado(provedor, inicio, texto, truncada)
+        return servico, texto, truncada
+
+    async def agerar(self, prompt, provedores, criar_servico, sistema=None, max_tokens=None):
+        """
+        Versão assíncrona de gerar (para views ASGI): as chamadas em paralelo
+        do hedge são tarefas do event loop em vez de threads.
+        """
+        restantes = iter(provedores)
+        em_andamento = {}
+        falharam = []
+
+        def iniciar_proximo():
+            for provedor in restantes:
+                motivo = self._motivo_ignorado(provedor, max_tokens)
+                if motivo is None:
+                    tarefa = asyncio.create_task(
+                        self._achamar(criar_servico, provedor, prompt, sistema, max_tokens)
+                    )
+                    # O event loop guarda só referências fracas às tarefas; as
+                    # chamadas perdedoras do hedge continuam até terminar
+                    _tarefas_em_segundo_plano.add(tarefa)
+                    tarefa.add_done_callback(_tarefas_em_segundo_plano.discard)
+                    em_andamento[tarefa] = (provedor, time.monotonic())
+                    return True
+                falharam.append(motivo)
+            return False
+
+        esgotados = not iniciar_proximo()
+
+        while em_andamento:
+            prazo = None
+            if self.usa_hedge(max_tokens) and not esgotados and len(em_andamento) < self.hedge_maximo:
+                provedor, inicio = max(em_andamento.values(), key=lambda item: item[1])
+                prazo = max(inicio + self.atraso_hedge(provedor) - time.monotonic(), 0)
+
+            concluidas, _ = await asyncio.wait(
+                list(em_andamento),
+                timeout=prazo,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not concluidas:
+                esgotados = not iniciar_proximo()
+                continue
+
+            for tarefa in concluidas:
+                provedor, _ = em_andamento.pop(tarefa)
+                servico, texto, truncada = tarefa.result()
+                if texto:
+                    return servico, texto
+                falharam.append(f'{provedor} (resposta cortada)' if truncada else provedor)
+
+            if not em_andamento and not esgotados:
+                esgotados = not iniciar_proximo()
+
+        raise SemProvedorDisponivel(
+            'Nenhum provedor de IA conseguiu gerar a resposta'
+            + (f": {', '.join(falharam)}" if falharam else '')
+        )
+
+
+_tarefas_em_segundo_plano = set()
+_roteador = None
+_trava_criacao = threading.Lock()
+
+
+def obter_roteador():
+    """Retorna o roteador do processo, criado a partir de settings.AI_ROTEAMENTO"""
+    global _roteador
+    if _roteador is None:
+        with _trava_criacao:
+            if _roteador is None:
+                _roteador = RoteadorIA(getattr(settings, 'AI_ROTEAMENTO', {}))
+    return _roteador
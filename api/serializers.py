@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Metodo, ModeloLaudo, Frase, Variavel
+from django.db.models.manager import BaseManager
+from .models import Metodo, ModeloLaudo, Frase, Variavel, Tarefa
 
 CustomUser = get_user_model()
 
@@ -25,18 +26,92 @@ class CustomUserSerializer(serializers.ModelSerializer):
         )
         return user
 
+class CamposSelecionaveisSerializerMixin:
+    """
+    Mantém só os campos listados em context['campos'], preenchido pelas views
+    com CamposSelecionaveisMixin a partir de ?fields= e ?omit=
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = self.context.get('campos')
+        if campos is not None:
+            for nome in set(self.fields) - set(campos):
+                self.fields.pop(nome)
+
 class MetodoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Metodo
         fields = ['id', 'metodo']
 
-class ModeloLaudoSerializer(serializers.ModelSerializer):
+class ModeloLaudoSerializer(CamposSelecionaveisSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ModeloLaudo
         fields = ['id', 'titulo', 'texto', 'metodo', 'usuario', 'criado_em', 'atualizado_em']
         read_only_fields = ['usuario', 'criado_em', 'atualizado_em']
 
-class FraseSerializer(serializers.ModelSerializer):
+def ids_modelos_por_frase(frases):
+    """
+    IDs dos modelos de laudo vinculados a cada frase ({frase_id: [ids]}), lidos
+    direto da tabela intermediária com uma consulta para todas as frases.
+    Frases com modelos_laudo já em prefetch não consultam o banco.
+    """
+    ids = {}
+    pendentes = []
+    for frase in frases:
+        prefetch = getattr(frase, '_prefetched_objects_cache', {}).get('modelos_laudo')
+        if prefetch is not None:
+            ids[frase.pk] = [modelo.pk for modelo in prefetch]
+        else:
+            ids[frase.pk] = []
+            pendentes.append(frase.pk)
+    if pendentes:
+        for frase_id, modelo_id in Frase.modelos_laudo.through.objects.filter(
+            frase_id__in=pendentes
+        ).order_by('id').values_list('frase_id', 'modelolaudo_id'):
+            ids[frase_id].append(modelo_id)
+    return ids
+
+class FraseListSerializer(serializers.ListSerializer):
+    """
+    Serialização rápida das listas de frases: os dicionários são montados
+    direto dos atributos, sem passar pelos campos do DRF item a item, e os
+    vínculos com modelos de laudo vêm de ids_modelos_por_frase (uma consulta
+    por lista em vez de uma por frase). Campos sem extrator próprio voltam
+    para o caminho padrão.
+    """
+    _data_hora = serializers.DateTimeField()
+
+    def to_representation(self, data):
+        frases = list(data.all() if isinstance(data, BaseManager) else data)
+        campos = list(self.child.fields)
+        extratores = self._extratores(frases, campos)
+        if extratores is None:
+            return super().to_representation(frases)
+        return [
+            {campo: extrator(frase) for campo, extrator in extratores}
+            for frase in frases
+        ]
+
+    def _extratores(self, frases, campos):
+        data_hora = self._data_hora.to_representation
+        extratores = {
+            'id': lambda frase: frase.pk,
+            'categoriaFrase': lambda frase: frase.categoriaFrase,
+            'tituloFrase': lambda frase: frase.tituloFrase,
+            'frase': lambda frase: frase.frase,
+            'usuario': lambda frase: frase.usuario_id,
+            'criado_em': lambda frase: data_hora(frase.criado_em),
+            'atualizado_em': lambda frase: data_hora(frase.atualizado_em),
+        }
+        if 'modelos_laudo' in campos:
+            ids = ids_modelos_por_frase(frases)
+            extratores['modelos_laudo'] = lambda frase: ids[frase.pk]
+        if not set(campos) <= set(extratores):
+            return None
+        return [(campo, extratores[campo]) for campo in campos]
+
+class FraseSerializer(CamposSelecionaveisSerializerMixin, serializers.ModelSerializer):
     modelos_laudo = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=ModeloLaudo.objects.all(),
@@ -47,13 +122,24 @@ class FraseSerializer(serializers.ModelSerializer):
         model = Frase
         fields = ['id', 'categoriaFrase', 'tituloFrase', 'frase', 'modelos_laudo', 'usuario', 'criado_em', 'atualizado_em']
         read_only_fields = ['usuario', 'criado_em', 'atualizado_em']
+        list_serializer_class = FraseListSerializer
 
-class VariavelSerializer(serializers.ModelSerializer):
+class VariavelSerializer(CamposSelecionaveisSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Variavel
         fields = ['id', 'tituloVariavel', 'variavel', 'usuario', 'criado_em', 'atualizado_em']
         read_only_fields = ['usuario', 'criado_em', 'atualizado_em']
 
+class TarefaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tarefa
+        fields = ['id', 'tipo', 'status', 'progresso', 'total', 'resultado', 'erro', 'criado_em', 'iniciado_em', 'concluido_em']
+        read_only_fields = fields
+
+class SegmentoCorrecaoSerializer(serializers.Serializer):
+    texto = serializers.CharField()
+    deve_capitalizar = serializers.BooleanField(default=False)
+
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
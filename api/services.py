@@ -3,74 +3,444 @@ Serviços para integração com APIs de IA
 """
 import os
 import json
-import requests
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from django.conf import settings
-from django.core.cache import cache
 from rest_framework.response import Response
 from rest_framework import status
 
+from .http_clients import (
+    obter_cliente, obter_cliente_async, limitar_concorrencia, alimitar_concorrencia, timeout_ate
+)
+from .resiliencia import RespostaTruncada, chamadas_em_andamento, chave_requisicao, obter_politica_retentativas
+from .ai_cache import obter_cache_respostas, obter_cache_correcoes
+from .roteamento import obter_roteador
+from .prompts import obter_prompt
+from .metricas import registro
+
+class AIServiceError(Exception):
+    """Erro retornado por um provedor de IA"""
+
+
 class AIService:
     """Classe base para serviços de IA"""
 
+    # Nome do provedor; define o pool de conexões compartilhado
+    provedor = None
+    endpoint = "chat/completions"
+    modelo_padrao = None
+    max_tokens_padrao = 1000
+    temperatura = 0.7
+    # Campos extras do corpo no streaming: pede o uso de tokens no último evento
+    opcoes_stream = {"stream_options": {"include_usage": True}}
+
     def __init__(self, api_key, base_url=None):
         self.api_key = api_key
-        self.base_url = base_url
-        self.session = requests.Session()
-        self.session.headers.update({
+        # Tokens da última resposta (tokens_entrada, tokens_saida, tokens_cache)
+        self.ultimo_uso = None
+        # settings.AI_BASE_URLS permite apontar o provedor para outro endereço
+        # (proxy compatível ou o provedor simulado do teste de carga)
+        self.base_url = settings.AI_BASE_URLS.get(self.provedor) or base_url
+        self.headers = self.get_headers()
+        # Cliente HTTP do processo, reutilizado por todas as instâncias do provedor
+        self.client = obter_cliente(self.provedor)
+
+    def get_headers(self):
+        """Cabeçalhos enviados em todas as requisições ao provedor"""
+        return {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
-        })
+        }
+
+    def get_url(self, endpoint):
+        return f"{self.base_url}/{endpoint}" if self.base_url else endpoint
 
     def make_request(self, endpoint, data, method='POST'):
-        """Faz uma requisição para a API"""
-        try:
-            url = f"{self.base_url}/{endpoint}" if self.base_url else endpoint
-            response = self.session.request(method, url, json=data)
+        """
+        Faz uma requisição para a API. Erros transitórios (429, 5xx, falhas de
+        conexão) são repetidos conforme settings.AI_RETENTATIVAS e requisições
+        idênticas simultâneas compartilham a mesma chamada ao provedor
+        (api/resiliencia.py). Cada chamada é registrada nas métricas e no log
+        'api.ia' (espera por vaga, tempo até o primeiro byte, duração, status
+        HTTP, tokens e tentativas).
+        """
+        if not settings.AI_DEDUPLICAR_CHAMADAS:
+            return self._requisitar(endpoint, data, method)
+
+        chave = chave_requisicao(self.provedor, method, self.get_url(endpoint), data)
+        resultado, compartilhado = chamadas_em_andamento.executar(
+            chave, lambda: self._requisitar(endpoint, data, method)
+        )
+        if compartilhado:
+            registro.registrar_deduplicada(self.provedor, data.get('model'))
+        return resultado
+
+    async def amake_request(self, endpoint, data, method='POST'):
+        """Versão assíncrona de make_request (para views ASGI)"""
+        if not settings.AI_DEDUPLICAR_CHAMADAS:
+            return await self._arequisitar(endpoint, data, method)
+
+        chave = chave_requisicao(self.provedor, method, self.get_url(endpoint), data)
+        resultado, compartilhado = await chamadas_em_andamento.aexecutar(
+            chave, lambda: self._arequisitar(endpoint, data, method)
+        )
+        if compartilhado:
+            registro.registrar_deduplicada(self.provedor, data.get('model'))
+        return resultado
+
+    def _requisitar(self, endpoint, data, method):
+        """Envia a requisição, repetindo enquanto a política de novas tentativas permitir"""
+        politica = obter_politica_retentativas()
+        inicio = time.monotonic()
+        prazo_final = inicio + politica.prazo
+        medicao = {'espera_vaga': 0.0, 'tentativas': 0}
+
+        while True:
+            medicao['tentativas'] += 1
+            medicao.pop('ttfb', None)
+            try:
+                response = self._enviar(method, endpoint, data, timeout_ate(prazo_final), medicao)
+            except httpx.TransportError as e:
+                # Conexão recusada/interrompida ou timeout
+                espera = politica.proxima_espera(medicao['tentativas'], prazo_final)
+                if espera is None:
+                    self._registrar_falha(data, inicio, medicao, e)
+                    return None
+                self._registrar_retentativa(data, type(e).__name__, espera, medicao)
+                time.sleep(espera)
+                continue
+            except Exception as e:
+                # print(f"Erro na requisição: {e}")
+                self._registrar_falha(data, inicio, medicao, e)
+                return None
 
-            if response.status_code == 200:
-                return response.json()
-            else:
-                # print(f"Erro na API: {response.status_code} - {response.text}")
+            espera = self._espera_por_status(politica, response, medicao, prazo_final)
+            if espera is None:
+                return self._processar_resposta(response, data, inicio, medicao)
+            self._registrar_retentativa(data, response.status_code, espera, medicao)
+            time.sleep(espera)
+
+    async def _arequisitar(self, endpoint, data, method):
+        """Versão assíncrona de _requisitar"""
+        politica = obter_politica_retentativas()
+        inicio = time.monotonic()
+        prazo_final = inicio + politica.prazo
+        medicao = {'espera_vaga': 0.0, 'tentativas': 0}
+
+        while True:
+            medicao['tentativas'] += 1
+            medicao.pop('ttfb', None)
+            try:
+                response = await self._aenviar(method, endpoint, data, timeout_ate(prazo_final), medicao)
+            except httpx.TransportError as e:
+                espera = politica.proxima_espera(medicao['tentativas'], prazo_final)
+                if espera is None:
+                    self._registrar_falha(data, inicio, medicao, e)
+                    return None
+                self._registrar_retentativa(data, type(e).__name__, espera, medicao)
+                await asyncio.sleep(espera)
+                continue
+            except Exception as e:
+                self._registrar_falha(data, inicio, medicao, e)
                 return None
 
-        except Exception as e:
-            # print(f"Erro na requisição: {e}")
+            espera = self._espera_por_status(politica, response, medicao, prazo_final)
+            if espera is None:
+                return self._processar_resposta(response, data, inicio, medicao)
+            self._registrar_retentativa(data, response.status_code, espera, medicao)
+            await asyncio.sleep(espera)
+
+    def _enviar(self, method, endpoint, data, timeout, medicao):
+        """Uma tentativa: ocupa uma vaga do provedor, envia e lê a resposta inteira"""
+        entrada = time.monotonic()
+        # Espera uma vaga se o provedor já está com o máximo de chamadas simultâneas
+        with limitar_concorrencia(self.provedor):
+            medicao['espera_vaga'] += time.monotonic() - entrada
+            envio = time.monotonic()
+            with self.client.stream(method, self.get_url(endpoint), json=data, headers=self.headers,
+                                    timeout=timeout) as response:
+                # Os cabeçalhos chegaram; o corpo ainda não foi lido
+                medicao['ttfb'] = time.monotonic() - envio
+                response.read()
+        return response
+
+    async def _aenviar(self, method, endpoint, data, timeout, medicao):
+        """Versão assíncrona de _enviar"""
+        client = obter_cliente_async(self.provedor)
+        entrada = time.monotonic()
+        async with alimitar_concorrencia(self.provedor):
+            medicao['espera_vaga'] += time.monotonic() - entrada
+            envio = time.monotonic()
+            async with client.stream(method, self.get_url(endpoint), json=data, headers=self.headers,
+                                     timeout=timeout) as response:
+                medicao['ttfb'] = time.monotonic() - envio
+                await response.aread()
+        return response
+
+    def _espera_por_status(self, politica, response, medicao, prazo_final):
+        """Segundos até a próxima tentativa se o status é transitório; None para encerrar"""
+        medicao['status'] = response.status_code
+        if not politica.retentavel(response.status_code):
             return None
+        return politica.proxima_espera(
+            medicao['tentativas'], prazo_final, response.headers.get('Retry-After')
+        )
 
+    def _registrar_retentativa(self, data, motivo, espera, medicao):
+        registro.registrar_retentativa(
+            self.provedor, data.get('model'), motivo, espera, medicao['tentativas']
+        )
 
-class OpenAIService(AIService):
-    """Serviço para integração com OpenAI"""
-
-    def __init__(self):
-        super().__init__(
-            api_key=settings.OPENAI_API_KEY,
-            base_url="https://api.openai.com/v1"
+    def _processar_resposta(self, response, data, inicio, medicao):
+        """Registra a chamada concluída e retorna o JSON da resposta (None se não for 200)"""
+        conteudo, uso = None, None
+        if response.status_code == 200:
+            try:
+                conteudo = response.json()
+            except ValueError as e:
+                self._registrar_falha(data, inicio, medicao, e)
+                return None
+            uso = self.ultimo_uso = self.parse_usage(conteudo)
+        registro.registrar_chamada(
+            self.provedor, data.get('model'),
+            duracao=time.monotonic() - inicio - medicao['espera_vaga'],
+            status=response.status_code,
+            ttfb=medicao.get('ttfb'),
+            espera_vaga=medicao['espera_vaga'],
+            uso=uso,
+            tentativas=medicao['tentativas']
+        )
+        return conteudo
+
+    def _registrar_falha(self, data, inicio, medicao, erro, stream=False):
+        """Registra a chamada que terminou sem resposta válida (timeout, conexão, sem vaga)"""
+        duracao = medicao.get('duracao', time.monotonic() - inicio - medicao.get('espera_vaga', 0))
+        registro.registrar_chamada(
+            self.provedor, data.get('model'),
+            duracao=duracao,
+            status=medicao.get('status'),
+            ttfb=medicao.get('ttfb'),
+            espera_vaga=medicao.get('espera_vaga'),
+            uso=medicao.get('uso') or None,
+            tentativas=medicao.get('tentativas', 1),
+            stream=stream,
+            erro=type(erro).__name__
         )
 
-    def generate_text(self, prompt, model="gpt-3.5-turbo", max_tokens=1000):
-        """Gera texto usando GPT"""
-        data = {
+    def build_payload(self, prompt, model, max_tokens, sistema=None):
+        """
+        Corpo da requisição no formato de chat da OpenAI (OpenAI, OpenRouter, Groq).
+        As instruções fixas vão primeiro, como mensagem de sistema, para que o
+        provedor reaproveite o prefixo em cache (prefix caching automático).
+        """
+        messages = [{"role": "user", "content": prompt}]
+        if sistema:
+            messages.insert(0, {"role": "system", "content": sistema})
+        return {
             "model": model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "max_tokens": max_tokens,
-            "temperature": 0.7
+            "temperature": self.temperatura
         }
 
-        response = self.make_request("chat/completions", data)
-
+    def parse_response(self, response):
+        """Extrai o texto gerado da resposta completa"""
         if response and 'choices' in response:
             return response['choices'][0]['message']['content']
         return None
 
+    def resposta_truncada(self, response):
+        """Indica se a geração parou por atingir max_tokens (finish_reason 'length')"""
+        choices = (response or {}).get('choices') or []
+        return bool(choices) and choices[0].get('finish_reason') == 'length'
+
+    def parse_stream_event(self, evento):
+        """Extrai o trecho de texto de um evento do streaming"""
+        choices = evento.get('choices') or []
+        if choices:
+            return (choices[0].get('delta') or {}).get('content') or ''
+        return ''
+
+    def parse_usage(self, response):
+        """Tokens de entrada, de saída e de entrada lidos do cache do provedor"""
+        uso = (response or {}).get('usage') or {}
+        return {
+            'tokens_entrada': uso.get('prompt_tokens', 0),
+            'tokens_saida': uso.get('completion_tokens', 0),
+            'tokens_cache': (uso.get('prompt_tokens_details') or {}).get('cached_tokens', 0) or 0,
+        }
+
+    def parse_stream_usage(self, evento):
+        """Tokens informados em um evento do streaming (None se o evento não traz uso)"""
+        if evento.get('usage'):
+            return self.parse_usage(evento)
+        return None
+
+    def generate_text(self, prompt, model=None, max_tokens=None, sistema=None):
+        """
+        Gera texto com o modelo do provedor. Lança RespostaTruncada se o texto
+        foi cortado pelo limite de max_tokens.
+        """
+        data = self.build_payload(
+            prompt,
+            model or self.modelo_padrao,
+            max_tokens or self.max_tokens_padrao,
+            sistema
+        )
+        response = self.make_request(self.endpoint, data)
+        return self._texto_completo(response, data)
+
+    async def agenerate_text(self, prompt, model=None, max_tokens=None, sistema=None):
+        """Versão assíncrona de generate_text (para views ASGI)"""
+        data = self.build_payload(
+            prompt,
+            model or self.modelo_padrao,
+            max_tokens or self.max_tokens_padrao,
+            sistema
+        )
+        response = await self.amake_request(self.endpoint, data)
+        return self._texto_completo(response, data)
+
+    def _texto_completo(self, response, data):
+        if self.resposta_truncada(response):
+            raise RespostaTruncada(
+                f"Resposta de '{self.provedor}' ({data.get('model')}) cortada em {data.get('max_tokens')} tokens"
+            )
+        return self.parse_response(response)
+
+    def stream_text(self, prompt, model=None, max_tokens=None, sistema=None):
+        """
+        Gera o texto em streaming, produzindo os trechos à medida que o
+        provedor os envia (Server-Sent Events).
+        """
+        data = self.build_payload(
+            prompt,
+            model or self.modelo_padrao,
+            max_tokens or self.max_tokens_padrao,
+            sistema
+        )
+        data.update(stream=True, **self.opcoes_stream)
+
+        inicio = time.monotonic()
+        medicao = {'uso': {}}
+        try:
+            # A vaga fica ocupada durante todo o streaming
+            with limitar_concorrencia(self.provedor):
+                medicao['espera_vaga'] = time.monotonic() - inicio
+                envio = time.monotonic()
+                with self.client.stream('POST', self.get_url(self.endpoint), json=data, headers=self.headers) as response:
+                    medicao['status'] = response.status_code
+                    if response.status_code != 200:
+                        response.read()
+                        raise AIServiceError(f"Erro na API: {response.status_code} - {response.text}")
+
+                    for linha in response.iter_lines():
+                        trecho = self._processar_linha_stream(linha, medicao['uso'])
+                        if trecho is None:
+                            break
+                        if trecho:
+                            # No streaming o primeiro byte que importa é o primeiro trecho de texto
+                            medicao.setdefault('ttfb', time.monotonic() - envio)
+                            yield trecho
+                medicao['duracao'] = time.monotonic() - envio
+        except (Exception, GeneratorExit) as e:
+            # GeneratorExit: o cliente desconectou antes do fim
+            self._registrar_falha(data, inicio, medicao, e, stream=True)
+            raise
+
+        self._registrar_stream(data, medicao)
+
+    async def astream_text(self, prompt, model=None, max_tokens=None, sistema=None):
+        """Versão assíncrona de stream_text (para o servidor ASGI)"""
+        data = self.build_payload(
+            prompt,
+            model or self.modelo_padrao,
+            max_tokens or self.max_tokens_padrao,
+            sistema
+        )
+        data.update(stream=True, **self.opcoes_stream)
+
+        inicio = time.monotonic()
+        medicao = {'uso': {}}
+        try:
+            client = obter_cliente_async(self.provedor)
+            async with alimitar_concorrencia(self.provedor):
+                medicao['espera_vaga'] = time.monotonic() - inicio
+                envio = time.monotonic()
+                async with client.stream('POST', self.get_url(self.endpoint), json=data, headers=self.headers) as response:
+                    medicao['status'] = response.status_code
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise AIServiceError(f"Erro na API: {response.status_code} - {response.text}")
+
+                    async for linha in response.aiter_lines():
+                        trecho = self._processar_linha_stream(linha, medicao['uso'])
+                        if trecho is None:
+                            break
+                        if trecho:
+                            medicao.setdefault('ttfb', time.monotonic() - envio)
+                            yield trecho
+                medicao['duracao'] = time.monotonic() - envio
+        except (Exception, GeneratorExit, asyncio.CancelledError) as e:
+            self._registrar_falha(data, inicio, medicao, e, stream=True)
+            raise
+
+        self._registrar_stream(data, medicao)
+
+    def _registrar_stream(self, data, medicao):
+        """Registra um streaming concluído"""
+        self.ultimo_uso = medicao['uso'] or None
+        registro.registrar_chamada(
+            self.provedor, data.get('model'),
+            duracao=medicao['duracao'],
+            status=medicao['status'],
+            ttfb=medicao.get('ttfb'),
+            espera_vaga=medicao['espera_vaga'],
+            uso=self.ultimo_uso,
+            stream=True
+        )
+
+    def _processar_linha_stream(self, linha, uso):
+        """
+        Interpreta uma linha SSE do provedor. Retorna o trecho de texto,
+        '' para linhas sem texto ou None quando o stream terminou. Os tokens
+        informados pelo provedor são acumulados em uso.
+        """
+        if not linha.startswith('data:'):
+            return ''
+        conteudo = linha[len('data:'):].strip()
+        if conteudo == '[DONE]':
+            return None
+        try:
+            evento = json.loads(conteudo)
+            for chave, valor in (self.parse_stream_usage(evento) or {}).items():
+                # Os provedores informam totais acumulados, não incrementos
+                uso[chave] = max(uso.get(chave, 0), valor or 0)
+            return self.parse_stream_event(evento)
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            return ''
 
-class OpenRouterService(AIService):
-    """Serviço para integração com OpenRouter"""
+
+class OpenAIService(AIService):
+    """Serviço para integração com OpenAI"""
+
+    provedor = 'openai'
+    modelo_padrao = "gpt-3.5-turbo"
+    max_tokens_padrao = 1000
 
     def __init__(self):
         super().__init__(
-            api_key=settings.OPENROUTER_API_KEY,
-            base_url="https://openrouter.ai/api/v1"
+            api_key=settings.OPENAI_API_KEY,
+            base_url="https://api.openai.com/v1"
         )
+
+
+class OpenRouterService(AIService):
+    """Serviço para integração com OpenRouter"""
+
+    provedor = 'openrouter'
     # teste de modelos
     # anthropic/claude-3.7-sonnet - melhor até agora, porem caro
     # anthropic/claude-sonnet-4 - melhor até agora, porem caro
@@ -79,51 +449,105 @@ class OpenRouterService(AIService):
     # deepseek/deepseek-chat-v3.1 - não ficou bom
     # openai/gpt-4.1-mini - não ficou bom
     # moonshotai/kimi-k2-0905 - bom, porem precisa de ajuste no prompt pq gera o texto todo junto
+    modelo_padrao = "anthropic/claude-sonnet-4"
+    max_tokens_padrao = 20000
 
-    def generate_text(self, prompt, model="anthropic/claude-sonnet-4", max_tokens=20000):
-        """Gera texto usando OpenRouter"""
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
-            "temperature": 0.7
-        }
+    def __init__(self):
+        super().__init__(
+            api_key=settings.OPENROUTER_API_KEY,
+            base_url="https://openrouter.ai/api/v1"
+        )
 
-        response = self.make_request("chat/completions", data)
-
-        if response and 'choices' in response:
-            return response['choices'][0]['message']['content']
-        return None
+    def build_payload(self, prompt, model, max_tokens, sistema=None):
+        data = super().build_payload(prompt, model, max_tokens, sistema)
+        if sistema and model.startswith('anthropic/'):
+            # Modelos da Anthropic só usam o cache de prompt com cache_control explícito
+            data['messages'][0]['content'] = [
+                {"type": "text", "text": sistema, "cache_control": {"type": "ephemeral"}}
+            ]
+        return data
 
 
 class AnthropicService(AIService):
     """Serviço para integração com Anthropic/Claude"""
 
+    provedor = 'anthropic'
+    endpoint = "messages"
+    # A API da Anthropic rejeita campos desconhecidos; o uso vem nos eventos
+    opcoes_stream = {}
+    modelo_padrao = "claude-3-haiku-20240307"
+    max_tokens_padrao = 1000
+
     def __init__(self):
         super().__init__(
             api_key=settings.ANTHROPIC_API_KEY,
             base_url="https://api.anthropic.com/v1"
         )
 
-    def generate_text(self, prompt, model="claude-3-haiku-20240307", max_tokens=1000):
-        """Gera texto usando Claude"""
+    def get_headers(self):
+        # A API da Anthropic autentica por x-api-key e exige a versão da API
+        return {
+            'x-api-key': self.api_key,
+            'anthropic-version': '2023-06-01',
+            'Content-Type': 'application/json'
+        }
+
+    def build_payload(self, prompt, model, max_tokens, sistema=None):
         data = {
             "model": model,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": max_tokens,
-            "temperature": 0.7
+            "temperature": self.temperatura
         }
-
-        response = self.make_request("messages", data)
-
+        if sistema:
+            # Bloco de sistema marcado para o cache de prompt da Anthropic
+            data["system"] = [
+                {"type": "text", "text": sistema, "cache_control": {"type": "ephemeral"}}
+            ]
+        return data
+
+    def parse_response(self, response):
         if response and 'content' in response:
             return response['content'][0]['text']
         return None
 
+    def resposta_truncada(self, response):
+        return (response or {}).get('stop_reason') == 'max_tokens'
+
+    def parse_usage(self, response):
+        uso = (response or {}).get('usage') or {}
+        tokens_cache = uso.get('cache_read_input_tokens', 0) or 0
+        # input_tokens da Anthropic não inclui os tokens lidos/gravados no cache
+        return {
+            'tokens_entrada': uso.get('input_tokens', 0) + tokens_cache + (uso.get('cache_creation_input_tokens', 0) or 0),
+            'tokens_saida': uso.get('output_tokens', 0),
+            'tokens_cache': tokens_cache,
+        }
+
+    def parse_stream_usage(self, evento):
+        # message_start traz os tokens de entrada e message_delta os de saída
+        if evento.get('type') == 'message_start':
+            return self.parse_usage(evento.get('message'))
+        if evento.get('type') == 'message_delta':
+            return {'tokens_saida': (evento.get('usage') or {}).get('output_tokens', 0)}
+        return None
+
+    def parse_stream_event(self, evento):
+        # Apenas eventos content_block_delta trazem texto
+        if evento.get('type') == 'content_block_delta':
+            return (evento.get('delta') or {}).get('text') or ''
+        return ''
+
 
 class GroqService(AIService):
     """Serviço para integração com Groq"""
 
+    provedor = 'groq'
+    # Usados quando o Groq entra no roteamento de geração de texto
+    modelo_padrao = "openai/gpt-oss-120b"
+    max_tokens_padrao = 8192
+    modelo_correcao = "openai/gpt-oss-120b"
+
     def __init__(self):
         super().__init__(
             api_key=settings.GROQ_API_KEY,
@@ -134,22 +558,131 @@ class GroqService(AIService):
         """
         Corrige texto transcrito usando Groq
         Especializado em correção de transcrições de laudos médicos radiológicos
+
+        As correções ficam em cache em dois níveis: o texto exato (espaços
+        normalizados) e o texto que só difere na caixa da primeira letra, caso
+        em que a primeira letra é ajustada ao texto ditado. O restante do texto
+        precisa ser idêntico: siglas e nomes próprios (TC, RM, Doppler) mantêm
+        a caixa do texto ditado.
         """
-        system_prompt = """Você é um assistente especialista em corrigir transcrições de laudos médicos radiológicos em português. 
-Sua tarefa é apenas pontuar corretamente, e corrigir a gramática e os termos técnicos radiológicos do texto fornecido.
-Regras:
-1. NÃO adicione nenhum texto extra, explicação ou "Aqui está". Retorne APENAS o texto corrigido.
-2. Mantenha o sentido técnico médico e radiológico.
-3. Insira vírgulas, pontos e outros sinais de pontuação onde gramaticalmente necessário.
-4. As medidas devem ser em centímetros, a menos que seja especificado outro tipo de medida, e devem estar no seguinte formato: A x B cm (A e B são as medidas). Ordenar as medidas da maior para a menor.
-5. Se o usuário pedir uma descrição detalhada de uma estrutura ou alteração patológica, deve ser colocada a descrição detalhada da estrutura e/ou da alteração.
-6. {capitalizacao}"""
+        corrigido = self._correcao_em_cache(texto, deve_capitalizar)
+        if corrigido:
+            return corrigido
+
+        inicio = time.monotonic()
+        response = self.make_request("chat/completions", self._payload_correcao(texto, deve_capitalizar))
+        obter_cache_correcoes().registrar_chamada(self.provedor, time.monotonic() - inicio)
+
+        return self._processar_correcao(response, texto, deve_capitalizar)
+
+    async def acorrect_text(self, texto, deve_capitalizar=False):
+        """Versão assíncrona de correct_text (para views ASGI)"""
+        corrigido = await self._acorrecao_em_cache(texto, deve_capitalizar)
+        if corrigido:
+            return corrigido
+
+        inicio = time.monotonic()
+        response = await self.amake_request("chat/completions", self._payload_correcao(texto, deve_capitalizar))
+        obter_cache_correcoes().registrar_chamada(self.provedor, time.monotonic() - inicio)
+
+        return await self._aprocessar_correcao(response, texto, deve_capitalizar)
 
+    def _parametros_correcao(self, deve_capitalizar):
+        return {
+            'deve_capitalizar': bool(deve_capitalizar),
+            'prompt': obter_prompt('correcao_texto').identificador
+        }
+
+    def _correcao_em_cache(self, texto, deve_capitalizar):
+        """Procura a correção pelo texto exato e depois ignorando a caixa da primeira letra"""
+        cache_correcoes = obter_cache_correcoes()
+        parametros = self._parametros_correcao(deve_capitalizar)
+
+        corrigido = cache_correcoes.obter(texto, self.provedor, self.modelo_correcao, parametros)
+        if corrigido:
+            registro.registrar_acerto_cache(self.provedor, self.modelo_correcao, 'correcoes')
+            return corrigido
+
+        corrigido = cache_correcoes.obter(
+            self._chave_sem_inicio(texto), f'{self.provedor}:inicio', self.modelo_correcao, parametros
+        )
+        if corrigido:
+            registro.registrar_acerto_cache(self.provedor, self.modelo_correcao, 'correcoes')
+            return self._ajustar_inicio(corrigido, texto, deve_capitalizar)
+        return None
+
+    async def _acorrecao_em_cache(self, texto, deve_capitalizar):
+        """Versão assíncrona de _correcao_em_cache"""
+        cache_correcoes = obter_cache_correcoes()
+        parametros = self._parametros_correcao(deve_capitalizar)
+
+        corrigido = await cache_correcoes.aobter(texto, self.provedor, self.modelo_correcao, parametros)
+        if corrigido:
+            registro.registrar_acerto_cache(self.provedor, self.modelo_correcao, 'correcoes')
+            return corrigido
+
+        corrigido = await cache_correcoes.aobter(
+            self._chave_sem_inicio(texto), f'{self.provedor}:inicio', self.modelo_correcao, parametros
+        )
+        if corrigido:
+            registro.registrar_acerto_cache(self.provedor, self.modelo_correcao, 'correcoes')
+            return self._ajustar_inicio(corrigido, texto, deve_capitalizar)
+        return None
+
+    def _processar_correcao(self, response, texto, deve_capitalizar):
+        """Extrai a correção da resposta do provedor e a guarda nos dois níveis do cache"""
+        corrigido = self._extrair_correcao(response)
+        if corrigido:
+            cache_correcoes = obter_cache_correcoes()
+            parametros = self._parametros_correcao(deve_capitalizar)
+            cache_correcoes.guardar(texto, self.provedor, self.modelo_correcao, corrigido, parametros)
+            cache_correcoes.guardar(
+                self._chave_sem_inicio(texto), f'{self.provedor}:inicio', self.modelo_correcao, corrigido, parametros
+            )
+        return corrigido
+
+    async def _aprocessar_correcao(self, response, texto, deve_capitalizar):
+        """Versão assíncrona de _processar_correcao"""
+        corrigido = self._extrair_correcao(response)
+        if corrigido:
+            cache_correcoes = obter_cache_correcoes()
+            parametros = self._parametros_correcao(deve_capitalizar)
+            await cache_correcoes.aguardar(texto, self.provedor, self.modelo_correcao, corrigido, parametros)
+            await cache_correcoes.aguardar(
+                self._chave_sem_inicio(texto), f'{self.provedor}:inicio', self.modelo_correcao, corrigido, parametros
+            )
+        return corrigido
+
+    @staticmethod
+    def _extrair_correcao(response):
+        if not (response and 'choices' in response and len(response['choices']) > 0):
+            return None
+        return response['choices'][0]['message']['content'].strip()
+
+    @staticmethod
+    def _chave_sem_inicio(texto):
+        """Texto com só a primeira letra em minúscula; o resto precisa coincidir"""
+        texto = texto.lstrip()
+        return texto[:1].casefold() + texto[1:]
+
+    def _ajustar_inicio(self, corrigido, texto, deve_capitalizar):
+        """Aplica à primeira letra da correção a regra de capitalização do texto ditado"""
+        original = texto.lstrip()[:1]
+        if deve_capitalizar or original.isupper():
+            return corrigido[:1].upper() + corrigido[1:]
+        if original.islower():
+            return corrigido[:1].lower() + corrigido[1:]
+        return corrigido
+
+    def _payload_correcao(self, texto, deve_capitalizar):
         capitalizacao_texto = 'Comece a frase com letra Maiúscula.' if deve_capitalizar else 'Mantenha a caixa alta/baixa original da primeira palavra, a menos que seja nome próprio.'
-        system_prompt = system_prompt.format(capitalizacao=capitalizacao_texto)
+        system_prompt, mensagem = obter_prompt('correcao_texto').montar(
+            capitalizacao=capitalizacao_texto,
+            texto=texto
+        )
 
         data = {
-            "model": "openai/gpt-oss-120b",
+            "model": self.modelo_correcao,
             "messages": [
                 {
                     "role": "system",
@@ -157,18 +690,33 @@ Regras:
                 },
                 {
                     "role": "user",
-                    "content": texto
+                    "content": mensagem
                 }
             ],
             "temperature": 0.1,
             "max_tokens": 1024
         }
+        return data
+
+    def correct_texts(self, segmentos):
+        """
+        Corrige vários textos de uma vez: segmentos é uma lista de
+        (texto, deve_capitalizar). Segmentos iguais são corrigidos uma única
+        vez e os demais rodam em paralelo (até AI_CORRECAO_LOTE_THREADS).
+        Retorna as correções na mesma ordem (None onde falhou).
+        """
+        unicos = list(dict.fromkeys(segmentos))
+        if not unicos:
+            return []
 
-        response = self.make_request("chat/completions", data)
+        threads = min(len(unicos), settings.AI_CORRECAO_LOTE_THREADS)
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            corrigidos = dict(zip(
+                unicos,
+                executor.map(lambda segmento: self.correct_text(*segmento), unicos)
+            ))
 
-        if response and 'choices' in response and len(response['choices']) > 0:
-            return response['choices'][0]['message']['content'].strip()
-        return None
+        return [corrigidos[segmento] for segmento in segmentos]
 
 
 def get_ai_service(service_name="openai"):
@@ -178,7 +726,8 @@ def get_ai_service(service_name="openai"):
     services = {
         "openai": OpenAIService,
         "openrouter": OpenRouterService,
-        "anthropic": AnthropicService
+        "anthropic": AnthropicService,
+        "groq": GroqService
     }
 
     service_class = services.get(service_name.lower())
@@ -188,77 +737,167 @@ def get_ai_service(service_name="openai"):
     return service_class()
 
 
-def generate_medical_text(prompt, service_name="openrouter", use_medical_context=True):
+def get_provider_order(service_name):
+    """
+    Ordem de tentativa dos provedores: o solicitado primeiro e depois os de
+    settings.AI_ROTEAMENTO['ORDEM'] que tenham chave de API configurada
+    """
+    service_name = service_name.lower()
+    apis_status = validate_api_keys()
+    ordem = [service_name] + [
+        provedor for provedor in settings.AI_ROTEAMENTO.get('ORDEM', [])
+        if provedor != service_name
+    ]
+    configurados = [provedor for provedor in ordem if apis_status.get(provedor)]
+    # Sem nenhuma chave configurada, tenta o solicitado para retornar o erro real
+    return configurados or [service_name]
+
+
+def _cache_params(service, prompt_id=None, max_tokens=None):
+    """Parâmetros de geração que fazem parte da chave do cache de respostas"""
+    parametros = {
+        'max_tokens': max_tokens or service.max_tokens_padrao,
+        'temperature': service.temperatura
+    }
+    if prompt_id:
+        # Versão das instruções fixas (api/prompts.py)
+        parametros['prompt'] = prompt_id
+    return parametros
+
+
+def _montar_prompt(prompt, use_medical_context, template):
+    """
+    Retorna (sistema, prompt final, identificador da versão do prompt,
+    orçamento de saída do prompt ou None)
+    """
+    if template is None and use_medical_context:
+        # Prompt específico para contexto médico
+        template = 'texto_medico'
+
+    if not template:
+        return None, prompt, None, None
+
+    modelo_prompt = obter_prompt(template)
+    sistema, final_prompt = modelo_prompt.montar(texto=prompt)
+    return sistema, final_prompt, modelo_prompt.identificador, modelo_prompt.max_tokens
+
+
+def _modelo_roteado(service):
+    """Modelo usado pelo provedor nas gerações roteadas (settings.AI_ROTEAMENTO['MODELOS'])"""
+    return obter_roteador().modelo(service.provedor) or service.modelo_padrao
+
+
+def _guardar_resposta(cache_respostas, final_prompt, service_usado, response, prompt_id, max_tokens):
+    # Guarda sob o provedor e o modelo que realmente responderam
+    cache_respostas.guardar(
+        final_prompt, service_usado.provedor, _modelo_roteado(service_usado),
+        response, _cache_params(service_usado, prompt_id, max_tokens)
+    )
+
+
+async def _aguardar_resposta(cache_respostas, final_prompt, service_usado, response, prompt_id, max_tokens):
+    await cache_respostas.aguardar(
+        final_prompt, service_usado.provedor, _modelo_roteado(service_usado),
+        response, _cache_params(service_usado, prompt_id, max_tokens)
+    )
+
+
+def generate_medical_text(prompt, service_name="openrouter", use_medical_context=True, template=None):
     """
     Função principal para gerar texto médico usando IA
+
+    template é o nome de um prompt registrado em api/prompts.py: as instruções
+    vão como mensagem de sistema e prompt preenche a parte variável. Sem
+    template, use_medical_context usa o prompt 'texto_medico'; caso contrário
+    o prompt é enviado como está.
     """
     try:
         service = get_ai_service(service_name)
-
-        # Cache para evitar chamadas desnecessárias
-        cache_key = f"ai_response_{hash(prompt + service_name)}"
-        cached_response = cache.get(cache_key)
+        sistema, final_prompt, prompt_id, max_tokens = _montar_prompt(prompt, use_medical_context, template)
+        # Orçamento de saída do caso de uso (ou do provedor solicitado), exigido
+        # também do fallback e do hedge
+        max_tokens = max_tokens or service.max_tokens_padrao
+
+        # Cache para evitar chamadas desnecessárias; a chave considera a parte
+        # variável do prompt, a versão das instruções, o provedor, o modelo e
+        # os parâmetros de geração
+        cache_respostas = obter_cache_respostas()
+        cached_response = cache_respostas.obter(
+            final_prompt, service.provedor, _modelo_roteado(service), _cache_params(service, prompt_id, max_tokens)
+        )
 
         if cached_response:
+            registro.registrar_acerto_cache(service.provedor, _modelo_roteado(service), 'respostas')
             return cached_response
 
-        final_prompt = prompt
-        if use_medical_context:
-            # Prompt específico para contexto médico
-            final_prompt = f"""
-            Contexto: {prompt}
-            Retorne o texto em Markdown com as respectivas formatações.
-
-            Usando o contexto acima, gere o laudo radiológico completo seguindo rigorosamente as instruções abaixo:            
-            Fonte do texto: Arial 12      
-            Titulo do laudo em Negrito e Maiúsculo, centralizado
-            Depois vc escreve Indicação Clínica em negrito e maíusculo. Se nenhuma indicação for fornecida, vc coloca "Avaliação Clínica"
-            para colocar a técnica do exame, vc escreve TÉCNICA em negrito e maiúsculo, dois pontos e depois escreve a técnica do exame. em exames de ultrassonografia, descrever a técnica em modo B e apenas citar o uso ou não do estudo com doppler se for mencionado. 
-            Depois coloca laudo: , em maiúsculo e negrito
-            No laudo deve ser colocada a descrição de todas as estruturas que a região estudada contém, e não apenas as alterações.
-            Depois o laudo, sem hífens ou bullets nos parágrafos. se for preciso, usar numeros para enumerar achados.
-            Depois vc escreve impressão diagnóstica: em negrito e maiúsculo e depois faz um resumo dos achados do laudo. 
-            Cada achado deve ficar em uma linha separada e não é preciso repetir as medidas do achado na conclusão.
-            Na conclusão não é para colocar nenhuma medida.
-
-            
+        # Gera com o provedor solicitado, com fallback/hedge para os demais
+        inicio = time.monotonic()
+        service_usado, response = obter_roteador().gerar(
+            final_prompt, get_provider_order(service_name), get_ai_service,
+            sistema=sistema, max_tokens=max_tokens
+        )
+        cache_respostas.registrar_chamada(service.provedor, time.monotonic() - inicio)
 
+        if response:
+            _guardar_resposta(cache_respostas, final_prompt, service_usado, response, prompt_id, max_tokens)
+            return response
 
-            Considerações específicas para cada laudo:
-            1. Em laudos de ultrassonografia de mamas, as descrições dos nódulos devem seguir o léxico do birads. Deve-se colocar, abaixo da conclusão: BI-RADS: X (X é o birads do exame de acordo com os achados). Abaixo disso colocar as Recomendações de acordo com o BIRADS e com o documento do ACR BIRADS
-            2. não é para falar nada de próstata em ultrassonografia do aparelho urinário exceto se for dito o contrário
-            3. não falar de ligamentos cruzados e meniscos em ultrassonografia de joelho
-            """
+        return "Erro: Não foi possível gerar a resposta médica."
 
-            # f"""
-            # Você é um assistente médico especializado em radiologia.
-            # Forneça uma resposta profissional, técnica e precisa.
+    except Exception as e:
+        # print(f"Erro no serviço de IA: {e}")
+        return f"Erro: {str(e)}"
 
-            # Contexto: {prompt}
 
-            # Responda de forma concisa e profissional, seguindo as melhores práticas médicas.
-            # """
+async def agenerate_medical_text(prompt, service_name="openrouter", use_medical_context=True, template=None):
+    """
+    Versão assíncrona de generate_medical_text (para views ASGI): as chamadas
+    aos provedores, inclusive o fallback e o hedge, não ocupam threads.
+    """
+    try:
+        service = get_ai_service(service_name)
+        sistema, final_prompt, prompt_id, max_tokens = _montar_prompt(prompt, use_medical_context, template)
+        # Orçamento de saída do caso de uso (ou do provedor solicitado), exigido
+        # também do fallback e do hedge
+        max_tokens = max_tokens or service.max_tokens_padrao
+
+        cache_respostas = obter_cache_respostas()
+        cached_response = await cache_respostas.aobter(
+            final_prompt, service.provedor, _modelo_roteado(service), _cache_params(service, prompt_id, max_tokens)
+        )
 
+        if cached_response:
+            registro.registrar_acerto_cache(service.provedor, _modelo_roteado(service), 'respostas')
+            return cached_response
 
-        response = service.generate_text(final_prompt)
+        inicio = time.monotonic()
+        service_usado, response = await obter_roteador().agerar(
+            final_prompt, get_provider_order(service_name), get_ai_service,
+            sistema=sistema, max_tokens=max_tokens
+        )
+        cache_respostas.registrar_chamada(service.provedor, time.monotonic() - inicio)
 
         if response:
-            # Cache por 1 hora
-            cache.set(cache_key, response, 3600)
+            await _aguardar_resposta(cache_respostas, final_prompt, service_usado, response, prompt_id, max_tokens)
             return response
 
         return "Erro: Não foi possível gerar a resposta médica."
 
     except Exception as e:
-        # print(f"Erro no serviço de IA: {e}")
         return f"Erro: {str(e)}"
 
 
-def generate_radiology_report(prompt, service_name="openrouter"):
+def generate_radiology_report(texto, service_name="openrouter"):
     """
-    Função específica para gerar laudos radiológicos
+    Função específica para gerar laudos radiológicos a partir das informações
+    ditadas pelo médico (prompt 'laudo_radiologia')
     """
-    return generate_medical_text(prompt, service_name, use_medical_context=False)
+    return generate_medical_text(texto, service_name, template='laudo_radiologia')
+
+
+async def agenerate_radiology_report(texto, service_name="openrouter"):
+    """Versão assíncrona de generate_radiology_report"""
+    return await agenerate_medical_text(texto, service_name, template='laudo_radiologia')
 
 
 def validate_api_keys():
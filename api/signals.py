@@ -41,3 +41,86 @@ BENEFÍCIOS:
 - Garante consistência: todos os novos usuários recebem os mesmos dados padrão
 """
 
+
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .biblioteca import clonar_biblioteca
+from .caching import invalidar_usuario
+from .models import CustomUser, Frase, ItemOculto, ModeloLaudo
+from .referencias import indexar_frases
+
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+# CÓPIA DA BIBLIOTECA INICIAL PARA NOVOS USUÁRIOS
+# =============================================================================
+
+@receiver(post_save, sender=CustomUser)
+def copiar_biblioteca_inicial(sender, instance, created, raw=False, **kwargs):
+    """
+    Copia para o usuário recém-criado a biblioteca (modelos de laudo, frases
+    com os vínculos e variáveis) do usuário semente, cujo e-mail está em
+    settings.USUARIO_SEMENTE_EMAIL. A cópia é feita em lote (api/biblioteca.py),
+    com um número de consultas que não depende do tamanho da biblioteca.
+
+    Só no modo 'copia' de settings.BIBLIOTECA_INICIAL_MODO; no modo
+    'compartilhada' não há cópia (ver api/compartilhada.py).
+    """
+    email_semente = getattr(settings, 'USUARIO_SEMENTE_EMAIL', '')
+    if getattr(settings, 'BIBLIOTECA_INICIAL_MODO', 'compartilhada') != 'copia':
+        return
+    if not created or raw or not email_semente or instance.email == email_semente:
+        return
+
+    semente = CustomUser.objects.filter(email=email_semente).first()
+    if semente is None:
+        return
+
+    try:
+        clonar_biblioteca(semente, instance)
+    except Exception:
+        # O cadastro não deve falhar por causa da cópia; a transação da cópia
+        # foi desfeita e o usuário começa com a biblioteca vazia
+        logger.exception('Erro ao copiar a biblioteca inicial para o usuário %s', instance.pk)
+
+
+# =============================================================================
+# INVALIDAÇÃO DO CACHE DE TAXONOMIA DE FRASES
+# =============================================================================
+
+@receiver(post_save, sender=Frase)
+@receiver(post_delete, sender=Frase)
+@receiver(post_save, sender=ModeloLaudo)
+@receiver(post_delete, sender=ModeloLaudo)
+@receiver(post_save, sender=ItemOculto)
+@receiver(post_delete, sender=ItemOculto)
+def invalidar_cache_taxonomia(sender, instance, **kwargs):
+    """
+    Frases e modelos alterados (ou registros compartilhados ocultados)
+    invalidam apenas o cache do seu dono
+    """
+    invalidar_usuario(instance.usuario_id)
+
+
+@receiver(m2m_changed, sender=Frase.modelos_laudo.through)
+def invalidar_cache_taxonomia_vinculos(sender, instance, action, **kwargs):
+    """Vínculos frase ↔ modelo alterados (instance pode ser Frase ou ModeloLaudo)"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_usuario(instance.usuario_id)
+
+
+# =============================================================================
+# ÍNDICE DE VARIÁVEIS REFERENCIADAS PELAS FRASES
+# =============================================================================
+
+@receiver(post_save, sender=Frase)
+def indexar_variaveis_da_frase(sender, instance, update_fields=None, **kwargs):
+    """Mantém ReferenciaVariavel em dia com o fraseBase da frase salva"""
+    if update_fields is not None and 'frase' not in update_fields:
+        return
+    indexar_frases([instance])
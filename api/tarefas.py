@@ -0,0 +1,127 @@
+"""
+Fila de tarefas em segundo plano (modelo Tarefa)
+
+As views apenas enfileiram a tarefa e respondem na hora com o id, sem ocupar
+o worker do servidor durante a chamada ao provedor de IA. O comando
+`python manage.py processar_tarefas` executa as tarefas pendentes em um pool
+de threads, respeitando o limite de execuções simultâneas de cada provedor
+(settings.TAREFAS_CONCORRENCIA). O andamento é consultado em /api/tarefas/.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Tarefa
+from .services import AIServiceError, GroqService, generate_radiology_report
+from .referencias import renomear_variavel_nas_frases
+
+_executores = {}
+
+
+def registrar_tarefa(tipo, provedor=''):
+    """
+    Registra a função que executa as tarefas do tipo informado.
+    A função recebe (usuario, reportar_progresso=..., **parametros) e o valor
+    retornado (serializável em JSON) fica em Tarefa.resultado.
+    """
+    def registrar(funcao):
+        _executores[tipo] = (funcao, provedor)
+        return funcao
+    return registrar
+
+
+def enfileirar(tipo, usuario, **parametros):
+    """Cria a tarefa pendente e a retorna"""
+    if tipo not in _executores:
+        raise ValueError(f"Tipo de tarefa '{tipo}' não registrado")
+    _, provedor = _executores[tipo]
+    return Tarefa.objects.create(
+        tipo=tipo,
+        provedor=provedor,
+        usuario=usuario,
+        parametros=parametros
+    )
+
+
+def limite_concorrencia(provedor):
+    """Quantas tarefas do provedor podem rodar ao mesmo tempo em um worker"""
+    limites = settings.TAREFAS_CONCORRENCIA
+    return limites.get(provedor or 'padrao', limites.get('padrao', 2))
+
+
+def reservar(tarefa):
+    """
+    Marca a tarefa como em execução. O UPDATE condicional garante que apenas
+    um worker fica com a tarefa; retorna False se outro chegou antes.
+    """
+    agora = timezone.now()
+    reservada = Tarefa.objects.filter(pk=tarefa.pk, status='pendente').update(
+        status='executando',
+        iniciado_em=agora,
+        atualizado_em=agora
+    )
+    return reservada == 1
+
+
+def executar(tarefa):
+    """Executa uma tarefa já reservada e grava o resultado ou o erro"""
+    funcao, _ = _executores.get(tarefa.tipo, (None, None))
+
+    def reportar_progresso(progresso, total):
+        Tarefa.objects.filter(pk=tarefa.pk).update(
+            progresso=progresso,
+            total=total,
+            atualizado_em=timezone.now()
+        )
+
+    try:
+        if funcao is None:
+            raise ValueError(f"Tipo de tarefa '{tarefa.tipo}' não registrado")
+        resultado = funcao(tarefa.usuario, reportar_progresso=reportar_progresso, **tarefa.parametros)
+        campos = {'status': 'concluida', 'resultado': resultado}
+    except Exception as e:
+        campos = {'status': 'erro', 'erro': str(e)}
+
+    agora = timezone.now()
+    Tarefa.objects.filter(pk=tarefa.pk).update(concluido_em=agora, atualizado_em=agora, **campos)
+
+
+def recuperar_interrompidas():
+    """
+    Devolve para a fila as tarefas em execução sem atualização há mais de
+    settings.TAREFAS_TEMPO_MAXIMO segundos (worker encerrado no meio da tarefa).
+    """
+    limite = timezone.now() - timedelta(seconds=settings.TAREFAS_TEMPO_MAXIMO)
+    return Tarefa.objects.filter(status='executando', atualizado_em__lt=limite).update(
+        status='pendente',
+        iniciado_em=None,
+        atualizado_em=timezone.now()
+    )
+
+
+@registrar_tarefa('gerar_laudo_radiologia', provedor='openrouter')
+def gerar_laudo_radiologia(usuario, texto, reportar_progresso=None):
+    laudo = generate_radiology_report(texto, service_name='openrouter')
+    if not laudo or laudo.startswith('Erro'):
+        raise AIServiceError(laudo or 'Erro ao gerar laudo radiológico')
+    return {'laudo': laudo}
+
+
+@registrar_tarefa('corrigir_texto', provedor='groq')
+def corrigir_texto(usuario, texto, deve_capitalizar=False, reportar_progresso=None):
+    texto_corrigido = GroqService().correct_text(texto, deve_capitalizar)
+    if not texto_corrigido:
+        raise AIServiceError('Erro ao corrigir texto')
+    return {'texto_corrigido': texto_corrigido}
+
+
+@registrar_tarefa('atualizar_frases_variavel')
+def atualizar_frases_variavel(usuario, titulo_antigo, titulo_novo, reportar_progresso=None):
+    frases_atualizadas = renomear_variavel_nas_frases(
+        titulo_antigo,
+        titulo_novo,
+        usuario,
+        reportar_progresso=reportar_progresso
+    )
+    return {'frases_atualizadas': frases_atualizadas}
@@ -1,3 +1,966 @@
-from django.test import TestCase
+import asyncio
+import io
+import threading
+import uuid
+from contextlib import nullcontext
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+import httpx
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from . import http_clients, resiliencia, services
+from .biblioteca import clonar_biblioteca
+from .models import CustomUser, Frase, ItemOculto, Metodo, ModeloLaudo, ReferenciaVariavel, Tarefa, Variavel
+from .prompts import obter_prompt
+from .roteamento import RoteadorIA
+from .serializers import FraseSerializer
+from .throttling import IAUsuarioThrottle
+
+
+def criar_usuario(email):
+    return CustomUser.objects.create_user(
+        email=email, username=email, password='senha', nome_completo='Usuário', telefone='0'
+    )
+
+
+def criar_frases(usuario, quantidade, modelos=()):
+    frases = [
+        Frase.objects.create(
+            usuario=usuario,
+            categoriaFrase=f'Categoria {i % 3}',
+            tituloFrase=f'Título {i}',
+            frase={'fraseBase': f'Texto {i}', 'substituicaoFraseBase': ''}
+        )
+        for i in range(quantidade)
+    ]
+    # Frases alternam entre nenhum, um e todos os modelos vinculados
+    for i, frase in enumerate(frases):
+        frase.modelos_laudo.add(*modelos[:i % (len(modelos) + 1)])
+    return frases
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class ListagemFrasesTests(TestCase):
+    """O número de consultas de GET /api/frases/ não depende do tamanho da página"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        metodo = Metodo.objects.create(metodo='TC')
+        modelos = [
+            ModeloLaudo.objects.create(titulo=f'Modelo {i}', texto='', metodo=metodo, usuario=self.usuario)
+            for i in range(2)
+        ]
+        criar_frases(self.usuario, 80, modelos)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def consultas_da_pagina(self, tamanho):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/api/frases/', {'page_size': tamanho})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()['results']), tamanho)
+        return len(consultas)
+
+    def assert_consultas_constantes(self):
+        # A primeira requisição preenche caches (geração do usuário, usuário semente)
+        self.client.get('/api/frases/', {'page_size': 1})
+        consultas = self.consultas_da_pagina(10)
+        with self.assertNumQueries(consultas):
+            resposta = self.client.get('/api/frases/', {'page_size': 60})
+        self.assertEqual(len(resposta.json()['results']), 60)
+
+    def test_consultas_nao_crescem_com_a_pagina(self):
+        self.assert_consultas_constantes()
+
+    def test_consultas_nao_crescem_com_a_biblioteca_compartilhada(self):
+        semente = criar_usuario('semente@exemplo.com')
+        criar_frases(semente, 40)
+        with override_settings(BIBLIOTECA_INICIAL_MODO='compartilhada', USUARIO_SEMENTE_EMAIL=semente.email):
+            cache.clear()
+            self.assert_consultas_constantes()
+
+
+class FraseListSerializerTests(TestCase):
+    """A serialização rápida das listas produz o mesmo que o ListSerializer padrão"""
+
+    def setUp(self):
+        usuario = criar_usuario('usuario@exemplo.com')
+        metodo = Metodo.objects.create(metodo='RM')
+        modelos = [
+            ModeloLaudo.objects.create(titulo=f'Modelo {i}', texto='', metodo=metodo, usuario=usuario)
+            for i in range(3)
+        ]
+        criar_frases(usuario, 12, modelos)
+        self.frases = Frase.objects.order_by('id')
+
+    def serializar(self, contexto=None):
+        rapida = FraseSerializer(self.frases, many=True, context=contexto or {}).data
+        padrao = serializers.ListSerializer(
+            self.frases, child=FraseSerializer(context=contexto or {}), context=contexto or {}
+        ).data
+        return rapida, padrao
+
+    def test_mesmo_resultado_do_list_serializer(self):
+        rapida, padrao = self.serializar()
+        self.assertEqual(len(rapida), 12)
+        self.assertEqual(rapida, padrao)
+
+    def test_mesmo_resultado_com_campos_selecionados(self):
+        rapida, padrao = self.serializar({'campos': ['id', 'tituloFrase', 'modelos_laudo']})
+        self.assertEqual(list(rapida[0]), ['id', 'tituloFrase', 'modelos_laudo'])
+        self.assertEqual(rapida, padrao)
+
+
+def taxas_throttle(**taxas):
+    """REST_FRAMEWORK com as taxas de throttle informadas no lugar das configuradas"""
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **taxas},
+    })
+
+
+class TokenBucketTests(TestCase):
+    """Consumo, negação e reposição do balde de tokens"""
+
+    def setUp(self):
+        cache.clear()
+        self.request = SimpleNamespace(user=criar_usuario('usuario@exemplo.com'))
+        self.view = SimpleNamespace(action='corrigir_texto')
+
+    def permitir(self, instante):
+        throttle = IAUsuarioThrottle()
+        with mock.patch('api.throttling.time.time', return_value=instante):
+            return throttle.allow_request(self.request, self.view), throttle.wait()
+
+    @taxas_throttle(ia_usuario='3/min')
+    def test_nega_quando_o_balde_esvazia_e_repoe_com_o_tempo(self):
+        for _ in range(3):
+            self.assertEqual(self.permitir(1000.0), (True, None))
+
+        permitido, espera = self.permitir(1000.0)
+        self.assertFalse(permitido)
+        # Um token a cada 20 segundos
+        self.assertAlmostEqual(espera, 20)
+
+        self.assertFalse(self.permitir(1019.0)[0])
+        self.assertTrue(self.permitir(1020.0)[0])
+        self.assertFalse(self.permitir(1020.0)[0])
+
+    @taxas_throttle(ia_usuario='3/min')
+    def test_nega_sem_a_trava_do_balde(self):
+        cache.add(f'throttle_ia_usuario_{self.request.user.pk}_trava', 1)
+        with mock.patch('api.throttling.time.sleep'):
+            permitido, espera = self.permitir(1000.0)
+        self.assertFalse(permitido)
+        self.assertEqual(espera, IAUsuarioThrottle.espera_sem_trava)
+
+
+@taxas_throttle(ia_usuario='2/min', ia_endpoint='100/min', ia_corrigir_texto='100/min', ia_provedor_groq='100/min')
+class ThrottleProvedorTests(TestCase):
+    """Requisições negadas pelo limite do usuário não consomem o balde do provedor"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(criar_usuario('usuario@exemplo.com'))
+
+    def test_usuario_acima_do_limite_nao_consome_o_provedor(self):
+        # Texto vazio: passa pelos throttles e é recusado pela view sem chamar o provedor
+        respostas = [self.client.post('/api/ia/corrigir_texto/', {'texto': ''}, format='json') for _ in range(6)]
+        self.assertEqual([r.status_code for r in respostas], [400, 400, 429, 429, 429, 429])
+
+        tokens, _ = cache.get('throttle_ia_provedor_groq_todos')
+        self.assertAlmostEqual(100 - tokens, 2, delta=0.5)
+
+
+@taxas_throttle(ia_usuario='100/min', ia_endpoint='100/min', ia_corrigir_textos_lote='100/min', ia_provedor_groq='100/min')
+class CorrecaoLoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(criar_usuario('usuario@exemplo.com'))
+
+    def corrigir(self, segmentos):
+        with mock.patch.object(services.GroqService, 'correct_texts', return_value=['ok'] * len(segmentos)) as corrigir:
+            resposta = self.client.post('/api/ia/corrigir_textos_lote/', {'segmentos': segmentos}, format='json')
+        return resposta, corrigir
+
+    def test_deve_capitalizar_em_texto_e_convertido(self):
+        resposta, corrigir = self.corrigir([
+            {'texto': ' a ', 'deve_capitalizar': 'false'},
+            {'texto': 'b', 'deve_capitalizar': True},
+            'c',
+        ])
+        self.assertEqual(resposta.status_code, 200)
+        corrigir.assert_called_once_with([('a', False), ('b', True), ('c', False)])
+
+    def test_deve_capitalizar_invalido_retorna_400(self):
+        for valor in ('sim', None, [1]):
+            resposta, corrigir = self.corrigir([{'texto': 'a', 'deve_capitalizar': valor}])
+            self.assertEqual(resposta.status_code, 400)
+            self.assertEqual(resposta.data, {'error': 'deve_capitalizar precisa ser booleano'})
+            corrigir.assert_not_called()
+
+
+class ServicoFalso:
+    """Serviço de IA que responde sem rede; registra o orçamento de cada chamada"""
+    temperatura = 0.7
+
+    def __init__(self, provedor, resposta='', falha=False, liberar=None):
+        self.provedor = provedor
+        self.modelo_padrao = f'{provedor}-padrao'
+        self.max_tokens_padrao = 20000 if provedor == 'openrouter' else 1000
+        self.resposta = resposta or f'laudo de {provedor}'
+        self.falha = falha
+        # Evento que segura a resposta (provedor lento) até ser liberado
+        self.liberar = liberar
+        self.chamadas = []
+
+    def generate_text(self, prompt, model=None, max_tokens=None, sistema=None):
+        self.chamadas.append(max_tokens)
+        if self.liberar is not None:
+            self.liberar.wait(5)
+        if self.falha:
+            raise ConnectionError(self.provedor)
+        return self.resposta
+
+
+class RoteamentoLaudoTests(TestCase):
+    """generate_radiology_report com o roteamento configurado em settings.AI_ROTEAMENTO"""
+
+    def setUp(self):
+        self.liberar = threading.Event()
+        self.addCleanup(self.liberar.set)
+        # Configuração de produção, com prazo de hedge curto e sem latências medidas
+        self.roteador = RoteadorIA({
+            **settings.AI_ROTEAMENTO,
+            'HEDGE': True,
+            'HEDGE_ATRASO_PADRAO': 0.05,
+            'HEDGE_MINIMO_AMOSTRAS': 10 ** 6,
+        })
+        self.servicos = {
+            provedor: ServicoFalso(provedor)
+            for provedor in ('openrouter', 'anthropic', 'openai', 'groq')
+        }
+        for alvo, valor in [
+            ('get_ai_service', lambda provedor: self.servicos[provedor]),
+            ('get_provider_order', lambda provedor: ['openrouter', 'anthropic', 'openai', 'groq']),
+            ('obter_roteador', lambda: self.roteador),
+        ]:
+            patcher = mock.patch.object(services, alvo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def gerar(self):
+        # Texto único: a resposta nunca vem do cache de respostas
+        return services.generate_radiology_report(f'exame {uuid.uuid4()}')
+
+    def test_orcamento_do_laudo_cabe_no_hedge_e_no_fallback(self):
+        orcamento = obter_prompt('laudo_radiologia').max_tokens
+        self.assertTrue(self.roteador.usa_hedge(orcamento))
+        for provedor in self.servicos:
+            self.assertTrue(self.roteador.comporta(provedor, orcamento), provedor)
+
+    def test_hedge_dispara_o_proximo_provedor_quando_o_primeiro_demora(self):
+        self.servicos['openrouter'].liberar = self.liberar
+
+        self.assertEqual(self.gerar(), 'laudo de anthropic')
+        orcamento = obter_prompt('laudo_radiologia').max_tokens
+        self.assertEqual(self.servicos['openrouter'].chamadas, [orcamento])
+        self.assertEqual(self.servicos['anthropic'].chamadas, [orcamento])
+
+    def test_fallback_pula_o_provedor_com_disjuntor_aberto(self):
+        self.servicos['openrouter'].falha = True
+        limite = self.roteador.disjuntor('openrouter').limite_falhas
+        for _ in range(limite):
+            self.assertEqual(self.gerar(), 'laudo de anthropic')
+        self.assertEqual(self.roteador.disjuntor('openrouter').estado, 'aberto')
+
+        chamadas = len(self.servicos['openrouter'].chamadas)
+        self.assertEqual(self.gerar(), 'laudo de anthropic')
+        self.assertEqual(len(self.servicos['openrouter'].chamadas), chamadas)
+
+
+def sem_ids_no_insert():
+    """Simula o MySQL, cujo INSERT com várias linhas não retorna as chaves primárias"""
+    return mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False)
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class GerenciarEntreModelosTests(TestCase):
+    """Cópia, movimentação e duplicação de frases entre modelos de laudo"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        metodo = Metodo.objects.create(metodo='TC')
+        self.origem, self.destino = [
+            ModeloLaudo.objects.create(titulo=titulo, texto='', metodo=metodo, usuario=self.usuario)
+            for titulo in ('Origem', 'Destino')
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def criar_frases_na_origem(self, quantidade):
+        frases = [
+            Frase.objects.create(
+                usuario=self.usuario, categoriaFrase='Fígado', tituloFrase=f'Achado {i}',
+                frase={'fraseBase': f'Lesão de {{medida}} no segmento {i}'}
+            )
+            for i in range(quantidade)
+        ]
+        for frase in frases:
+            frase.modelos_laudo.add(self.origem)
+        return frases
+
+    def gerenciar(self, modo, frases):
+        resposta = self.client.post('/api/frases/gerenciar-entre-modelos/', {
+            'modelo_origem_id': self.origem.id,
+            'modelo_destino_id': self.destino.id,
+            'frases_ids': [frase.id for frase in frases],
+            'modo_operacao': modo,
+        }, format='json')
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        return resposta.json()['estatisticas']
+
+    def test_copiar_conta_as_que_ja_estavam_no_destino(self):
+        frases = self.criar_frases_na_origem(4)
+        frases[0].modelos_laudo.add(self.destino)
+
+        stats = self.gerenciar('copiar', frases)
+
+        self.assertEqual((stats['processadas'], stats['ja_existiam']), (3, 1))
+        self.assertEqual(self.destino.frase_set.count(), 4)
+        self.assertEqual(self.origem.frase_set.count(), 4)
+
+    def test_mover_tira_as_frases_da_origem(self):
+        frases = self.criar_frases_na_origem(3)
+
+        stats = self.gerenciar('mover', frases)
+
+        self.assertEqual(stats['processadas'], 3)
+        self.assertEqual(self.origem.frase_set.count(), 0)
+        self.assertEqual(self.destino.frase_set.count(), 3)
+
+    def test_duplicar_cria_copias_vinculadas_e_indexadas(self):
+        frases = self.criar_frases_na_origem(3)
+
+        stats = self.gerenciar('duplicar', frases)
+
+        self.assertEqual((stats['duplicadas'], stats['processadas']), (3, 3))
+        copias = self.destino.frase_set.all()
+        self.assertEqual(len(copias), 3)
+        self.assertFalse({copia.pk for copia in copias} & {frase.pk for frase in frases})
+        self.assertEqual(
+            ReferenciaVariavel.objects.filter(frase__in=copias, tituloVariavel='medida').count(), 3
+        )
+
+    def test_duplicar_sem_ids_no_insert_usa_os_registros_recem_criados(self):
+        frases = self.criar_frases_na_origem(3)
+
+        with sem_ids_no_insert():
+            self.gerenciar('duplicar', frases)
+
+        copias = self.destino.frase_set.order_by('pk')
+        self.assertEqual([copia.tituloFrase for copia in copias], ['Achado 0', 'Achado 1', 'Achado 2'])
+        self.assertEqual(ReferenciaVariavel.objects.filter(frase__in=copias).count(), 3)
+
+    def assert_consultas_constantes(self, modo, simular_mysql=False):
+        poucas = self.criar_frases_na_origem(3)
+        muitas = self.criar_frases_na_origem(40)
+        contexto = sem_ids_no_insert() if simular_mysql else nullcontext()
+        with contexto:
+            with CaptureQueriesContext(connection) as consultas:
+                self.gerenciar(modo, poucas)
+            Frase.modelos_laudo.through.objects.filter(modelolaudo=self.destino).delete()
+            with self.assertNumQueries(len(consultas)):
+                self.gerenciar(modo, muitas)
+
+    def test_copiar_com_numero_constante_de_consultas(self):
+        self.assert_consultas_constantes('copiar')
+
+    def test_duplicar_com_numero_constante_de_consultas(self):
+        self.assert_consultas_constantes('duplicar')
+
+    def test_duplicar_sem_ids_no_insert_com_numero_constante_de_consultas(self):
+        self.assert_consultas_constantes('duplicar', simular_mysql=True)
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class RenomearVariavelTests(TestCase):
+    """Renomear uma variável atualiza as frases que a usam, encontradas pelo índice de referências"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        self.variavel = Variavel.objects.create(usuario=self.usuario, tituloVariavel='Medida', variavel={})
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def criar_frase(self, texto, usuario=None):
+        return Frase.objects.create(
+            usuario=usuario or self.usuario, categoriaFrase='Rim', tituloFrase=texto[:20],
+            frase={'fraseBase': texto}
+        )
+
+    def renomear(self, titulo):
+        resposta = self.client.patch(
+            f'/api/variaveis/{self.variavel.id}/', {'tituloVariavel': titulo}, format='json'
+        )
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        return resposta.json()
+
+    def test_atualiza_todas_as_frases_e_o_indice(self):
+        usam = [self.criar_frase(f'Cisto de {{Medida}} no polo {i}, {{Medida}} no total') for i in range(3)]
+        outra = self.criar_frase('Cisto de {MedidaMaxima}')
+        sem_variavel = self.criar_frase('Rins normais')
+
+        dados = self.renomear('Tamanho')
+
+        self.assertEqual(dados['frases_atualizadas'], 3)
+        for frase in usam:
+            frase.refresh_from_db()
+            self.assertNotIn('{Medida}', frase.frase['fraseBase'])
+            self.assertEqual(frase.frase['fraseBase'].count('{Tamanho}'), 2)
+        outra.refresh_from_db()
+        sem_variavel.refresh_from_db()
+        self.assertEqual(outra.frase['fraseBase'], 'Cisto de {MedidaMaxima}')
+        self.assertEqual(sem_variavel.frase['fraseBase'], 'Rins normais')
+
+        referencias = ReferenciaVariavel.objects.filter(usuario=self.usuario)
+        self.assertFalse(referencias.filter(tituloVariavel='Medida').exists())
+        self.assertEqual(
+            set(referencias.filter(tituloVariavel='Tamanho').values_list('frase_id', flat=True)),
+            {frase.id for frase in usam}
+        )
+
+    def test_numero_de_consultas_nao_depende_das_frases(self):
+        for i in range(3):
+            self.criar_frase(f'{{Medida}} {i}')
+        with CaptureQueriesContext(connection) as consultas:
+            self.renomear('Tamanho')
+
+        for i in range(40):
+            self.criar_frase(f'{{Tamanho}} extra {i}')
+            self.criar_frase(f'Sem variável {i}')
+        with self.assertNumQueries(len(consultas)):
+            self.assertEqual(self.renomear('Dimensao')['frases_atualizadas'], 43)
+
+    def test_frases_compartilhadas_sao_copiadas_antes_de_renomear(self):
+        semente = criar_usuario('semente@exemplo.com')
+        compartilhada = self.criar_frase('Baço de {Medida}', usuario=semente)
+
+        with override_settings(BIBLIOTECA_INICIAL_MODO='compartilhada', USUARIO_SEMENTE_EMAIL=semente.email):
+            cache.clear()
+            self.assertEqual(self.renomear('Tamanho')['frases_atualizadas'], 1)
+
+        copia = Frase.objects.get(usuario=self.usuario, origem=compartilhada)
+        self.assertEqual(copia.frase['fraseBase'], 'Baço de {Tamanho}')
+        compartilhada.refresh_from_db()
+        self.assertEqual(compartilhada.frase['fraseBase'], 'Baço de {Medida}')
+
+
+class ClientesAsyncTests(TestCase):
+    def test_clientes_fechados_quando_o_loop_termina(self):
+        async def obter():
+            cliente = http_clients.obter_cliente_async('groq')
+            self.assertIs(http_clients.obter_cliente_async('groq'), cliente)
+            return cliente
+
+        clientes = [asyncio.run(obter()), async_to_sync(obter)(), async_to_sync(obter)()]
+
+        self.assertEqual(len({id(cliente) for cliente in clientes}), 3)
+        self.assertTrue(all(cliente.is_closed for cliente in clientes))
+        self.assertEqual(len(http_clients._clientes_async), 0)
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class CacheTaxonomiaTests(TestCase):
+    """As listas de taxonomia ficam em cache até uma frase ou vínculo do usuário mudar"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        self.frases = criar_frases(self.usuario, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def categorias(self):
+        resposta = self.client.get('/api/frases/categorias_sem_metodos/')
+        self.assertEqual(resposta.status_code, 200)
+        return sorted(resposta.json()['categorias'])
+
+    def test_cache_e_invalidado_ao_salvar(self):
+        self.assertEqual(self.categorias(), ['Categoria 0', 'Categoria 1', 'Categoria 2'])
+        # update() não dispara signals: a lista continua vindo do cache
+        Frase.objects.filter(pk=self.frases[0].pk).update(categoriaFrase='Nova')
+        self.assertEqual(self.categorias(), ['Categoria 0', 'Categoria 1', 'Categoria 2'])
+
+        self.frases[1].save()
+        self.assertEqual(self.categorias(), ['Categoria 1', 'Categoria 2', 'Nova'])
+
+    def test_cache_e_invalidado_ao_excluir(self):
+        self.categorias()
+        self.frases[2].delete()
+        self.assertEqual(self.categorias(), ['Categoria 0', 'Categoria 1'])
+
+    def test_cache_e_invalidado_ao_vincular_modelo(self):
+        self.categorias()
+        modelo = ModeloLaudo.objects.create(
+            titulo='Modelo', texto='', metodo=Metodo.objects.create(metodo='TC'), usuario=self.usuario
+        )
+        # Pelos dois lados da relação ManyToMany
+        self.frases[0].modelos_laudo.add(modelo)
+        self.assertEqual(self.categorias(), ['Categoria 1', 'Categoria 2'])
+        modelo.frase_set.add(self.frases[1])
+        self.assertEqual(self.categorias(), ['Categoria 2'])
+        modelo.frase_set.clear()
+        self.assertEqual(self.categorias(), ['Categoria 0', 'Categoria 1', 'Categoria 2'])
+
+    def test_cache_de_outro_usuario_nao_e_afetado(self):
+        outro = criar_usuario('outro@exemplo.com')
+        self.categorias()
+        Frase.objects.filter(pk=self.frases[0].pk).update(categoriaFrase='Nova')
+        criar_frases(outro, 1)
+        self.assertNotIn('Nova', self.categorias())
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class ETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        self.variavel = Variavel.objects.create(
+            usuario=self.usuario, tituloVariavel='lado', variavel={'valores': ['direito']}
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def get_condicional(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_listagem_responde_304_com_a_mesma_etag(self):
+        resposta = self.client.get('/api/variaveis/')
+        self.assertEqual(resposta.status_code, 200)
+        etag = resposta['ETag']
+
+        resposta = self.get_condicional('/api/variaveis/', etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['ETag'], etag)
+        self.assertEqual(self.get_condicional('/api/variaveis/', f'W/{etag}').status_code, 304)
+
+        Variavel.objects.create(usuario=self.usuario, tituloVariavel='grau', variavel={})
+        resposta = self.get_condicional('/api/variaveis/', etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_detalhe_muda_de_etag_ao_editar(self):
+        url = f'/api/variaveis/{self.variavel.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.get_condicional(url, etag).status_code, 304)
+
+        self.client.patch(url, {'variavel': {'valores': ['esquerdo']}}, format='json')
+        self.assertEqual(self.get_condicional(url, etag).status_code, 200)
+
+    def test_vinculo_com_modelo_muda_a_etag_das_frases(self):
+        frase, = criar_frases(self.usuario, 1)
+        etag = self.client.get('/api/frases/')['ETag']
+        self.assertEqual(self.get_condicional('/api/frases/', etag).status_code, 304)
+
+        modelo = ModeloLaudo.objects.create(
+            titulo='Modelo', texto='', metodo=Metodo.objects.create(metodo='TC'), usuario=self.usuario
+        )
+        frase.modelos_laudo.add(modelo)
+        self.assertEqual(self.get_condicional('/api/frases/', etag).status_code, 200)
+
+
+def resposta_chat(texto):
+    return {'choices': [{'message': {'content': texto}, 'finish_reason': 'stop'}], 'usage': {}}
+
+
+class ResilienciaTests(TestCase):
+    """Novas tentativas e deduplicação das chamadas ao provedor, sem rede (httpx.MockTransport)"""
+
+    def servico(self, responder):
+        servico = services.GroqService()
+        servico.client = httpx.Client(transport=httpx.MockTransport(responder))
+        self.addCleanup(servico.client.close)
+        return servico
+
+    @mock.patch('api.resiliencia.random.uniform', return_value=0)
+    @mock.patch('api.services.time.sleep')
+    def test_429_e_repetido_apos_o_retry_after(self, dormir, _):
+        respostas = [
+            httpx.Response(429, headers={'Retry-After': '2'}),
+            httpx.Response(200, json=resposta_chat('ok')),
+        ]
+        servico = self.servico(lambda request: respostas.pop(0))
+
+        resultado = servico.make_request('chat/completions', {'model': 'm', 'messages': []})
+
+        self.assertEqual(servico.parse_response(resultado), 'ok')
+        self.assertEqual(respostas, [])
+        dormir.assert_called_once_with(2.0)
+
+    @override_settings(AI_RETENTATIVAS={**settings.AI_RETENTATIVAS, 'MAXIMO_TENTATIVAS': 2})
+    @mock.patch('api.services.time.sleep')
+    def test_desiste_apos_o_maximo_de_tentativas(self, dormir):
+        chamadas = []
+
+        def responder(request):
+            chamadas.append(request)
+            return httpx.Response(503)
+
+        self.assertIsNone(self.servico(responder).make_request('chat/completions', {'model': 'm'}))
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(dormir.call_count, 1)
+
+    def test_chamadas_identicas_simultaneas_compartilham_a_requisicao(self):
+        chamadas = []
+        liberar = threading.Event()
+        aguardando = threading.Event()
+
+        def responder(request):
+            chamadas.append(request)
+            liberar.wait(5)
+            return httpx.Response(200, json=resposta_chat('ok'))
+
+        class EventoObservado(threading.Event):
+            def wait(self, timeout=None):
+                aguardando.set()
+                return super().wait(timeout)
+
+        class ChamadaObservada(resiliencia._Chamada):
+            def __init__(self):
+                super().__init__()
+                self.concluida = EventoObservado()
+
+        servico = self.servico(responder)
+        dados = {'model': 'm', 'messages': [{'role': 'user', 'content': str(uuid.uuid4())}]}
+        resultados = []
+
+        def requisitar():
+            resultados.append(servico.make_request('chat/completions', dados))
+
+        with mock.patch.object(resiliencia, '_Chamada', ChamadaObservada):
+            primeira = threading.Thread(target=requisitar)
+            primeira.start()
+            # A segunda começa com a primeira em andamento e espera por ela
+            segunda = threading.Thread(target=requisitar)
+            segunda.start()
+            self.assertTrue(aguardando.wait(5))
+            liberar.set()
+            primeira.join(5)
+            segunda.join(5)
+
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual([servico.parse_response(r) for r in resultados], ['ok', 'ok'])
+
+
+@taxas_throttle(ia_usuario='100/min', ia_endpoint='100/min', ia_corrigir_texto='100/min', ia_provedor_groq='100/min')
+class FilaTarefasTests(TransactionTestCase):
+    """Enfileirar pela view, processar com o worker e consultar o resultado"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(criar_usuario('usuario@exemplo.com'))
+
+    def enfileirar_correcao(self):
+        resposta = self.client.post(
+            '/api/ia/corrigir_texto/?segundo_plano=true', {'texto': 'figado normal'}, format='json'
+        )
+        self.assertEqual(resposta.status_code, 202)
+        return resposta.json()['tarefa_id']
+
+    def processar(self, **correcao):
+        with mock.patch.object(services.GroqService, 'correct_text', **correcao) as corrigir:
+            call_command('processar_tarefas', '--uma-vez', threads=2, stdout=io.StringIO())
+        return corrigir
+
+    def test_tarefa_concluida_retorna_o_resultado(self):
+        tarefa_id = self.enfileirar_correcao()
+        resposta = self.client.get(f'/api/tarefas/{tarefa_id}/resultado/')
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(resposta.json()['status'], 'pendente')
+
+        corrigir = self.processar(return_value='Fígado normal.')
+
+        corrigir.assert_called_once_with('figado normal', False)
+        resposta = self.client.get(f'/api/tarefas/{tarefa_id}/resultado/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), {'texto_corrigido': 'Fígado normal.'})
+        self.assertEqual(Tarefa.objects.get(pk=tarefa_id).status, 'concluida')
+
+    def test_tarefa_com_erro_retorna_500(self):
+        tarefa_id = self.enfileirar_correcao()
+        self.processar(return_value=None)
+
+        resposta = self.client.get(f'/api/tarefas/{tarefa_id}/resultado/')
+        self.assertEqual(resposta.status_code, 500)
+        self.assertEqual(resposta.json(), {'error': 'Erro ao corrigir texto'})
+
+    def test_tarefa_de_outro_usuario_nao_e_visivel(self):
+        tarefa_id = self.enfileirar_correcao()
+        self.client.force_authenticate(criar_usuario('outro@exemplo.com'))
+        self.assertEqual(self.client.get(f'/api/tarefas/{tarefa_id}/resultado/').status_code, 404)
+
+
+def conteudo_biblioteca(usuario):
+    """Biblioteca do usuário sem ids, para comparar cópias"""
+    return {
+        'modelos': sorted(ModeloLaudo.objects.filter(usuario=usuario).values_list('titulo', 'texto', 'metodo__metodo')),
+        'variaveis': sorted(
+            (variavel.tituloVariavel, repr(variavel.variavel)) for variavel in Variavel.objects.filter(usuario=usuario)
+        ),
+        'frases': sorted(
+            (
+                frase.categoriaFrase, frase.tituloFrase, repr(frase.frase),
+                tuple(sorted(modelo.titulo for modelo in frase.modelos_laudo.all())),
+            )
+            for frase in Frase.objects.filter(usuario=usuario).prefetch_related('modelos_laudo')
+        ),
+        'referencias': sorted(
+            ReferenciaVariavel.objects.filter(usuario=usuario).values_list('frase__tituloFrase', 'tituloVariavel')
+        ),
+    }
+
+
+def criar_biblioteca(usuario, frases=6):
+    tc, rm = Metodo.objects.create(metodo='TC'), Metodo.objects.create(metodo='RM')
+    modelos = [
+        ModeloLaudo.objects.create(titulo='Crânio', texto='Texto {lado}', metodo=tc, usuario=usuario),
+        ModeloLaudo.objects.create(titulo='Joelho', texto='', metodo=rm, usuario=usuario),
+    ]
+    Variavel.objects.create(usuario=usuario, tituloVariavel='lado', variavel={'valores': ['direito', 'esquerdo']})
+    criadas = criar_frases(usuario, frases, modelos)
+    criadas[0].frase = {'fraseBase': 'Lesão à {lado}, grau {grau}', 'substituicaoFraseBase': ''}
+    criadas[0].save()
+    return modelos, criadas
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class BibliotecaNDJSONTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.origem = criar_usuario('origem@exemplo.com')
+        self.destino = criar_usuario('destino@exemplo.com')
+        criar_biblioteca(self.origem)
+        self.client = APIClient()
+
+    def exportar(self, usuario):
+        self.client.force_authenticate(usuario)
+        resposta = self.client.get('/api/biblioteca/exportar/')
+        self.assertEqual(resposta.status_code, 200)
+        return b''.join(resposta.streaming_content)
+
+    def importar(self, usuario, conteudo, substituir=False):
+        self.client.force_authenticate(usuario)
+        url = '/api/biblioteca/importar/' + ('?substituir=true' if substituir else '')
+        return self.client.post(url, conteudo, content_type='application/x-ndjson')
+
+    def test_exportar_e_importar_preserva_a_biblioteca(self):
+        resposta = self.importar(self.destino, self.exportar(self.origem))
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['estatisticas']['frases'], 6)
+        self.assertEqual(conteudo_biblioteca(self.destino), conteudo_biblioteca(self.origem))
+        self.assertIn(('Título 0', 'grau'), conteudo_biblioteca(self.destino)['referencias'])
+
+    def test_importar_com_substituir_nao_duplica(self):
+        arquivo = self.exportar(self.origem)
+        self.importar(self.destino, arquivo)
+        self.importar(self.destino, arquivo, substituir=True)
+        self.assertEqual(conteudo_biblioteca(self.destino), conteudo_biblioteca(self.origem))
+
+    def test_arquivo_invalido_nao_grava_nada(self):
+        arquivo = self.exportar(self.origem) + b'{"tipo": "frase", "modelos": [\n'
+        resposta = self.importar(self.destino, arquivo)
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(Frase.objects.filter(usuario=self.destino).exists())
+        self.assertFalse(ModeloLaudo.objects.filter(usuario=self.destino).exists())
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class ClonarBibliotecaTests(TestCase):
+    """A cópia da biblioteca para um novo usuário usa um número fixo de consultas"""
+
+    def consultas_da_copia(self, frases):
+        origem = criar_usuario(f'origem{frases}@exemplo.com')
+        criar_biblioteca(origem, frases)
+        destino = criar_usuario(f'destino{frases}@exemplo.com')
+
+        with CaptureQueriesContext(connection) as consultas:
+            contagens = clonar_biblioteca(origem, destino)
+
+        self.assertEqual(contagens['frases'], frases)
+        self.assertEqual(conteudo_biblioteca(destino), conteudo_biblioteca(origem))
+        return len(consultas)
+
+    def test_consultas_nao_crescem_com_a_biblioteca(self):
+        self.assertEqual(self.consultas_da_copia(3), self.consultas_da_copia(60))
+
+    def test_consultas_nao_crescem_sem_ids_no_insert(self):
+        # Como no MySQL: os ids dos registros novos são relidos
+        with sem_ids_no_insert():
+            self.assertEqual(self.consultas_da_copia(3), self.consultas_da_copia(60))
+
+    def test_nao_copia_para_quem_ja_tem_biblioteca(self):
+        origem, destino = criar_usuario('origem@exemplo.com'), criar_usuario('destino@exemplo.com')
+        criar_biblioteca(origem)
+        criar_frases(destino, 1)
+
+        self.assertIsNone(clonar_biblioteca(origem, destino))
+        self.assertEqual(Frase.objects.filter(usuario=destino).count(), 1)
+
+
+@override_settings(BIBLIOTECA_INICIAL_MODO='compartilhada', USUARIO_SEMENTE_EMAIL='semente@exemplo.com')
+class BibliotecaCompartilhadaTests(TestCase):
+    """Editar um registro compartilhado cria a cópia do usuário; excluir apenas o oculta"""
+
+    def setUp(self):
+        cache.clear()
+        self.semente = criar_usuario('semente@exemplo.com')
+        self.modelos, self.frases = criar_biblioteca(self.semente, 3)
+        self.compartilhada = self.frases[1]
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        self.outro = criar_usuario('outro@exemplo.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def ids_visiveis(self, usuario=None):
+        self.client.force_authenticate(usuario or self.usuario)
+        resposta = self.client.get('/api/frases/', {'page_size': 100})
+        self.client.force_authenticate(self.usuario)
+        return {frase['id'] for frase in resposta.json()['results']}
+
+    def test_usuario_enxerga_a_biblioteca_sem_copias(self):
+        self.assertEqual(self.ids_visiveis(), {frase.pk for frase in self.frases})
+        self.assertFalse(Frase.objects.filter(usuario=self.usuario).exists())
+
+    def test_editar_materializa_uma_copia(self):
+        url = f'/api/frases/{self.compartilhada.pk}/'
+        resposta = self.client.patch(url, {'tituloFrase': 'Meu título'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+
+        copia = Frase.objects.get(usuario=self.usuario)
+        self.assertEqual(resposta.json()['id'], copia.pk)
+        self.assertEqual(copia.origem_id, self.compartilhada.pk)
+        self.assertEqual(copia.tituloFrase, 'Meu título')
+        self.assertEqual(set(copia.modelos_laudo.all()), set(self.compartilhada.modelos_laudo.all()))
+        self.compartilhada.refresh_from_db()
+        self.assertEqual(self.compartilhada.tituloFrase, 'Título 1')
+
+        # A cópia substitui o original só para quem editou
+        esperado = {frase.pk for frase in self.frases} - {self.compartilhada.pk} | {copia.pk}
+        self.assertEqual(self.ids_visiveis(), esperado)
+        self.assertEqual(self.ids_visiveis(self.outro), {frase.pk for frase in self.frases})
+
+        # Editar de novo altera a mesma cópia
+        self.client.patch(f'/api/frases/{copia.pk}/', {'tituloFrase': 'Outro título'}, format='json')
+        self.assertEqual(Frase.objects.filter(usuario=self.usuario).count(), 1)
+
+    def test_excluir_oculta_sem_apagar(self):
+        resposta = self.client.delete(f'/api/frases/{self.compartilhada.pk}/')
+        self.assertEqual(resposta.status_code, 204)
+
+        self.assertTrue(Frase.objects.filter(pk=self.compartilhada.pk).exists())
+        self.assertTrue(ItemOculto.objects.filter(
+            usuario=self.usuario, tipo='frase', objeto_id=self.compartilhada.pk
+        ).exists())
+        self.assertNotIn(self.compartilhada.pk, self.ids_visiveis())
+        self.assertIn(self.compartilhada.pk, self.ids_visiveis(self.outro))
+
+    def test_excluir_copia_oculta_tambem_o_original(self):
+        self.client.patch(f'/api/frases/{self.compartilhada.pk}/', {'tituloFrase': 'Meu título'}, format='json')
+        copia = Frase.objects.get(usuario=self.usuario)
+
+        self.assertEqual(self.client.delete(f'/api/frases/{copia.pk}/').status_code, 204)
+
+        self.assertFalse(Frase.objects.filter(pk=copia.pk).exists())
+        self.assertEqual(self.ids_visiveis(), {frase.pk for frase in self.frases} - {self.compartilhada.pk})
+
+
+@override_settings(BIBLIOTECA_INICIAL_MODO='compartilhada', USUARIO_SEMENTE_EMAIL='semente@exemplo.com')
+class PaginacaoCursorTests(TestCase):
+    """Percorrer as páginas pelo cursor não pula nem repete itens"""
+
+    def setUp(self):
+        cache.clear()
+        self.semente = criar_usuario('semente@exemplo.com')
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        self.existentes = {frase.pk for frase in criar_frases(self.semente, 10) + criar_frases(self.usuario, 15)}
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def percorrer(self, ao_virar_pagina=lambda pagina: None):
+        ids, url, pagina = [], '/api/frases/?page_size=7', 0
+        while url:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            ids += [frase['id'] for frase in resposta.json()['results']]
+            url = resposta.json()['next']
+            pagina += 1
+            ao_virar_pagina(pagina)
+        return ids
+
+    def test_insercoes_durante_a_navegacao(self):
+        def inserir(pagina):
+            if pagina == 1:
+                criar_frases(self.usuario, 3)
+                criar_frases(self.semente, 2)
+
+        ids = self.percorrer(inserir)
+
+        self.assertEqual(len(ids), len(set(ids)))
+        # Os itens novos entram no fim da ordem e também são entregues
+        self.assertEqual(set(ids), set(Frase.objects.values_list('pk', flat=True)))
+        self.assertEqual(set(ids[:len(self.existentes)]), self.existentes)
+
+    def test_empate_em_atualizado_em_desempata_pelo_id(self):
+        Frase.objects.update(atualizado_em=Frase.objects.earliest('atualizado_em').atualizado_em)
+        ids = self.percorrer()
+        self.assertEqual(ids, sorted(self.existentes))
+
+    def test_cursor_invalido_retorna_404(self):
+        self.assertEqual(self.client.get('/api/frases/', {'cursor': 'invalido'}).status_code, 404)
+
+
+@override_settings(USUARIO_SEMENTE_EMAIL='')
+class CamposSelecionaveisTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = criar_usuario('usuario@exemplo.com')
+        self.frase, = criar_frases(self.usuario, 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_fields_e_omit_restringem_os_campos(self):
+        resposta = self.client.get('/api/frases/', {'fields': 'id,tituloFrase'})
+        self.assertEqual(resposta.json()['results'], [{'id': self.frase.pk, 'tituloFrase': 'Título 0'}])
+
+        resposta = self.client.get(f'/api/frases/{self.frase.pk}/', {'omit': 'frase,modelos_laudo'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn('frase', resposta.json())
+        self.assertIn('categoriaFrase', resposta.json())
+
+    def test_campo_desconhecido_retorna_400(self):
+        for parametro in ('fields', 'omit'):
+            resposta = self.client.get('/api/frases/', {parametro: 'id,inexistente'})
+            self.assertEqual(resposta.status_code, 400)
+            self.assertIn('inexistente', resposta.json()[parametro][0])
+
+        variavel = Variavel.objects.create(usuario=self.usuario, tituloVariavel='lado', variavel={})
+        resposta = self.client.get(f'/api/variaveis/{variavel.pk}/', {'fields': 'titulo'})
+        self.assertEqual(resposta.status_code, 400)
@@ -0,0 +1,139 @@
+"""
+Limites de uso dos endpoints de IA (token bucket)
+
+Cada balde tem uma capacidade e é reabastecido continuamente: com a taxa
+'10/min' o usuário pode fazer até 10 requisições seguidas e depois ganha uma
+nova a cada 6 segundos. Os baldes ficam no cache do Django, então com um
+cache compartilhado (Redis, Memcached, banco) o limite vale para todos os
+workers.
+
+As taxas ficam em REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']:
+- 'ia_usuario': todas as chamadas de IA de um usuário
+- 'ia_<action>' (ou 'ia_endpoint'): cada endpoint, por usuário
+- 'ia_provedor_<provedor>': todas as chamadas a um provedor, somando os usuários
+"""
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache as default_cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def interpretar_taxa(taxa):
+    """'10/min' -> (10, 60). Aceita s, m, h, d ou palavras começando por elas"""
+    quantidade, periodo = taxa.split('/')
+    return int(quantidade), PERIODOS[periodo.strip()[0].lower()]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle de token bucket. Por padrão o escopo é o atributo scope e o
+    balde é de cada usuário (ou IP, para anônimos); as subclasses podem
+    sobrescrever obter_escopo() e obter_identificador(). None em qualquer
+    um dos dois desativa o limite para a requisição.
+    """
+    cache = default_cache
+    scope = None
+    # Tentativas de obter a trava do balde antes de negar a requisição
+    tentativas_trava = 20
+    # Segundos sugeridos no Retry-After quando a trava não foi obtida
+    espera_sem_trava = 1
+
+    def obter_escopo(self, request, view):
+        return self.scope
+
+    def obter_identificador(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return f'anon_{self.get_ident(request)}'
+
+    def get_rate(self, scope):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+
+    def allow_request(self, request, view):
+        self.espera = None
+        scope = self.obter_escopo(request, view)
+        ident = self.obter_identificador(request, view)
+        taxa = self.get_rate(scope) if scope else None
+        if taxa is None or ident is None:
+            return True
+
+        capacidade, periodo = interpretar_taxa(taxa)
+        reposicao = capacidade / periodo
+        chave = f'throttle_{scope}_{ident}'
+
+        with self._trava(chave) as obtida:
+            if not obtida:
+                # Sem a trava o ler-e-gravar perderia consumos de requisições
+                # simultâneas; na dúvida a requisição é negada
+                self.espera = self.espera_sem_trava
+                return False
+
+            agora = time.time()
+            tokens, atualizado_em = self.cache.get(chave, (capacidade, agora))
+            tokens = min(capacidade, tokens + (agora - atualizado_em) * reposicao)
+
+            permitido = tokens >= 1
+            if permitido:
+                tokens -= 1
+            else:
+                self.espera = (1 - tokens) / reposicao
+
+            self.cache.set(chave, (tokens, agora), periodo)
+        return permitido
+
+    def wait(self):
+        return self.espera
+
+    @contextmanager
+    def _trava(self, chave):
+        """
+        Trava curta no cache para o ler-e-gravar do balde entre workers.
+        Produz True se a trava foi obtida.
+        """
+        chave_trava = f'{chave}_trava'
+        obtida = False
+        for _ in range(self.tentativas_trava):
+            if self.cache.add(chave_trava, 1, timeout=2):
+                obtida = True
+                break
+            time.sleep(0.005)
+        try:
+            yield obtida
+        finally:
+            if obtida:
+                self.cache.delete(chave_trava)
+
+
+class IAUsuarioThrottle(TokenBucketThrottle):
+    """Todas as chamadas de IA de um usuário"""
+    scope = 'ia_usuario'
+
+
+class IAEndpointThrottle(IAUsuarioThrottle):
+    """Cada endpoint de IA, por usuário ('ia_<action>' ou 'ia_endpoint')"""
+
+    def obter_escopo(self, request, view):
+        scope = f'ia_{view.action}'
+        return scope if self.get_rate(scope) else 'ia_endpoint'
+
+    def obter_identificador(self, request, view):
+        return f'{view.action}_{super().obter_identificador(request, view)}'
+
+
+class IAProvedorThrottle(TokenBucketThrottle):
+    """
+    Chamadas a um provedor somando todos os usuários, para não estourar o
+    limite da chave de API. O provedor de cada action vem de
+    view.provedores_throttle.
+    """
+
+    def obter_escopo(self, request, view):
+        provedor = getattr(view, 'provedores_throttle', {}).get(view.action)
+        return f'ia_provedor_{provedor}' if provedor else None
+
+    def obter_identificador(self, request, view):
+        return 'todos'
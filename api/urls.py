@@ -2,17 +2,23 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     MetodoViewSet, ModeloLaudoViewSet,
-    FraseViewSet, VariavelViewSet, AuthViewSet, IAViewSet
+    FraseViewSet, VariavelViewSet, BibliotecaViewSet, AuthViewSet, IAViewSet, TarefaViewSet
 )
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'metodos', MetodoViewSet)
 router.register(r'modelo_laudo', ModeloLaudoViewSet, basename='modelo_laudo')
 router.register(r'frases', FraseViewSet, basename='frases')
 router.register(r'variaveis', VariavelViewSet, basename='variaveis')
+router.register(r'biblioteca', BibliotecaViewSet, basename='biblioteca')
 router.register(r'auth', AuthViewSet, basename='auth')
 router.register(r'ia', IAViewSet, basename='ia')
+router.register(r'tarefas', TarefaViewSet, basename='tarefas')
 
 urlpatterns = [
+    # Versões assíncronas dos endpoints de IA (servidor ASGI)
+    path('ia/async/gerar_laudo_radiologia/', async_views.gerar_laudo_radiologia, name='ia-async-gerar-laudo-radiologia'),
+    path('ia/async/corrigir_texto/', async_views.corrigir_texto, name='ia-async-corrigir-texto'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""
+Funções utilitárias compartilhadas pelo app
+"""
+import re
+
+# Variáveis são referenciadas nos textos pelo título entre chaves: {Título da Variável}
+PADRAO_VARIAVEL = re.compile(r'\{([^{}]+)\}')
+
+
+def extrair_variaveis(texto):
+    """
+    Retorna os títulos das variáveis referenciadas no texto, sem repetição
+    e na ordem em que aparecem.
+    """
+    if not texto or not isinstance(texto, str):
+        return []
+    return list(dict.fromkeys(PADRAO_VARIAVEL.findall(texto)))
+
+
+def obter_frase_base(conteudo):
+    """Retorna o texto fraseBase do JSON de uma frase (ou '' se não houver)"""
+    if not isinstance(conteudo, dict):
+        return ''
+    frase_base = conteudo.get('fraseBase', '')
+    return frase_base if isinstance(frase_base, str) else ''
@@ -1,15 +1,42 @@
+import json
+
+from django.conf import settings
 from django.shortcuts import render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Max
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import MultiPartParser
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
-from .models import Metodo, ModeloLaudo, Frase, Variavel
+from .models import Metodo, ModeloLaudo, Frase, Variavel, Tarefa
 from .serializers import (
     MetodoSerializer, ModeloLaudoSerializer,
-    FraseSerializer, VariavelSerializer, LoginSerializer, CustomUserSerializer
+    FraseSerializer, VariavelSerializer, LoginSerializer, CustomUserSerializer,
+    TarefaSerializer, SegmentoCorrecaoSerializer
 )
-from .services import generate_radiology_report, GroqService
+from .services import generate_radiology_report, get_ai_service, GroqService
+from .renderers import EventStreamRenderer, NDJSONRenderer
+from .parsers import NDJSONParser
+from .ai_cache import obter_cache_respostas, obter_cache_correcoes
+from .metricas import registro
+from .roteamento import obter_roteador
+from .prompts import obter_prompt
+from .utils import extrair_variaveis, obter_frase_base
+from .caching import obter_geracao_visivel, obter_ou_calcular, invalidar_usuario
+from .compartilhada import visiveis, frases_do_modelo, modelos_equivalentes, materializar, materializar_em_lote, excluir
+from .bulk import criar_em_lote_com_ids, vincular_frases_modelos
+from .tarefas import enfileirar
+from .referencias import indexar_frases, renomear_variavel_nas_frases
+from .biblioteca import ErroImportacao, aexportar_biblioteca, exportar_biblioteca, importar_biblioteca
+from .mixins import CamposSelecionaveisMixin, ETagMixin
+from .pagination import PaginacaoCursor
+from .throttling import IAUsuarioThrottle, IAEndpointThrottle, IAProvedorThrottle
 
 # Create your views here.
 
@@ -18,27 +45,99 @@ class MetodoViewSet(viewsets.ModelViewSet):
     serializer_class = MetodoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class ModeloLaudoViewSet(viewsets.ModelViewSet):
+class ModeloLaudoViewSet(CamposSelecionaveisMixin, ETagMixin, viewsets.ModelViewSet):
     serializer_class = ModeloLaudoSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginacaoCursor
 
     def get_queryset(self):
-        # Retorna apenas os modelos do usuário logado
-        return ModeloLaudo.objects.filter(usuario=self.request.user)
+        # Retorna os modelos do usuário logado e os da biblioteca compartilhada
+        return visiveis(ModeloLaudo, self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(usuario=self.request.user)
 
-class FraseViewSet(viewsets.ModelViewSet):
+    def perform_update(self, serializer):
+        # Modelos compartilhados são copiados para o usuário antes de alterados
+        serializer.instance = materializar(serializer.instance, self.request.user)
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        excluir(instance, self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def editor(self, request, pk=None):
+        """
+        Retorna, em uma única resposta, tudo o que o editor precisa para abrir o
+        modelo: a árvore categoria → título → frases e as variáveis referenciadas.
+        Substitui as chamadas encadeadas a categorias, titulos_frases e frases.
+        """
+        modelo = self.get_object()
+
+        try:
+            # Uma consulta para as frases e uma para os vínculos com modelos
+            # (FraseListSerializer); o agrupamento é feito em memória
+            frases = frases_do_modelo(
+                visiveis(Frase, request.user), modelo.id, request.user
+            ).order_by('categoriaFrase', 'tituloFrase', 'id')
+
+            frases_serializadas = FraseSerializer(
+                frases, many=True, context=self.get_serializer_context()
+            ).data
+
+            categorias = []
+            titulos_variaveis = extrair_variaveis(modelo.texto)
+            for frase in frases_serializadas:
+                if not categorias or categorias[-1]['categoria'] != frase['categoriaFrase']:
+                    categorias.append({'categoria': frase['categoriaFrase'], 'titulos': []})
+                titulos = categorias[-1]['titulos']
+                if not titulos or titulos[-1]['titulo'] != frase['tituloFrase']:
+                    titulos.append({'titulo': frase['tituloFrase'], 'frases': []})
+                titulos[-1]['frases'].append(frase)
+
+                titulos_variaveis.extend(extrair_variaveis(obter_frase_base(frase['frase'])))
+
+            variaveis = visiveis(Variavel, request.user).filter(
+                tituloVariavel__in=set(titulos_variaveis)
+            ).order_by('tituloVariavel')
+
+            return Response({
+                'modelo': self.get_serializer(modelo).data,
+                'categorias': categorias,
+                'variaveis': VariavelSerializer(variaveis, many=True).data
+            })
+
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class FraseViewSet(CamposSelecionaveisMixin, ETagMixin, viewsets.ModelViewSet):
     serializer_class = FraseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginacaoCursor
+    acoes_campos_selecionaveis = ('list', 'retrieve', 'frases', 'por_modelo')
+
+    def versao_etag(self):
+        # Vínculos com modelos de laudo não alteram atualizado_em da frase,
+        # mas incrementam a geração do cache do usuário
+        return obter_geracao_visivel(self.request.user.id)
 
     def perform_create(self, serializer):
         serializer.save(usuario=self.request.user)
 
+    def perform_update(self, serializer):
+        # Frases compartilhadas são copiadas para o usuário antes de alteradas
+        serializer.instance = materializar(serializer.instance, self.request.user)
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        excluir(instance, self.request.user)
+
     def get_queryset(self):
-        # Retorna apenas as frases do usuário logado
-        queryset = Frase.objects.filter(usuario=self.request.user)
+        # Retorna as frases do usuário logado e as da biblioteca compartilhada
+        queryset = visiveis(Frase, self.request.user)
         categoria = self.request.query_params.get('categoria', None)
         titulo_frase = self.request.query_params.get('titulo_frase', None)
         
@@ -54,15 +153,19 @@ class FraseViewSet(viewsets.ModelViewSet):
     def categorias_sem_metodos(self, request):
         try:
             # Busca categorias que não têm frases associadas a nenhum modelo
-            categorias = Frase.objects.filter(
-                modelos_laudo__isnull=True
-            ).values_list(
-                'categoriaFrase', 
-                flat=True
-            ).distinct()
+            categorias = obter_ou_calcular(
+                request.user.id,
+                'categorias_sem_metodos',
+                lambda: list(visiveis(Frase, request.user).filter(
+                    modelos_laudo__isnull=True
+                ).values_list(
+                    'categoriaFrase', 
+                    flat=True
+                ).distinct())
+            )
             
             return Response({
-                'categorias': list(categorias)
+                'categorias': categorias
             })
             
         except Exception as e:
@@ -83,15 +186,20 @@ class FraseViewSet(viewsets.ModelViewSet):
             
         try:
             # Busca categorias que têm frases associadas ao modelo
-            categorias = Frase.objects.filter(
-                modelos_laudo__id=modelo_laudo_id
-            ).values_list(
-                'categoriaFrase', 
-                flat=True
-            ).distinct()
+            categorias = obter_ou_calcular(
+                request.user.id,
+                'categorias',
+                lambda: list(frases_do_modelo(
+                    visiveis(Frase, request.user), modelo_laudo_id, request.user
+                ).values_list(
+                    'categoriaFrase', 
+                    flat=True
+                ).distinct()),
+                modelo_laudo_id=modelo_laudo_id
+            )
             
             return Response({
-                'categorias': list(categorias)
+                'categorias': categorias
             })
             
         except Exception as e:
@@ -111,17 +219,28 @@ class FraseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        try:
+        def buscar_titulos():
             # Busca títulos que têm frases na categoria especificada
-            queryset = Frase.objects.filter(categoriaFrase=categoria)
+            queryset = visiveis(Frase, request.user).filter(
+                categoriaFrase=categoria
+            )
             
             if modelo_laudo_id:
-                queryset = queryset.filter(modelos_laudo__id=modelo_laudo_id)
+                queryset = frases_do_modelo(queryset, modelo_laudo_id, request.user)
                 
-            titulos = queryset.values_list('tituloFrase', flat=True).distinct()
+            return list(queryset.values_list('tituloFrase', flat=True).distinct())
+
+        try:
+            titulos = obter_ou_calcular(
+                request.user.id,
+                'titulos_frases',
+                buscar_titulos,
+                modelo_laudo_id=modelo_laudo_id,
+                categoria=categoria
+            )
             
             return Response({
-                'titulos_frases': list(titulos)
+                'titulos_frases': titulos
             })
             
         except Exception as e:
@@ -143,18 +262,21 @@ class FraseViewSet(viewsets.ModelViewSet):
             
         try:
             # Busca frases com os filtros especificados
-            queryset = Frase.objects.filter(
-                tituloFrase=titulo_frase,
-                categoriaFrase=categoria
-            )
+            queryset = self.selecionar_colunas(visiveis(Frase, request.user).filter(
+                categoriaFrase=categoria,
+                tituloFrase=titulo_frase
+            ))
                 
-            # Serializa as frases encontradas
-            serializer = self.get_serializer(queryset, many=True)
+            # Serializa a página de frases encontradas
+            serializer = self.get_serializer(self.paginate_queryset(queryset), many=True)
             
             return Response({
-                'frases': serializer.data
+                'frases': serializer.data,
+                'next': self.paginator.get_next_link()
             })
             
+        except NotFound as e:
+            return Response({'error': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
@@ -198,15 +320,13 @@ class FraseViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            # Verifica se os modelos existem e pertencem ao usuário
-            modelo_origem = ModeloLaudo.objects.filter(
-                id=modelo_origem_id,
-                usuario=request.user
+            # Verifica se os modelos existem e são visíveis para o usuário
+            modelo_origem = visiveis(ModeloLaudo, request.user).filter(
+                id=modelo_origem_id
             ).first()
             
-            modelo_destino = ModeloLaudo.objects.filter(
-                id=modelo_destino_id,
-                usuario=request.user
+            modelo_destino = visiveis(ModeloLaudo, request.user).filter(
+                id=modelo_destino_id
             ).first()
             
             if not modelo_origem:
@@ -221,14 +341,18 @@ class FraseViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Busca as frases que pertencem ao modelo de origem
-            frases = Frase.objects.filter(
-                id__in=frases_ids,
-                modelos_laudo=modelo_origem,
-                usuario=request.user
+            # Busca as frases que pertencem ao modelo de origem (uma única consulta;
+            # o conteúdo só é necessário para duplicar)
+            frases = frases_do_modelo(
+                visiveis(Frase, request.user).filter(id__in=frases_ids),
+                modelo_origem.id,
+                request.user
             )
+            if modo_operacao != 'duplicar':
+                frases = frases.only('id', 'usuario_id')
+            frases = list(frases)
             
-            if frases.count() != len(frases_ids):
+            if len(frases) != len(frases_ids):
                 return Response(
                     {'error': 'Algumas frases não foram encontradas ou não pertencem ao modelo de origem'},
                     status=status.HTTP_400_BAD_REQUEST
@@ -243,36 +367,73 @@ class FraseViewSet(viewsets.ModelViewSet):
                 'erros': []
             }
             
-            # Executa a operação baseada no modo
-            if modo_operacao == 'copiar':
-                # COPIAR: Mantém no modelo origem e adiciona ao modelo destino
-                for frase in frases:
-                    if modelo_destino in frase.modelos_laudo.all():
-                        stats['ja_existiam'] += 1
+            ids_frases = [frase.id for frase in frases]
+            Vinculo = Frase.modelos_laudo.through
+            
+            # Executa a operação baseada no modo, de forma atômica e em lote
+            with transaction.atomic():
+                if modo_operacao in ('copiar', 'mover'):
+                    # Vínculos de frases compartilhadas só mudam nas cópias do usuário
+                    compartilhadas = [frase.id for frase in frases if frase.usuario_id != request.user.id]
+                    if compartilhadas:
+                        copias = materializar_em_lote(
+                            Frase, Frase.objects.filter(id__in=compartilhadas).order_by('id'), request.user
+                        )
+                        ids_frases = [
+                            frase.id for frase in frases if frase.usuario_id == request.user.id
+                        ] + [copia.id for copia in copias]
+                    
+                    # Frases que já estão vinculadas ao modelo destino
+                    ja_no_destino = set(Vinculo.objects.filter(
+                        modelolaudo_id__in=modelos_equivalentes(modelo_destino.id, request.user),
+                        frase_id__in=ids_frases
+                    ).values_list('frase_id', flat=True))
+                    
+                    if modo_operacao == 'mover':
+                        # MOVER: Remove do modelo origem e adiciona ao modelo destino
+                        Vinculo.objects.filter(
+                            modelolaudo_id__in=modelos_equivalentes(modelo_origem.id, request.user),
+                            frase_id__in=ids_frases
+                        ).delete()
+                    
+                    # COPIAR: Mantém no modelo origem e adiciona ao modelo destino
+                    vincular_frases_modelos(
+                        (frase_id, modelo_destino.id)
+                        for frase_id in ids_frases
+                        if frase_id not in ja_no_destino
+                    )
+                    
+                    if modo_operacao == 'copiar':
+                        stats['ja_existiam'] = len(ja_no_destino)
+                        stats['processadas'] = len(ids_frases) - len(ja_no_destino)
                     else:
-                        frase.modelos_laudo.add(modelo_destino)
-                        stats['processadas'] += 1
-            
-            elif modo_operacao == 'mover':
-                # MOVER: Remove do modelo origem e adiciona ao modelo destino
-                for frase in frases:
-                    frase.modelos_laudo.remove(modelo_origem)
-                    if modelo_destino not in frase.modelos_laudo.all():
-                        frase.modelos_laudo.add(modelo_destino)
-                    stats['processadas'] += 1
-            
-            elif modo_operacao == 'duplicar':
-                # DUPLICAR: Cria cópias independentes e vincula ao modelo destino
-                for frase in frases:
-                    nova_frase = Frase.objects.create(
-                        categoriaFrase=frase.categoriaFrase,
-                        tituloFrase=frase.tituloFrase,
-                        frase=frase.frase,
+                        stats['processadas'] = len(ids_frases)
+                
+                elif modo_operacao == 'duplicar':
+                    # DUPLICAR: Cria cópias independentes e vincula ao modelo destino.
+                    # Sem IDs no retorno do INSERT (MySQL), as cópias são as frases
+                    # do usuário acima do maior ID que ele tinha antes
+                    ultimo_id = Frase.objects.filter(
                         usuario=request.user
+                    ).aggregate(ultimo=Max('pk'))['ultimo'] or 0
+                    novas_frases = criar_em_lote_com_ids(Frase, [
+                        Frase(
+                            categoriaFrase=frase.categoriaFrase,
+                            tituloFrase=frase.tituloFrase,
+                            frase=frase.frase,
+                            usuario=request.user
+                        )
+                        for frase in frases
+                    ], Frase.objects.filter(usuario=request.user, pk__gt=ultimo_id))
+                    vincular_frases_modelos(
+                        (nova_frase.id, modelo_destino.id) for nova_frase in novas_frases
                     )
-                    nova_frase.modelos_laudo.add(modelo_destino)
-                    stats['duplicadas'] += 1
-                    stats['processadas'] += 1
+                    indexar_frases(novas_frases)
+                    stats['duplicadas'] = len(novas_frases)
+                    stats['processadas'] = len(novas_frases)
+            
+            # Operações em lote não disparam signals
+            invalidar_usuario(request.user.id)
             
             # Mensagem de sucesso
             mensagem = self._gerar_mensagem_sucesso(modo_operacao, stats)
@@ -307,7 +468,8 @@ class FraseViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def por_modelo(self, request):
         """
-        Retorna todas as frases associadas a um modelo de laudo específico.
+        Retorna as frases associadas a um modelo de laudo específico, uma
+        página por vez (cursor em 'next'), e o total de frases do modelo.
         Útil para a interface de transferência de frases.
         """
         modelo_laudo_id = request.query_params.get('modelo_laudo_id')
@@ -318,48 +480,76 @@ class FraseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            # Verifica se o modelo existe e pertence ao usuário
-            modelo = ModeloLaudo.objects.filter(
-                id=modelo_laudo_id,
-                usuario=request.user
+        def buscar_frases():
+            # Verifica se o modelo existe e é visível para o usuário
+            modelo = visiveis(ModeloLaudo, request.user).filter(
+                id=modelo_laudo_id
             ).first()
             
             if not modelo:
-                return Response(
-                    {'error': 'Modelo de laudo não encontrado ou você não tem permissão'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+                return None
             
             # Busca frases associadas ao modelo
-            frases = Frase.objects.filter(
-                modelos_laudo=modelo,
-                usuario=request.user
-            ).order_by('categoriaFrase', 'tituloFrase')
+            frases = frases_do_modelo(
+                visiveis(Frase, request.user), modelo.id, request.user
+            )
             
-            serializer = self.get_serializer(frases, many=True)
+            serializer = self.get_serializer(
+                self.paginate_queryset(self.selecionar_colunas(frases)), many=True
+            )
             
-            return Response({
+            return {
                 'frases': serializer.data,
-                'total': frases.count()
-            })
+                'total': frases.count(),
+                'next': self.paginator.get_next_link()
+            }
+
+        try:
+            dados = obter_ou_calcular(
+                request.user.id,
+                'por_modelo',
+                buscar_frases,
+                modelo_laudo_id=modelo_laudo_id,
+                cursor=request.query_params.get(self.paginator.cursor_query_param),
+                tamanho_pagina=self.paginator.obter_tamanho_pagina(request),
+                campos=self.campos_selecionados()
+            )
+            
+            if dados is None:
+                return Response(
+                    {'error': 'Modelo de laudo não encontrado ou você não tem permissão'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            return Response(dados)
         
+        except NotFound as e:
+            return Response({'error': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class VariavelViewSet(viewsets.ModelViewSet):
+class VariavelViewSet(CamposSelecionaveisMixin, ETagMixin, viewsets.ModelViewSet):
     serializer_class = VariavelSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginacaoCursor
 
     def perform_create(self, serializer):
         serializer.save(usuario=self.request.user)
 
+    def perform_update(self, serializer):
+        # Variáveis compartilhadas são copiadas para o usuário antes de alteradas
+        serializer.instance = materializar(serializer.instance, self.request.user)
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        excluir(instance, self.request.user)
+
     def get_queryset(self):
-        # Retorna apenas as variáveis do usuário logado
-        queryset = Variavel.objects.filter(usuario=self.request.user)
+        # Retorna as variáveis do usuário logado e as da biblioteca compartilhada
+        queryset = visiveis(Variavel, self.request.user)
         titulo = self.request.query_params.get('tituloVariavel', None)
         if titulo is not None:
             queryset = queryset.filter(tituloVariavel=titulo)
@@ -369,18 +559,35 @@ class VariavelViewSet(viewsets.ModelViewSet):
         """
         Atualiza uma variável e, se o título mudou, atualiza todas as frases
         que usam essa variável.
+        Com ?segundo_plano=true as frases são atualizadas em uma tarefa em
+        segundo plano, cujo progresso é consultado em /api/tarefas/<id>/.
         """
         instance = self.get_object()
         titulo_antigo = instance.tituloVariavel
         titulo_novo = request.data.get('tituloVariavel', titulo_antigo)
+        segundo_plano = request.query_params.get('segundo_plano', '').lower() in ('true', '1')
         
         # Chama o método update padrão
         response = super().update(request, *args, **kwargs)
         
         # Se o título mudou, atualiza todas as frases que usam essa variável
         if titulo_antigo != titulo_novo and response.status_code == status.HTTP_200_OK:
+            if segundo_plano:
+                tarefa = enfileirar(
+                    'atualizar_frases_variavel',
+                    request.user,
+                    titulo_antigo=titulo_antigo,
+                    titulo_novo=titulo_novo
+                )
+                response.data['tarefa_id'] = tarefa.id
+                response.data['mensagem'] = (
+                    'Variável atualizada com sucesso! '
+                    'As frases estão sendo atualizadas em segundo plano.'
+                )
+                return response
+
             try:
-                frases_atualizadas = self._atualizar_frases_com_variavel(
+                frases_atualizadas = renomear_variavel_nas_frases(
                     titulo_antigo, 
                     titulo_novo, 
                     request.user
@@ -402,35 +609,75 @@ class VariavelViewSet(viewsets.ModelViewSet):
         
         return response
 
-    def _atualizar_frases_com_variavel(self, titulo_antigo, titulo_novo, usuario):
+    @action(detail=True, methods=['get'])
+    def uso(self, request, pk=None):
         """
-        Atualiza todas as frases do usuário que contêm a variável com o título antigo.
-        Retorna o número de frases atualizadas.
+        Retorna as frases do usuário que referenciam a variável (útil antes de excluí-la).
         """
-        # Padrão a ser procurado: {tituloAntigo}
-        padrao_antigo = f'{{{titulo_antigo}}}'
-        padrao_novo = f'{{{titulo_novo}}}'
+        variavel = self.get_object()
+        frases_ids = list(visiveis(Frase, request.user).filter(
+            referencias_variaveis__tituloVariavel=variavel.tituloVariavel
+        ).order_by('id').values_list('id', flat=True))
         
-        # Busca todas as frases do usuário
-        frases = Frase.objects.filter(usuario=usuario)
-        
-        frases_atualizadas = 0
-        
-        for frase in frases:
-            # Verifica se a frase contém o padrão antigo no campo fraseBase
-            frase_base = frase.frase.get('fraseBase', '')
-            
-            if padrao_antigo in frase_base:
-                # Substitui todas as ocorrências do padrão antigo pelo novo
-                nova_frase_base = frase_base.replace(padrao_antigo, padrao_novo)
-                
-                # Atualiza o campo fraseBase
-                frase.frase['fraseBase'] = nova_frase_base
-                frase.save()
-                
-                frases_atualizadas += 1
-        
-        return frases_atualizadas
+        return Response({
+            'total_frases': len(frases_ids),
+            'frases_ids': frases_ids
+        })
+
+class BibliotecaViewSet(viewsets.ViewSet):
+    """
+    Exportação e importação da biblioteca do usuário (modelos de laudo,
+    variáveis e frases com seus vínculos) em NDJSON. Formato em api/biblioteca.py.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [NDJSONParser, MultiPartParser]
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, NDJSONRenderer])
+    def exportar(self, request):
+        """Envia a biblioteca em streaming, lida do banco em lotes"""
+        # Sob ASGI um iterador síncrono seria consumido inteiro em memória
+        # antes do envio; o assíncrono mantém o streaming
+        if isinstance(request._request, ASGIRequest):
+            conteudo = aexportar_biblioteca(request.user)
+        else:
+            conteudo = exportar_biblioteca(request.user)
+
+        response = StreamingHttpResponse(conteudo, content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="biblioteca.ndjson"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """
+        Importa um arquivo gerado por exportar: corpo em application/x-ndjson
+        ou upload multipart no campo 'arquivo'. Com ?substituir=true a
+        biblioteca atual é apagada antes. Um arquivo inválido não grava nada.
+        """
+        if request.content_type.startswith('multipart/'):
+            linhas = request.FILES.get('arquivo')
+        else:
+            linhas = request.data
+
+        if not linhas:
+            return Response(
+                {'error': 'Envie o arquivo NDJSON no corpo ou no campo "arquivo"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        substituir = request.query_params.get('substituir', '').lower() in ('true', '1')
+
+        try:
+            estatisticas = importar_biblioteca(request.user, linhas, substituir=substituir)
+            return Response({'success': True, 'estatisticas': estatisticas})
+
+        except ErroImportacao as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {'error': f'Erro ao importar biblioteca: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 
 class AuthViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['post'])
@@ -513,11 +760,120 @@ class AuthViewSet(viewsets.ViewSet):
 
 class IAViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [IAUsuarioThrottle, IAEndpointThrottle, IAProvedorThrottle]
+    # Provedor chamado por cada action, para o limite por provedor
+    provedores_throttle = {
+        'gerar_laudo_radiologia': 'openrouter',
+        'gerar_laudo_radiologia_stream': 'openrouter',
+        'corrigir_texto': 'groq',
+        'corrigir_textos_lote': 'groq',
+    }
+
+    def check_throttles(self, request):
+        # O DRF consulta todos os throttles mesmo depois de uma negação, o que
+        # consumiria o balde do provedor (compartilhado por todos os usuários)
+        # com requisições já negadas pelo limite do usuário. Para no primeiro
+        # que negar, na ordem de throttle_classes, como em async_views.
+        for throttle in self.get_throttles():
+            if not throttle.allow_request(request, self):
+                self.throttled(request, throttle.wait())
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAdminUser],
+        throttle_classes=[]
+    )
+    def metricas(self, request):
+        """
+        Métricas dos serviços de IA deste processo (somente administradores)
+
+        provedores: resultado das gerações por provedor (usado pelo roteamento);
+        chamadas: requisições HTTP por provedor e modelo, com p50/p95/p99 da
+        duração, do tempo até o primeiro byte e da espera por vaga.
+        """
+        return Response({
+            'cache_respostas': obter_cache_respostas().estatisticas(),
+            'cache_correcoes': obter_cache_correcoes().estatisticas(),
+            'provedores': registro.estatisticas(),
+            'chamadas': registro.estatisticas_chamadas(),
+            'disjuntores': obter_roteador().estados()
+        })
+
+    @action(
+        detail=False,
+        methods=['post'],
+        renderer_classes=[JSONRenderer, EventStreamRenderer]
+    )
+    def gerar_laudo_radiologia_stream(self, request):
+        """
+        Versão em streaming de gerar_laudo_radiologia: envia o laudo como
+        Server-Sent Events à medida que o provedor gera o texto.
+
+        Eventos: 'data: {"texto": "..."}' para cada trecho, 'event: fim' ao
+        terminar e 'event: erro' em caso de falha.
+        Em servidores ASGI o stream é assíncrono e não ocupa uma thread.
+        """
+        texto = request.data.get('texto', '').strip()
+
+        if not texto:
+            return Response(
+                {'error': 'Texto com informações do exame é obrigatório'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        modelo_prompt = obter_prompt('laudo_radiologia')
+        sistema, mensagem = modelo_prompt.montar(texto=texto)
+        service = get_ai_service("openrouter")
+
+        def evento(dados, nome=None):
+            prefixo = f"event: {nome}\n" if nome else ''
+            return f"{prefixo}data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+        def eventos():
+            try:
+                for trecho in service.stream_text(mensagem, max_tokens=modelo_prompt.max_tokens, sistema=sistema):
+                    yield evento({'texto': trecho})
+                yield evento({}, 'fim')
+            except Exception as e:
+                yield evento({'error': 'Erro ao gerar laudo radiológico'}, 'erro')
+
+        async def eventos_async():
+            try:
+                async for trecho in service.astream_text(mensagem, max_tokens=modelo_prompt.max_tokens, sistema=sistema):
+                    yield evento({'texto': trecho})
+                yield evento({}, 'fim')
+            except Exception as e:
+                yield evento({'error': 'Erro ao gerar laudo radiológico'}, 'erro')
+
+        # Sob ASGI o Django consome iteradores assíncronos sem bloquear threads;
+        # sob WSGI é preciso um iterador síncrono
+        if isinstance(request._request, ASGIRequest):
+            conteudo = eventos_async()
+        else:
+            conteudo = eventos()
+
+        response = StreamingHttpResponse(conteudo, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Desativa o buffer de proxies (nginx) para os trechos chegarem imediatamente
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _segundo_plano(self, request):
+        return request.query_params.get('segundo_plano', '').lower() in ('true', '1')
+
+    def _resposta_tarefa(self, tarefa):
+        return Response(
+            {'tarefa_id': tarefa.id, 'status': tarefa.status},
+            status=status.HTTP_202_ACCEPTED
+        )
 
     @action(detail=False, methods=['post'])
     def gerar_laudo_radiologia(self, request):
         """
         Gera laudo radiológico usando IA baseada nas informações fornecidas
+        Com ?segundo_plano=true o laudo é gerado pela fila de tarefas: a resposta
+        (202) traz o tarefa_id, consultado em /api/tarefas/<id>/resultado/.
         """
         texto = request.data.get('texto', '').strip()
 
@@ -528,34 +884,13 @@ class IAViewSet(viewsets.ViewSet):
             )
 
         try:
-            # Prompt específico para laudos radiológicos conforme solicitado
-            prompt = f"""
-            Sou Radiologista e quero que vc me ajude a agilizar a minha confecção de laudos. Quando eu pedir para vc fazer um laudo, ele deve vim nesse formato:
-            Fonte de todo o texto: Arial 12
-            Se eu falar o nome do paciente, vc coloca antes de tudo Nome: e o nome que eu falar. Se eu não falar nada, não precisa colocar
-            Titulo em Negrito e Maiúsculo, centralizado
-            Depois vc escreve Indicação Clínica em negrito e maíusculo. Se nenhuma indicação for fornecida, vc coloca "Avaliação Clínica"
-            para colocar a técnica do exame, vc escreve TÉCNICA em negrito e maiúsculo, dois pontos e depois escreve a técnica do exame. em exames de ultrassonografia, descrever a técnica em modo B e apenas citar o uso ou não do estudo com doppler se for mencionado.
-            Depois coloca laudo: , em maiúsculo e negrito
-            No laudo deve ser colocada a descrição de todas as estruturas que a região estudada contém, e não apenas as alterações.
-            Depois o laudo, sem hífens ou bullets nos parágrafos. se for preciso, usar numeros para enumerar achados.
-            Depois vc escreve impressão diagnóstica: em negrito e maiúsculo e depois faz um resumo dos achados do laudo.
-            Cada achado deve ficar em uma linha separada e não é preciso repetir as medidas do achado na conclusão.
-            Na conclusão não é para colocar nenhuma medida
-
-            Considerações específicas para cada laudo:
-            1. Em laudos de ultrassonografia de mamas, as descrições dos nódulos devem seguir o léxico do birads. Deve-se colocar, abaixo da conclusão: BI-RADS: X (X é o birads do exame de acordo com os achados). Abaixo disso colocar as Recomendações de acordo com o BIRADS e com o documento do ACR BIRADS
-            2. não é para falar nada de próstata em ultrassonografia do aparelho urinário exceto se for dito o contrário
-            3. não falar de ligamentos cruzados e meniscos em ultrassonografia de joelho
-
-            Informações fornecidas pelo médico:
-            {texto}
-
-            Gere o laudo radiológico completo seguindo rigorosamente o formato especificado acima.
-            """
-
-            # Gera o laudo usando o serviço de IA
-            laudo_gerado = generate_radiology_report(prompt, service_name="openrouter")
+            if self._segundo_plano(request):
+                return self._resposta_tarefa(
+                    enfileirar('gerar_laudo_radiologia', request.user, texto=texto)
+                )
+
+            # Gera o laudo usando o serviço de IA (prompt 'laudo_radiologia' de api/prompts.py)
+            laudo_gerado = generate_radiology_report(texto, service_name="openrouter")
 
             if laudo_gerado and not laudo_gerado.startswith("Erro"):
                 return Response({
@@ -579,6 +914,7 @@ class IAViewSet(viewsets.ViewSet):
         """
         Corrige texto transcrito usando Groq
         Especializado em correção de transcrições de laudos médicos radiológicos
+        Aceita ?segundo_plano=true, como gerar_laudo_radiologia.
         """
         texto = request.data.get('texto', '').strip()
         deve_capitalizar = request.data.get('deve_capitalizar', False)
@@ -590,6 +926,14 @@ class IAViewSet(viewsets.ViewSet):
             )
 
         try:
+            if self._segundo_plano(request):
+                return self._resposta_tarefa(enfileirar(
+                    'corrigir_texto',
+                    request.user,
+                    texto=texto,
+                    deve_capitalizar=deve_capitalizar
+                ))
+
             groq_service = GroqService()
             texto_corrigido = groq_service.correct_text(texto, deve_capitalizar)
 
@@ -609,3 +953,104 @@ class IAViewSet(viewsets.ViewSet):
                 {'error': 'Erro interno do servidor ao corrigir texto'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @action(detail=False, methods=['post'])
+    def corrigir_textos_lote(self, request):
+        """
+        Corrige vários trechos de texto transcrito em uma única requisição.
+        Recebe {"segmentos": [{"texto": "...", "deve_capitalizar": false}, ...]}
+        (ou uma lista de strings) e retorna {"resultados": [...]} na mesma
+        ordem, cada um com 'texto_corrigido' ou 'error'.
+        """
+        segmentos = request.data.get('segmentos')
+
+        if not isinstance(segmentos, list) or not segmentos:
+            return Response(
+                {'error': 'Lista de segmentos é obrigatória'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(segmentos) > settings.AI_CORRECAO_LOTE_MAXIMO:
+            return Response(
+                {'error': f'Máximo de {settings.AI_CORRECAO_LOTE_MAXIMO} segmentos por requisição'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        normalizados = []
+        for segmento in segmentos:
+            if isinstance(segmento, str):
+                segmento = {'texto': segmento}
+            serializer = SegmentoCorrecaoSerializer(data=segmento)
+            if not serializer.is_valid():
+                # BooleanField converte "false"/0 para False e recusa o resto,
+                # em vez de bool("false") virar True
+                erro = (
+                    'deve_capitalizar precisa ser booleano'
+                    if 'deve_capitalizar' in serializer.errors
+                    else 'Todos os segmentos precisam de texto'
+                )
+                return Response({'error': erro}, status=status.HTTP_400_BAD_REQUEST)
+            normalizados.append((
+                serializer.validated_data['texto'],
+                serializer.validated_data['deve_capitalizar']
+            ))
+
+        try:
+            corrigidos = GroqService().correct_texts(normalizados)
+
+            if not any(corrigidos):
+                return Response(
+                    {'error': 'Erro ao corrigir texto'},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+
+            return Response({
+                'resultados': [
+                    {'texto_corrigido': texto} if texto else {'error': 'Erro ao corrigir texto'}
+                    for texto in corrigidos
+                ]
+            })
+
+        except Exception as e:
+            return Response(
+                {'error': 'Erro interno do servidor ao corrigir texto'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class TarefaViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Consulta das tarefas em segundo plano do usuário (status e progresso)
+    """
+    serializer_class = TarefaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        # Retorna apenas as tarefas do usuário logado
+        return Tarefa.objects.filter(usuario=self.request.user).order_by('-criado_em')
+
+    @action(detail=True, methods=['get'])
+    def resultado(self, request, pk=None):
+        """
+        Retorna o resultado da tarefa no mesmo formato do endpoint síncrono.
+        Enquanto a tarefa não termina, responde 202 com o status e o progresso.
+        """
+        tarefa = self.get_object()
+
+        if tarefa.status == 'concluida':
+            return Response(tarefa.resultado)
+
+        if tarefa.status == 'erro':
+            return Response(
+                {'error': tarefa.erro or 'Erro ao executar tarefa'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response(
+            {
+                'status': tarefa.status,
+                'progresso': tarefa.progresso,
+                'total': tarefa.total
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Servido por um servidor ASGI (ex.: uvicorn laudos_backend.asgi:application),
+o streaming de laudos (ia/gerar_laudo_radiologia_stream) usa o cliente HTTP
+assíncrono e não ocupa uma thread por requisição enquanto o modelo gera o texto.
+O mesmo vale para as views assíncronas em /api/ia/async/ (api/async_views.py).
 """
 
 import os
@@ -229,8 +229,25 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    # Limites dos endpoints de IA (api/throttling.py): capacidade/período,
+    # com reposição contínua; vale por usuário, por endpoint e por provedor
+    'DEFAULT_THROTTLE_RATES': {
+        'ia_usuario': get_env_var('THROTTLE_IA_USUARIO', '120/hour'),
+        'ia_endpoint': '30/min',
+        'ia_gerar_laudo_radiologia': get_env_var('THROTTLE_IA_LAUDO', '10/min'),
+        'ia_gerar_laudo_radiologia_stream': get_env_var('THROTTLE_IA_LAUDO', '10/min'),
+        'ia_corrigir_texto': get_env_var('THROTTLE_IA_CORRECAO', '60/min'),
+        'ia_corrigir_textos_lote': get_env_var('THROTTLE_IA_CORRECAO_LOTE', '20/min'),
+        'ia_provedor_openrouter': get_env_var('THROTTLE_IA_OPENROUTER', '60/min'),
+        'ia_provedor_groq': get_env_var('THROTTLE_IA_GROQ', '300/min'),
+    },
 }
 
+# Itens por página das listagens paginadas por cursor (api/pagination.py);
+# o cliente pode pedir outro tamanho com ?page_size=, até PAGINACAO_TAMANHO_MAXIMO
+PAGINACAO_TAMANHO = int(get_env_var('PAGINACAO_TAMANHO', '100'))
+PAGINACAO_TAMANHO_MAXIMO = int(get_env_var('PAGINACAO_TAMANHO_MAXIMO', '500'))
+
 # Configurações do JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -295,10 +312,11 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'x-requested-with',
+    'if-none-match',
 ]
 
 # Configurações adicionais para resolver problemas de CORS
-CORS_EXPOSE_HEADERS = ['content-type', 'x-csrftoken']
+CORS_EXPOSE_HEADERS = ['content-type', 'x-csrftoken', 'etag', 'last-modified']
 CORS_PREFLIGHT_MAX_AGE = 86400  # Cache preflight por 24 horas
 
 # Permitir redirects automáticos (necessário para custom actions do DRF)
@@ -320,6 +338,163 @@ ANTHROPIC_API_KEY = get_env_var('ANTHROPIC_API_KEY', '', secure=True)
 # Configuração do Groq
 GROQ_API_KEY = get_env_var('GROQ_API_KEY', '', secure=True)
 
+# Endereço alternativo da API de cada provedor (proxy compatível ou o provedor
+# simulado do teste de carga), ex.: AI_BASE_URL_OPENROUTER=http://127.0.0.1:8765
+AI_BASE_URLS = {}
+for _provedor in ('openai', 'openrouter', 'anthropic', 'groq'):
+    _base_url = get_env_var(f'AI_BASE_URL_{_provedor.upper()}', '')
+    if _base_url:
+        AI_BASE_URLS[_provedor] = _base_url
+
+# Conexões HTTP com os provedores de IA (pool compartilhado por processo)
+AI_HTTP_TIMEOUT_CONEXAO = float(get_env_var('AI_HTTP_TIMEOUT_CONEXAO', '5'))
+# Laudos longos podem levar minutos para serem gerados
+AI_HTTP_TIMEOUT_LEITURA = float(get_env_var('AI_HTTP_TIMEOUT_LEITURA', '180'))
+# max_simultaneas: chamadas ao mesmo tempo por processo; as demais esperam uma vaga
+AI_HTTP_LIMITES = {
+    'padrao': {'max_conexoes': 20, 'max_conexoes_ociosas': 10, 'tempo_ocioso': 60, 'max_simultaneas': 10},
+    'groq': {'max_conexoes': 40, 'max_conexoes_ociosas': 20, 'max_simultaneas': 20},
+}
+# Tempo máximo (segundos) esperando uma vaga antes de desistir da chamada
+AI_HTTP_ESPERA_VAGA = float(get_env_var('AI_HTTP_ESPERA_VAGA', '60'))
+
+# Novas tentativas para respostas transitórias (429, 5xx) e falhas de conexão:
+# espera exponencial com jitter (ou o Retry-After do provedor), limitada a
+# MAXIMO_TENTATIVAS envios e a PRAZO segundos no total
+AI_RETENTATIVAS = {
+    'MAXIMO_TENTATIVAS': int(get_env_var('AI_RETENTATIVAS_MAXIMO', '3')),
+    'ESPERA_BASE': float(get_env_var('AI_RETENTATIVAS_ESPERA_BASE', '0.5')),
+    'ESPERA_MAXIMA': float(get_env_var('AI_RETENTATIVAS_ESPERA_MAXIMA', '8')),
+    'PRAZO': float(get_env_var('AI_RETENTATIVAS_PRAZO', '240')),
+    'STATUS': [408, 409, 425, 429, 500, 502, 503, 504],
+}
+# Requisições idênticas simultâneas (ex.: duplo clique) compartilham uma única chamada
+AI_DEDUPLICAR_CHAMADAS = get_env_var('AI_DEDUPLICAR_CHAMADAS', 'True').lower() in ('true', '1', 'yes', 'on')
+
+# Correção de textos em lote (/api/ia/corrigir_textos_lote/)
+AI_CORRECAO_LOTE_MAXIMO = int(get_env_var('AI_CORRECAO_LOTE_MAXIMO', '50'))
+AI_CORRECAO_LOTE_THREADS = int(get_env_var('AI_CORRECAO_LOTE_THREADS', '8'))
+
+# Cache das respostas de IA
+# BACKEND: 'memoria' (LRU por processo), 'arquivo' (compartilhado entre processos
+# da mesma máquina) ou 'django' (usa CACHES[ALIAS], ex.: Redis)
+AI_CACHE = {
+    'BACKEND': get_env_var('AI_CACHE_BACKEND', 'memoria'),
+    'MAX_ENTRADAS': int(get_env_var('AI_CACHE_MAX_ENTRADAS', '1000')),
+    'DIRETORIO': get_env_var('AI_CACHE_DIRETORIO', str(BASE_DIR / 'ai_cache')),
+    'ALIAS': get_env_var('AI_CACHE_ALIAS', 'default'),
+    'TTL_PADRAO': 3600,
+    'TTL_POR_PROVEDOR': {
+        'openrouter': 3600,
+        'groq': 86400,
+    },
+    # Correções de texto (frases ditadas se repetem muito): limite e TTL próprios
+    'CORRECOES': {
+        'MAX_ENTRADAS': int(get_env_var('AI_CACHE_CORRECOES_MAX_ENTRADAS', '5000')),
+        'TTL_PADRAO': 7 * 86400,
+    },
+}
+
+# Versão de cada prompt de api/prompts.py (padrão: a mais recente), ex.: {'laudo_radiologia': 1}
+AI_PROMPTS_VERSOES = {}
+
+# Roteamento entre provedores de IA (fallback, hedge e disjuntores)
+AI_ROTEAMENTO = {
+    # Provedores tentados depois do solicitado, nesta ordem (apenas os com chave configurada)
+    'ORDEM': [
+        provedor.strip()
+        for provedor in get_env_var('AI_ROTEAMENTO_ORDEM', 'openrouter,anthropic,openai,groq').split(',')
+        if provedor.strip()
+    ],
+    # Dispara o próximo provedor em paralelo se o atual passar do percentil de latência
+    'HEDGE': get_env_var('AI_ROTEAMENTO_HEDGE', 'True').lower() in ('true', '1', 'yes', 'on'),
+    'HEDGE_PERCENTIL': 95,
+    'HEDGE_MINIMO_AMOSTRAS': 20,
+    # Segundos; o padrão vale enquanto não há amostras suficientes
+    'HEDGE_ATRASO_MINIMO': 2,
+    'HEDGE_ATRASO_PADRAO': 30,
+    'HEDGE_MAXIMO': 2,
+    # Gerações com orçamento de saída (max_tokens) maior que isso não usam
+    # hedge: a chamada perdedora continuaria gastando tokens até o fim
+    'HEDGE_MAXIMO_TOKENS': 4096,
+    # Modelo de cada provedor nas gerações roteadas e o máximo de tokens de
+    # saída que ele aceita. Todos recebem o max_tokens do prompt (api/prompts.py,
+    # 4096 no laudo) ou, sem ele, o do provedor solicitado; os que não o
+    # comportam não entram no fallback nem no hedge
+    'MODELOS': {
+        'openrouter': {'modelo': 'anthropic/claude-sonnet-4', 'max_tokens': 64000},
+        'anthropic': {'modelo': 'claude-3-haiku-20240307', 'max_tokens': 4096},
+        'openai': {'modelo': 'gpt-3.5-turbo', 'max_tokens': 4096},
+        'groq': {'modelo': 'openai/gpt-oss-120b', 'max_tokens': 65536},
+    },
+    'THREADS': 16,
+    'DISJUNTOR': {
+        'limite_falhas': 5,
+        'taxa_erro_maxima': 0.5,
+        'minimo_chamadas': 10,
+        'tempo_aberto': 30,
+    },
+}
+
+# Fila de tarefas em segundo plano (python manage.py processar_tarefas)
+TAREFAS_THREADS = int(get_env_var('TAREFAS_THREADS', '8'))
+# Tarefas simultâneas por provedor em cada worker ('padrao' para as demais)
+TAREFAS_CONCORRENCIA = {
+    'padrao': 2,
+    'openrouter': int(get_env_var('TAREFAS_CONCORRENCIA_OPENROUTER', '4')),
+    'groq': int(get_env_var('TAREFAS_CONCORRENCIA_GROQ', '8')),
+}
+# Tarefas "executando" sem atualização há mais tempo que isso voltam para a fila
+TAREFAS_TEMPO_MAXIMO = int(get_env_var('TAREFAS_TEMPO_MAXIMO', '1800'))
+
+# =============================================================================
+# CONFIGURAÇÕES DE CACHE
+# =============================================================================
+
+# O LocMemCache padrão é por processo: com mais de um worker (gunicorn,
+# PythonAnywhere) configure um backend compartilhado (Redis, Memcached ou
+# banco de dados) para que a invalidação do cache valha para todos os workers.
+CACHES = {
+    'default': {
+        'BACKEND': get_env_var('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': get_env_var('CACHE_LOCATION', ''),
+    }
+}
+
+# Tempo de vida das listas de categorias/títulos de frases em cache
+CACHE_TAXONOMIA_SEGUNDOS = int(get_env_var('CACHE_TAXONOMIA_SEGUNDOS', '300'))
+
+# =============================================================================
+# CONFIGURAÇÕES DE LOG
+# =============================================================================
+
+# Logger 'api.ia': uma linha JSON por chamada aos provedores de IA e por acerto
+# de cache (provedor, modelo, status, duração, tempo até o primeiro byte, tokens).
+# Use AI_LOG_NIVEL=WARNING para desligar.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'ia': {
+            'format': '{asctime} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console_ia': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'ia',
+        },
+    },
+    'loggers': {
+        'api.ia': {
+            'handlers': ['console_ia'],
+            'level': get_env_var('AI_LOG_NIVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # =============================================================================
 # CONFIGURAÇÕES ADICIONAIS DE SEGURANÇA
 # =============================================================================
@@ -327,6 +502,13 @@ GROQ_API_KEY = get_env_var('GROQ_API_KEY', '', secure=True)
 # Configuração do modelo de usuário personalizado
 AUTH_USER_MODEL = 'api.CustomUser'
 
+# Biblioteca inicial (modelos, frases e variáveis) oferecida aos usuários: a do
+# usuário com este e-mail; vazio desativa
+USUARIO_SEMENTE_EMAIL = get_env_var('USUARIO_SEMENTE_EMAIL', '')
+# 'compartilhada': todos enxergam a biblioteca do usuário semente e só o que
+# for editado é copiado para o usuário; 'copia': cópia completa no cadastro
+BIBLIOTECA_INICIAL_MODO = get_env_var('BIBLIOTECA_INICIAL_MODO', 'compartilhada')
+
 # Configurações de segurança para sessões e cookies
 SESSION_COOKIE_HTTPONLY = True
 CSRF_COOKIE_HTTPONLY = True
@@ -337,10 +519,10 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 #     'rest_framework.throttling.AnonRateThrottle',
 #     'rest_framework.throttling.UserRateThrottle'
 # ]
-# REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {
+# REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].update({
 #     'anon': '100/hour',
 #     'user': '1000/hour'
-# }
+# })
 
 # =============================================================================
 # VALIDAÇÃO FINAL DE SEGURANÇA